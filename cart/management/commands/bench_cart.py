@@ -0,0 +1,111 @@
+import json
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+
+from cart import storage
+from cart.models import CartItem
+from common.bench import BenchCommand, summarize
+from goods.models import Goods, GoodsGroup
+from users.models import User
+
+
+def naive_add(user_id, goods_id, number):
+    """对照组：每次点击直接修改数据库"""
+    if not CartItem.objects.filter(user_id=user_id, goods_id=goods_id).update(number=F('number') + number):
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(user_id=user_id, goods_id=goods_id, number=number)
+        except IntegrityError:
+            CartItem.objects.filter(user_id=user_id, goods_id=goods_id).update(number=F('number') + number)
+
+
+def naive_set(user_id, goods_id, number):
+    CartItem.objects.update_or_create(user_id=user_id, goods_id=goods_id, defaults={'number': number})
+
+
+def naive_remove(user_id, goods_id):
+    CartItem.objects.filter(user_id=user_id, goods_id=goods_id).delete()
+
+
+class Command(BenchCommand):
+    help = '对比缓存+批量写入的购物车和每次请求直接写数据库的吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--goods', type=int, default=50)
+        parser.add_argument('--ops', type=int, default=5000)
+        parser.add_argument('--threads', type=int, default=4)
+
+    def handle(self, *args, **options):
+        user_ids, goods_ids = self.seed(options['users'], options['goods'])
+        rnd = random.Random(0)
+        ops = []
+        for _ in range(options['ops']):
+            kind = rnd.random()
+            args = (rnd.choice(user_ids), rnd.choice(goods_ids))
+            if kind < 0.8:
+                ops.append(('add', args + (1,)))
+            elif kind < 0.95:
+                ops.append(('set', args + (rnd.randint(1, 10),)))
+            else:
+                ops.append(('remove', args))
+
+        result = {'ops': len(ops), 'threads': options['threads']}
+        functions = {
+            'write_behind': {'add': storage.add_item, 'set': storage.set_item, 'remove': storage.remove_item},
+            'naive': {'add': naive_add, 'set': naive_set, 'remove': naive_remove},
+        }
+        # 单进程的测试中进程内缓存也可以作为主副本
+        storage.CART_SETTINGS['WRITE_BEHIND'] = True
+        for name, funcs in functions.items():
+            CartItem.objects.filter(user_id__in=user_ids).delete()
+            cache.clear()
+            start = time.perf_counter()
+            samples = self.run(ops, funcs, options['threads'])
+            elapsed = time.perf_counter() - start
+            result[name] = dict(summarize(samples), ops_per_second=round(len(ops) / elapsed, 1))
+            if name == 'write_behind':
+                # 剩余的修改写入数据库的耗时
+                start = time.perf_counter()
+                storage.flusher.flush()
+                result[name]['final_flush_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        self.stdout.write(json.dumps(result, indent=2))
+
+    def run(self, ops, funcs, threads):
+        samples = []
+        chunks = [ops[i::threads] for i in range(threads)]
+
+        def worker(chunk):
+            local = []
+            for kind, args in chunk:
+                start = time.perf_counter()
+                funcs[kind](*args)
+                local.append(time.perf_counter() - start)
+            samples.extend(local)
+            close_old_connections()
+
+        workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return samples
+
+    def seed(self, users, goods):
+        for i in range(User.objects.filter(username__startswith='cart_bench_').count(), users):
+            User.objects.create(username='cart_bench_%d' % i)
+        group = GoodsGroup.objects.first() or GoodsGroup.objects.create(name='购物车测试')
+        existing = Goods.objects.filter(is_on=True).count()
+        Goods.objects.bulk_create([
+            Goods(group=group, title='购物车测试商品%d' % i, price=Decimal('9.90'), stock=1000, is_on=True)
+            for i in range(existing, goods)
+        ])
+        user_ids = list(User.objects.filter(username__startswith='cart_bench_').values_list('id', flat=True)[:users])
+        goods_ids = list(Goods.objects.filter(is_on=True).values_list('id', flat=True)[:goods])
+        return user_ids, goods_ids
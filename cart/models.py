@@ -1,3 +1,18 @@
 from django.db import models
+from common.db import BaseModel
+
 
 # Create your models here.
+class CartItem(BaseModel):
+    """购物车商品模型，使用共享缓存时购物车的数据以缓存为准，由后台线程批量写入该表"""
+    user = models.ForeignKey('users.User', verbose_name='所属用户', on_delete=models.CASCADE)
+    goods = models.ForeignKey('goods.Goods', verbose_name='商品', on_delete=models.CASCADE)
+    number = models.IntegerField(verbose_name='商品数量', default=1)
+
+    class Meta:
+        db_table = 'cart'
+        verbose_name = '购物车表'
+        constraints = [
+            # 每个用户的每个商品只有一行，批量写入时按(user, goods)冲突更新
+            models.UniqueConstraint(fields=['user', 'goods'], name='uniq_cart_user_goods'),
+        ]
@@ -0,0 +1,86 @@
+"""
+购物车的价格计算：一次取出购物车中的所有商品，再在一次遍历中计算每件商品的金额、库存提示、满减优惠和总价。
+商品优先从商品详情的缓存中读取，缓存中没有的商品用一条in_bulk查询获取，查询次数和购物车的商品数无关
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+
+from goods.cache import detail_cache_key
+from goods.models import Goods
+
+CENT = Decimal('0.01')
+
+# 满减活动：订单金额满threshold元减discount元，同时满足多个时使用优惠最多的一个
+PROMOTIONS = [
+    {'name': rule['name'], 'threshold': Decimal(rule['threshold']), 'discount': Decimal(rule['discount'])}
+    for rule in getattr(settings, 'CART_PROMOTIONS', [])
+]
+
+
+def money(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def fetch_goods(goods_ids, use_cache=True):
+    """
+    获取商品的标题、价格、库存和上架状态：{商品id: dict}。
+    缓存中的库存可能比数据库稍旧，只用于展示购物车；下单时use_cache=False，从数据库读取
+    """
+    goods = {}
+    if use_cache:
+        keys = {detail_cache_key(goods_id): goods_id for goods_id in goods_ids}
+        goods = {keys[key]: data for key, data in cache.get_many(keys).items()}
+    missing = [goods_id for goods_id in goods_ids if goods_id not in goods]
+    if missing:
+        rows = Goods.objects.only('id', 'title', 'price', 'cover', 'stock', 'is_on')
+        for goods_id, obj in rows.in_bulk(missing).items():
+            goods[goods_id] = {'id': obj.id, 'title': obj.title, 'price': obj.price,
+                               'cover': obj.cover.url if obj.cover else None, 'stock': obj.stock, 'is_on': obj.is_on}
+    return goods
+
+
+def choose_promotion(amount):
+    best = None
+    for rule in PROMOTIONS:
+        if amount >= rule['threshold'] and (best is None or rule['discount'] > best['discount']):
+            best = rule
+    return best
+
+
+def price_cart(items, use_cache=True):
+    """
+    计算购物车的价格，items为{商品id: 数量}。
+    已下架、已删除或库存不足的商品带有warning，不计入总价
+    """
+    goods = fetch_goods(list(items), use_cache)
+    lines = []
+    total_number, total_amount = 0, Decimal('0')
+    for goods_id, number in items.items():
+        data = goods.get(goods_id)
+        if data is None or not data['is_on']:
+            lines.append({'goods': goods_id, 'number': number, 'warning': '商品已下架'})
+            continue
+        price = Decimal(str(data['price']))
+        amount = money(price * number)
+        warning = None
+        if data['stock'] < number:
+            warning = '库存不足，仅剩%d件' % data['stock'] if data['stock'] > 0 else '商品已售罄'
+        else:
+            total_number += number
+            total_amount += amount
+        # 金额和商品序列化器中的price一样以字符串返回，避免JSON中的浮点数误差
+        lines.append({'goods': goods_id, 'title': data['title'], 'cover': data['cover'], 'price': str(money(price)),
+                      'number': number, 'amount': str(amount), 'stock': data['stock'], 'warning': warning})
+
+    promotion = choose_promotion(total_amount)
+    discount = min(promotion['discount'], total_amount) if promotion else Decimal('0')
+    return {
+        'items': lines,
+        'total_number': total_number,
+        'total_amount': str(money(total_amount)),
+        'promotion': promotion['name'] if promotion else None,
+        'discount': str(money(discount)),
+        'pay_amount': str(money(total_amount - discount)),
+    }
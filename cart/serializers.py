@@ -0,0 +1,9 @@
+from rest_framework import serializers
+
+from cart.storage import CART_SETTINGS
+
+
+class CartItemSerializer(serializers.Serializer):
+    """加入购物车、修改数量的参数校验"""
+    goods = serializers.IntegerField(min_value=1)
+    number = serializers.IntegerField(min_value=1, max_value=CART_SETTINGS['MAX_NUMBER'], default=1)
@@ -0,0 +1,354 @@
+"""
+购物车的存储，有两种方式：
+一、缓存为主副本（write-behind），需要多个进程共享的缓存（如Redis，淘汰策略为noeviction），数据库只作为持久化：
+1. 每个商品一个缓存key（cart:<用户id>:<商品id> -> 数量），修改数量使用cache.incr原子递增；
+2. cart:<用户id> 保存购物车中的商品id列表，新增、删除商品时在cache.add实现的锁中修改；
+3. 每次修改后cart:<用户id>:seq加一，后台线程定时将有修改的购物车批量写入数据库，
+   并记录已写入的序号cart:<用户id>:flushed。进程崩溃时未写入的修改仍在缓存中，
+   任何进程读取该购物车时发现seq大于flushed都会重新写入；
+4. 缓存中没有购物车时（过期、被淘汰）从数据库重新加载。
+二、数据库为主副本：缓存只在当前进程中有效（LocMemCache）时，每个worker进程的缓存中会有各自的购物车，
+   锁也不能跨进程，因此每次修改直接写入数据库，读取购物车时查询数据库。
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, connections, router, transaction
+from django.db.models import Q
+
+from cart.models import CartItem
+from common.cache import is_process_local
+from goods.models import Goods
+
+logger = logging.getLogger(__name__)
+
+CART_SETTINGS = {
+    # 购物车在缓存中保存的时间（秒），每次修改后重新计算
+    'TIMEOUT': 7 * 24 * 3600,
+    # 后台线程写入数据库的间隔（秒）
+    'FLUSH_INTERVAL': 1.0,
+    # 每次批量写入的购物车数量
+    'FLUSH_BATCH_SIZE': 500,
+    # 单个商品的最大数量和购物车中最多的商品种类
+    'MAX_NUMBER': 999,
+    'MAX_ITEMS': 100,
+    # 是否以缓存为主副本：None为只在缓存被多个进程共享时使用；进程内缓存只能在单进程（开发、测试）时设置为True
+    'WRITE_BEHIND': None,
+    **getattr(settings, 'CART', {}),
+}
+
+
+class CartError(Exception):
+    pass
+
+
+def index_key(user_id):
+    return 'cart:%s' % user_id
+
+
+def item_key(user_id, goods_id):
+    return 'cart:%s:%s' % (user_id, goods_id)
+
+
+def seq_key(user_id):
+    return 'cart:%s:seq' % user_id
+
+
+def flushed_key(user_id):
+    return 'cart:%s:flushed' % user_id
+
+
+def write_behind():
+    """购物车是否以缓存为主副本"""
+    enabled = CART_SETTINGS['WRITE_BEHIND']
+    return not is_process_local() if enabled is None else enabled
+
+
+class CartLock:
+    """基于cache.add的跨进程锁，超时后自动释放，防止持有锁的进程崩溃后死锁"""
+
+    def __init__(self, user_id, timeout=5, wait=3):
+        self.key = 'cart:%s:lock' % user_id
+        self.timeout = timeout
+        self.wait = wait
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.wait
+        while not cache.add(self.key, 1, self.timeout):
+            if time.monotonic() > deadline:
+                raise CartError('购物车正在被修改，请稍后再试')
+            time.sleep(0.005)
+
+    def __exit__(self, *exc):
+        cache.delete(self.key)
+
+
+def load_locked(user_id):
+    """持有锁时调用：缓存中没有购物车时从数据库加载，返回商品id列表"""
+    # 等待锁的过程中可能已经被其他请求加载
+    goods_ids = cache.get(index_key(user_id))
+    if goods_ids is not None:
+        return goods_ids
+    rows = dict(CartItem.objects.filter(user_id=user_id).values_list('goods_id', 'number'))
+    timeout = CART_SETTINGS['TIMEOUT']
+    cache.set_many({item_key(user_id, goods_id): number for goods_id, number in rows.items()}, timeout)
+    cache.set(index_key(user_id), sorted(rows), timeout)
+    return sorted(rows)
+
+
+def load(user_id):
+    """从数据库加载购物车到缓存"""
+    with CartLock(user_id):
+        return load_locked(user_id)
+
+
+def read(user_id):
+    """读取缓存中的购物车，返回{商品id: 数量}，包含数量为0（已删除、还未写入数据库）的商品"""
+    goods_ids = cache.get(index_key(user_id))
+    if goods_ids is None:
+        goods_ids = load(user_id)
+    keys = {item_key(user_id, goods_id): goods_id for goods_id in goods_ids}
+    values = cache.get_many(keys)
+    if len(values) < len(keys):
+        # 部分商品的key被淘汰，购物车已经不完整，以数据库为准重新加载
+        cache.delete(index_key(user_id))
+        return read(user_id)
+    return {keys[key]: number for key, number in values.items()}
+
+
+def get_cart(user_id):
+    """获取用户的购物车：{商品id: 数量}"""
+    if not write_behind():
+        return db_get_cart(user_id)
+    items = read(user_id)
+    # 其他进程修改后还未写入数据库就退出了，由当前进程重新写入
+    if cache.get(seq_key(user_id), 0) > cache.get(flushed_key(user_id), 0):
+        flusher.mark(user_id)
+    return {goods_id: number for goods_id, number in items.items() if number > 0}
+
+
+def touch(user_id, goods_id):
+    """记录一次修改：延长缓存时间并加入待写入数据库的队列"""
+    timeout = CART_SETTINGS['TIMEOUT']
+    cache.touch(index_key(user_id), timeout)
+    cache.touch(item_key(user_id, goods_id), timeout)
+    try:
+        cache.incr(seq_key(user_id))
+    except ValueError:
+        cache.add(seq_key(user_id), 1, timeout)
+        cache.incr(seq_key(user_id))
+    flusher.mark(user_id)
+
+
+def ensure_item(user_id, goods_id):
+    """商品不在购物车中时，校验商品后加入商品id列表"""
+    goods_ids = cache.get(index_key(user_id))
+    if goods_ids is None:
+        goods_ids = load(user_id)
+    if goods_id in goods_ids:
+        return
+    if not Goods.objects.filter(pk=goods_id, is_on=True).exists():
+        raise CartError('商品不存在或已下架')
+    with CartLock(user_id):
+        goods_ids = load_locked(user_id)
+        if goods_id in goods_ids:
+            return
+        if len(goods_ids) >= CART_SETTINGS['MAX_ITEMS']:
+            raise CartError('购物车中最多只能添加%d种商品' % CART_SETTINGS['MAX_ITEMS'])
+        timeout = CART_SETTINGS['TIMEOUT']
+        cache.set(item_key(user_id, goods_id), 0, timeout)
+        cache.set(index_key(user_id), sorted(goods_ids + [goods_id]), timeout)
+
+
+def restore_item(user_id, goods_id, number=0):
+    """
+    数量为0的商品可能在修改的同时被写入线程从列表中移除（见WriteBehindFlusher.compact），
+    在锁中确认商品仍在列表中，已被移除时以number重新加入
+    """
+    with CartLock(user_id):
+        timeout = CART_SETTINGS['TIMEOUT']
+        goods_ids = load_locked(user_id)
+        cache.add(item_key(user_id, goods_id), number, timeout)
+        if goods_id not in goods_ids:
+            cache.set(index_key(user_id), sorted(goods_ids + [goods_id]), timeout)
+
+
+def add_item(user_id, goods_id, number=1):
+    """将商品加入购物车，已存在时数量累加，返回修改后的数量"""
+    if not write_behind():
+        return db_change_item(user_id, goods_id, number, add=True)
+    ensure_item(user_id, goods_id)
+    try:
+        total = cache.incr(item_key(user_id, goods_id), number)
+    except ValueError:
+        # 加入商品id列表后key又被删除，重新加入后再试一次
+        restore_item(user_id, goods_id)
+        total = cache.incr(item_key(user_id, goods_id), number)
+    if total > CART_SETTINGS['MAX_NUMBER']:
+        cache.decr(item_key(user_id, goods_id), number)
+        raise CartError('单个商品最多只能添加%d件' % CART_SETTINGS['MAX_NUMBER'])
+    if total == number:
+        restore_item(user_id, goods_id, number)
+    touch(user_id, goods_id)
+    return total
+
+
+def set_item(user_id, goods_id, number):
+    """修改购物车中商品的数量"""
+    if number > CART_SETTINGS['MAX_NUMBER']:
+        raise CartError('单个商品最多只能添加%d件' % CART_SETTINGS['MAX_NUMBER'])
+    if not write_behind():
+        return db_change_item(user_id, goods_id, number, add=False)
+    ensure_item(user_id, goods_id)
+    cache.set(item_key(user_id, goods_id), number, CART_SETTINGS['TIMEOUT'])
+    restore_item(user_id, goods_id, number)
+    touch(user_id, goods_id)
+    return number
+
+
+def remove_item(user_id, goods_id):
+    """从购物车中删除商品：数量设置为0，写入数据库时删除该行并从商品id列表中移除"""
+    if not write_behind():
+        return CartItem.all_objects.filter(user_id=user_id, goods_id=goods_id).delete()[0] > 0
+    if not read(user_id).get(goods_id):
+        return False
+    cache.set(item_key(user_id, goods_id), 0, CART_SETTINGS['TIMEOUT'])
+    touch(user_id, goods_id)
+    return True
+
+
+def db_get_cart(user_id):
+    return dict(CartItem.objects.filter(user_id=user_id, number__gt=0).order_by('goods_id')
+                .values_list('goods_id', 'number'))
+
+
+def db_change_item(user_id, goods_id, number, add):
+    """数据库为主副本时修改商品的数量：锁住该行后累加或设置数量，返回修改后的数量"""
+    with transaction.atomic():
+        item = CartItem.all_objects.select_for_update().filter(user_id=user_id, goods_id=goods_id).first()
+        if item is None:
+            if not Goods.objects.filter(pk=goods_id, is_on=True).exists():
+                raise CartError('商品不存在或已下架')
+            if number > CART_SETTINGS['MAX_NUMBER']:
+                raise CartError('单个商品最多只能添加%d件' % CART_SETTINGS['MAX_NUMBER'])
+            if CartItem.objects.filter(user_id=user_id).count() >= CART_SETTINGS['MAX_ITEMS']:
+                raise CartError('购物车中最多只能添加%d种商品' % CART_SETTINGS['MAX_ITEMS'])
+            try:
+                with transaction.atomic():
+                    CartItem.objects.create(user_id=user_id, goods_id=goods_id, number=number)
+                return number
+            except IntegrityError:
+                # 同一个商品被并发加入，改为修改另一个请求创建的行
+                item = CartItem.all_objects.select_for_update().get(user_id=user_id, goods_id=goods_id)
+        # 已软删除的行视为数量为0
+        total = (0 if item.is_delete else item.number) + number if add else number
+        if total > CART_SETTINGS['MAX_NUMBER']:
+            raise CartError('单个商品最多只能添加%d件' % CART_SETTINGS['MAX_NUMBER'])
+        item.number, item.is_delete = total, False
+        item.save(update_fields=['number', 'is_delete', 'updated_time'])
+    return total
+
+
+class WriteBehindFlusher:
+    """将有修改的购物车批量写入数据库的后台线程，进程退出时写入剩余的修改"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dirty = set()
+        self.thread = None
+        self.pid = None
+        self.wakeup = threading.Event()
+
+    def mark(self, user_id):
+        with self.lock:
+            self.dirty.add(user_id)
+            # fork出的子进程中没有父进程的线程，需要重新启动
+            if self.pid != os.getpid():
+                if is_process_local():
+                    logger.warning('购物车使用进程内缓存作为主副本，多个进程的购物车互不可见，只能用于单进程')
+                self.pid = os.getpid()
+                self.dirty &= {user_id}
+                self.thread = threading.Thread(target=self.run, name='cart-flusher', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(CART_SETTINGS['FLUSH_INTERVAL'])
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('购物车写入数据库失败')
+            finally:
+                # 后台线程不经过请求的生命周期，需要自己关闭失效的数据库连接
+                close_old_connections()
+
+    def flush(self):
+        """写入所有有修改的购物车，返回写入的购物车数量"""
+        with self.lock:
+            users, self.dirty = self.dirty, set()
+        users = sorted(users)
+        size = CART_SETTINGS['FLUSH_BATCH_SIZE']
+        for start in range(0, len(users), size):
+            batch = users[start:start + size]
+            try:
+                self.flush_batch(batch)
+            except Exception:
+                # 写入失败的购物车放回队列，下次重试
+                with self.lock:
+                    self.dirty.update(users[start:])
+                raise
+        return len(users)
+
+    def flush_batch(self, users):
+        # 先记录序号再读取购物车，读取之后的修改会使序号增大，下次继续写入
+        seqs = cache.get_many([seq_key(user_id) for user_id in users])
+        upserts, removed, flushed = [], {}, {}
+        for user_id in users:
+            goods_ids = cache.get(index_key(user_id))
+            if goods_ids is None:
+                # 购物车已不在缓存中，数据库中的数据就是最新的
+                continue
+            for goods_id, number in read(user_id).items():
+                if number > 0:
+                    upserts.append(CartItem(user_id=user_id, goods_id=goods_id, number=number))
+                else:
+                    removed.setdefault(user_id, []).append(goods_id)
+            flushed[flushed_key(user_id)] = seqs.get(seq_key(user_id), 0)
+
+        options = {'update_conflicts': True, 'update_fields': ['number', 'is_delete', 'updated_time']}
+        # MySQL的ON DUPLICATE KEY UPDATE不能指定冲突的列，由唯一约束uniq_cart_user_goods触发更新
+        if connections[router.db_for_write(CartItem)].features.supports_update_conflicts_with_target:
+            options['unique_fields'] = ['user', 'goods']
+        with transaction.atomic():
+            if upserts:
+                CartItem.objects.bulk_create(upserts, **options)
+            if removed:
+                condition = Q()
+                for user_id, goods_ids in removed.items():
+                    condition |= Q(user_id=user_id, goods_id__in=goods_ids)
+                CartItem.all_objects.filter(condition).delete()
+        cache.set_many(flushed, CART_SETTINGS['TIMEOUT'])
+        for user_id, goods_ids in removed.items():
+            self.compact(user_id, goods_ids)
+
+    def compact(self, user_id, goods_ids):
+        """从商品id列表中移除已经从数据库删除、且没有被重新加入的商品"""
+        with CartLock(user_id):
+            keys = [item_key(user_id, goods_id) for goods_id in goods_ids]
+            values = cache.get_many(keys)
+            empty = {goods_id for goods_id, key in zip(goods_ids, keys) if values.get(key) == 0}
+            current = cache.get(index_key(user_id))
+            if current is not None and empty:
+                cache.set(index_key(user_id), [goods_id for goods_id in current if goods_id not in empty],
+                          CART_SETTINGS['TIMEOUT'])
+                cache.delete_many([item_key(user_id, goods_id) for goods_id in empty])
+
+
+flusher = WriteBehindFlusher()
+atexit.register(flusher.flush)
@@ -1,3 +1,229 @@
-from django.test import TestCase
+import random
+import threading
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from cart import storage
+from cart.models import CartItem
+from cart.pricing import price_cart
+from goods.models import Goods, GoodsGroup
+from users.models import User
+
+
+def create_goods(count, stock=1000):
+    group = GoodsGroup.objects.create(name='购物车测试')
+    return Goods.objects.bulk_create([
+        Goods(group=group, title='购物车测试商品%d' % i, price=Decimal('9.90'), stock=stock, is_on=True)
+        for i in range(count)
+    ])
+
+
+def db_state(user_ids):
+    state = {user_id: {} for user_id in user_ids}
+    for user_id, goods_id, number in CartItem.objects.filter(user_id__in=user_ids).values_list(
+            'user_id', 'goods_id', 'number'):
+        state[user_id][goods_id] = number
+    return state
+
+
+class WriteBehindMixin:
+    """以缓存为主副本测试（测试在单进程中运行），后台线程不自动写入，只使用手动的flush"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(storage.CART_SETTINGS, WRITE_BEHIND=True, FLUSH_INTERVAL=3600)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 测试在单进程中运行，进程内缓存相当于共享的缓存，不输出只能用于单进程的警告
+        patcher = mock.patch.object(storage, 'is_process_local', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(storage.flusher.dirty.clear)
+        self.addCleanup(cache.clear)
+        cache.clear()
+
+
+class CrashConsistencyTests(WriteBehindMixin, TestCase):
+    """模拟进程在写入数据库前后退出和缓存丢失，缓存和数据库中的购物车都要和执行的操作一致"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_ids = [User.objects.create(username='cart_%d' % i).id for i in range(10)]
+        cls.goods_ids = [goods.id for goods in create_goods(30)]
+
+    def apply_ops(self, count, expected=None, seed=0):
+        rnd = random.Random(seed)
+        expected = {user_id: dict((expected or {}).get(user_id, {})) for user_id in self.user_ids}
+        for _ in range(count):
+            user_id, goods_id = rnd.choice(self.user_ids), rnd.choice(self.goods_ids)
+            cart = expected[user_id]
+            kind = rnd.random()
+            if kind < 0.6:
+                storage.add_item(user_id, goods_id, 1)
+                cart[goods_id] = cart.get(goods_id, 0) + 1
+            elif kind < 0.8:
+                number = rnd.randint(1, 5)
+                storage.set_item(user_id, goods_id, number)
+                cart[goods_id] = number
+            else:
+                storage.remove_item(user_id, goods_id)
+                cart.pop(goods_id, None)
+        return expected
+
+    def cache_state(self):
+        return {user_id: storage.get_cart(user_id) for user_id in self.user_ids}
+
+    def test_crash_before_flush(self):
+        expected = self.apply_ops(500)
+        # 进程退出，内存中的待写入队列丢失，缓存中的数据仍然完整
+        storage.flusher.dirty.clear()
+        self.assertEqual(self.cache_state(), expected)
+        # 读取购物车时发现序号未写入，重新加入写入队列
+        self.assertEqual(storage.flusher.dirty, {user_id for user_id in self.user_ids if expected[user_id]})
+        storage.flusher.flush()
+        self.assertEqual(db_state(self.user_ids), expected)
+
+    def test_crash_before_recording_flushed_seq(self):
+        expected = self.apply_ops(500)
+        storage.flusher.flush()
+        expected = self.apply_ops(250, expected, seed=1)
+        storage.flusher.flush()
+        # 写入数据库之后、记录已写入的序号之前退出，重复写入的结果相同
+        cache.delete_many([storage.flushed_key(user_id) for user_id in self.user_ids])
+        self.cache_state()
+        storage.flusher.flush()
+        self.assertEqual(db_state(self.user_ids), expected)
+
+    def test_reload_after_cache_loss(self):
+        expected = self.apply_ops(500)
+        storage.flusher.flush()
+        cache.clear()
+        self.assertEqual(self.cache_state(), expected)
+
+    def test_removed_items_are_compacted(self):
+        user_id, goods_id = self.user_ids[0], self.goods_ids[0]
+        storage.add_item(user_id, goods_id, 2)
+        storage.flusher.flush()
+        self.assertTrue(storage.remove_item(user_id, goods_id))
+        storage.flusher.flush()
+        self.assertFalse(CartItem.all_objects.filter(user_id=user_id, goods_id=goods_id).exists())
+        self.assertNotIn(goods_id, cache.get(storage.index_key(user_id)))
+
+
+class ConcurrentAddTests(WriteBehindMixin, TransactionTestCase):
+
+    def test_concurrent_incr_keeps_every_change(self):
+        user_id = User.objects.create(username='cart_concurrent').id
+        goods_id = create_goods(1)[0].id
+        storage.set_item(user_id, goods_id, 1)
+
+        def worker():
+            try:
+                for _ in range(100):
+                    storage.add_item(user_id, goods_id, 1)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        storage.flusher.flush()
+        self.assertEqual(storage.get_cart(user_id), {goods_id: 801})
+        self.assertEqual(CartItem.objects.get(user_id=user_id, goods_id=goods_id).number, 801)
+
+
+class FlusherWarningTests(SimpleTestCase):
+    """进程内缓存作为主副本时，每个进程启动后台线程时警告一次"""
+
+    def mark(self, process_local):
+        flusher = storage.WriteBehindFlusher()
+        # 不启动真正的后台线程
+        flusher.run = lambda: None
+        with mock.patch.object(storage, 'is_process_local', return_value=process_local):
+            flusher.mark(1)
+            flusher.mark(2)
+        flusher.thread.join()
+
+    def test_process_local_cache(self):
+        with self.assertLogs('cart.storage', 'WARNING') as logs:
+            self.mark(True)
+        self.assertEqual([record.getMessage() for record in logs.records],
+                         ['购物车使用进程内缓存作为主副本，多个进程的购物车互不可见，只能用于单进程'])
+
+    def test_shared_cache(self):
+        with self.assertNoLogs('cart.storage', 'WARNING'):
+            self.mark(False)
+
+
+class DatabaseCartTests(TestCase):
+    """进程内缓存时购物车直接读写数据库，不使用后台写入"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='cart_db')
+        cls.goods = create_goods(3)
+
+    def test_process_local_cache_uses_database(self):
+        self.assertFalse(storage.write_behind())
+        first, second = self.goods[0].id, self.goods[1].id
+        self.assertEqual(storage.add_item(self.user.id, first, 2), 2)
+        self.assertEqual(storage.add_item(self.user.id, first, 3), 5)
+        self.assertEqual(storage.set_item(self.user.id, second, 7), 7)
+        self.assertEqual(db_state([self.user.id]), {self.user.id: {first: 5, second: 7}})
+        self.assertTrue(storage.remove_item(self.user.id, first))
+        self.assertFalse(storage.remove_item(self.user.id, first))
+        self.assertEqual(storage.get_cart(self.user.id), {second: 7})
+        self.assertEqual(storage.flusher.dirty, set())
+
+    def test_limits(self):
+        goods_id = self.goods[0].id
+        storage.set_item(self.user.id, goods_id, storage.CART_SETTINGS['MAX_NUMBER'])
+        with self.assertRaises(storage.CartError):
+            storage.add_item(self.user.id, goods_id, 1)
+        self.goods[1].is_on = False
+        self.goods[1].save()
+        with self.assertRaises(storage.CartError):
+            storage.add_item(self.user.id, self.goods[1].id, 1)
+        with mock.patch.dict(storage.CART_SETTINGS, MAX_ITEMS=1):
+            with self.assertRaises(storage.CartError):
+                storage.add_item(self.user.id, self.goods[2].id, 1)
+
+
+class PricingTests(TestCase):
+    """价格计算的查询次数和购物车的商品数无关"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.goods = create_goods(100, stock=1)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_queries_do_not_grow_with_lines(self):
+        items = {goods.id: 1 for goods in self.goods}
+        with self.assertNumQueries(1):
+            priced = price_cart(items)
+        self.assertEqual(len(priced['items']), 100)
+        # 商品详情的缓存中已有全部商品时不查询数据库
+        for goods in self.goods:
+            self.assertEqual(self.client.get('/goods/%d' % goods.id).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(price_cart(items), priced)
+        # 下单时不使用缓存
+        with self.assertNumQueries(1):
+            price_cart(items, use_cache=False)
+
+    def test_totals_and_warnings(self):
+        first, second, third = self.goods[:3]
+        third.is_on = False
+        third.save()
+        priced = price_cart({first.id: 1, second.id: 2, third.id: 1})
+        self.assertEqual([line['warning'] for line in priced['items']], [None, '库存不足，仅剩1件', '商品已下架'])
+        self.assertEqual((priced['total_number'], priced['total_amount'], priced['pay_amount']), (1, '9.90', '9.90'))
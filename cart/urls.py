@@ -0,0 +1,9 @@
+from django.urls import path
+from cart import views
+
+urlpatterns = [
+    # 获取购物车和加入购物车
+    path('', views.CartView.as_view()),
+    # 修改购物车中商品的数量和删除商品
+    path('<int:goods_id>', views.CartItemView.as_view()),
+]
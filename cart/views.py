@@ -1,3 +1,46 @@
-from django.shortcuts import render
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from cart import storage
+from cart.pricing import price_cart
+from cart.serializers import CartItemSerializer
+
+
+class CartView(APIView):
+    """购物车：获取购物车（GET）和加入购物车（POST）"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # 购物车中每件商品的价格、库存提示和总价
+        return Response(price_cart(storage.get_cart(request.user.id)))
+
+    def post(self, request):
+        serializer = CartItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        goods_id = serializer.validated_data['goods']
+        try:
+            number = storage.add_item(request.user.id, goods_id, serializer.validated_data['number'])
+        except storage.CartError as e:
+            return Response({'error': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response({'goods': goods_id, 'number': number}, status=status.HTTP_201_CREATED)
+
+
+class CartItemView(APIView):
+    """购物车中的商品：修改数量（PUT）和删除（DELETE）"""
+    permission_classes = [IsAuthenticated]
+
+    def put(self, request, goods_id):
+        serializer = CartItemSerializer(data={'goods': goods_id, 'number': request.data.get('number')})
+        serializer.is_valid(raise_exception=True)
+        try:
+            number = storage.set_item(request.user.id, goods_id, serializer.validated_data['number'])
+        except storage.CartError as e:
+            return Response({'error': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response({'goods': goods_id, 'number': number})
+
+    def delete(self, request, goods_id):
+        if not storage.remove_item(request.user.id, goods_id):
+            return Response({'error': "购物车中没有该商品"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,18 +1,75 @@
 """
 自定义用户登录的认证类，实现多字段登录
 """
+import re
+
 from django.contrib.auth.backends import ModelBackend
-from django.db.models import Q
 from users.models import User
 from rest_framework import serializers
 
+from common.hashers import acheck_user_password
+
+# 邮箱和手机号的格式，用于在查询之前判断登录账号的类型
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+MOBILE_RE = re.compile(r'^1[3-9]\d{9}$')
+
+
+def resolve_login_field(identifier):
+    """根据登录账号的格式判断应该查询的字段：email、mobile 或 username"""
+    if EMAIL_RE.match(identifier):
+        return 'email'
+    if MOBILE_RE.match(identifier):
+        return 'mobile'
+    return 'username'
+
+
+def get_login_user(identifier):
+    """
+    通过登录账号查找用户，每次只查询一个带索引的字段，
+    避免 username/mobile/email 三个字段 OR 查询导致的全表扫描
+    """
+    if not identifier:
+        raise User.DoesNotExist
+    field = resolve_login_field(identifier)
+    try:
+        return User.objects.get(**{field: identifier})
+    except User.DoesNotExist:
+        # 用户名本身也可能是邮箱或手机号的格式，未找到时再按用户名查询一次
+        if field == 'username':
+            raise
+        return User.objects.get(username=identifier)
+
+
+async def aget_login_user(identifier):
+    """异步版本的get_login_user"""
+    if not identifier:
+        raise User.DoesNotExist
+    field = resolve_login_field(identifier)
+    try:
+        return await User.objects.aget(**{field: identifier})
+    except User.DoesNotExist:
+        if field == 'username':
+            raise
+        return await User.objects.aget(username=identifier)
+
+
+async def aauthenticate(username, password):
+    """在ASGI中使用的登录认证，密码校验在进程池中执行，不阻塞事件循环"""
+    try:
+        user = await aget_login_user(username)
+    except (User.DoesNotExist, User.MultipleObjectsReturned):
+        raise serializers.ValidationError({'error': '未找到该用户！'})
+    if await acheck_user_password(user, password):
+        return user
+    raise serializers.ValidationError({'error': '密码错误！'})
+
 
 class MyBackend(ModelBackend):
     """自定义的登录认证类"""
     def authenticate(self, request, username=None, password=None, **kwargs):
         try:
-            user = User.objects.get(Q(username=username) | Q(mobile=username) | Q(email=username))
-        except:
+            user = get_login_user(username)
+        except (User.DoesNotExist, User.MultipleObjectsReturned):
             raise serializers.ValidationError({'error': '未找到该用户！'})
         else:
             # 验证密码是否正确
@@ -20,4 +77,3 @@ class MyBackend(ModelBackend):
                 return user
             else:
                 raise serializers.ValidationError({'error': '密码错误！'})
-
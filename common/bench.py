@@ -0,0 +1,139 @@
+"""
+性能测试的公共工具：计时和延迟分位数统计，以及性能测试命令的基类
+"""
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(samples, pct):
+    """计算已排序样本的分位数（最近秩法）"""
+    if not samples:
+        return 0.0
+    index = max(0, min(len(samples) - 1, int(round(pct / 100 * len(samples) + 0.5)) - 1))
+    return samples[index]
+
+
+def summarize(samples):
+    """将一组耗时（秒）汇总为毫秒单位的统计结果"""
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': round(total / len(samples) * 1000, 3) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(samples[-1] * 1000, 3) if samples else 0.0,
+    }
+
+
+def measure(func, args_list):
+    """依次用 args_list 中的参数调用 func，返回每次调用的耗时（秒）"""
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def is_test_database(connection):
+    """测试使用的数据库：名称以test开头（测试运行器创建的数据库），或SQLite的内存数据库"""
+    name = str(connection.settings_dict['NAME'] or '')
+    if connection.vendor == 'sqlite' and connection.creation.is_in_memory_db(name):
+        return True
+    return os.path.basename(name).startswith('test')
+
+
+class BenchCommand(BaseCommand):
+    """
+    性能测试命令的基类：性能测试会生成大量数据、修改已有的数据并清空缓存，
+    默认只能在测试数据库上运行，在其他数据库上运行需要传入--allow-any-database
+    """
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument('--allow-any-database', action='store_true',
+                            help='允许在非测试数据库上运行（会写入测试数据并清空缓存）')
+        return parser
+
+    def execute(self, *args, **options):
+        if not options.get('allow_any_database'):
+            from django.db import connections
+            names = [alias for alias in connections if not is_test_database(connections[alias])]
+            if names:
+                raise CommandError('数据库%s不是测试数据库，性能测试会写入测试数据并清空缓存，'
+                                   '确认可以修改时传入--allow-any-database' % '、'.join(names))
+        return super().execute(*args, **options)
+
+
+def bench_client(**defaults):
+    """
+    性能测试使用的测试客户端：Client默认的域名testserver不在ALLOWED_HOSTS中，请求会被拒绝（400），
+    改为使用ALLOWED_HOSTS中的域名，没有配置时使用localhost（DEBUG为True时允许）
+    """
+    from django.conf import settings
+    from django.test import Client
+    host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')), 'localhost')
+    return Client(HTTP_HOST=host, **defaults)
+
+
+def without_throttling():
+    """关闭接口限流，性能测试时所有请求都来自同一个IP"""
+    from django.conf import settings
+    from django.test import override_settings
+    rates = {scope: None for scope in settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})}
+    return override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates})
+
+
+async def http_load(host, port, path, headers=None, concurrency=100, duration=10.0):
+    """
+    使用asyncio对HTTP服务发起并发的GET请求（每个并发一个keep-alive连接），
+    返回(请求耗时列表, 失败请求数)
+    """
+    import asyncio
+
+    request = ['GET %s HTTP/1.1' % path, 'Host: %s:%d' % (host, port)]
+    request += ['%s: %s' % item for item in (headers or {}).items()]
+    request = ('\r\n'.join(request) + '\r\n\r\n').encode()
+    samples = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def read_response(reader):
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1])
+        fields = dict(line.lower().split(': ', 1) for line in lines[1:] if ': ' in line)
+        if 'content-length' in fields:
+            await reader.readexactly(int(fields['content-length']))
+        else:
+            await reader.read()
+        return status, fields.get('connection') == 'close' or 'content-length' not in fields
+
+    async def worker():
+        nonlocal errors
+        writer = None
+        while time.perf_counter() < deadline:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                start = time.perf_counter()
+                writer.write(request)
+                status, closed = await read_response(reader)
+                samples.append(time.perf_counter() - start)
+                if status >= 400:
+                    errors += 1
+                if closed:
+                    writer.close()
+                    writer = None
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors += 1
+                writer = None
+        if writer is not None:
+            writer.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, errors
@@ -1,4 +1,41 @@
 from django.db import models
+from django.utils import timezone
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    """支持批量软删除和恢复的QuerySet，每个方法只执行一条UPDATE（和update()一样不会触发模型的信号）"""
+
+    def soft_delete(self):
+        return self.update(is_delete=True, updated_time=timezone.now())
+
+    def restore(self):
+        return self.update(is_delete=False, updated_time=timezone.now())
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """默认的管理器：过滤掉已软删除的数据"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_delete=False)
+
+
+class AllObjectsManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """包含已软删除数据的管理器，用于恢复数据和归档"""
+
+
+class BlankAsNullEmailField(models.EmailField):
+    """
+    空字符串在数据库中保存为NULL、读出时还原为空字符串的邮箱字段（需要设置null=True）。
+    唯一索引允许多个NULL，普通的unique=True在所有数据库（包括不支持部分索引的MySQL）中都能保证非空邮箱唯一，
+    模型、序列化器和接口中没有邮箱时仍然是空字符串；查询没有邮箱的数据需要使用isnull=True
+    """
+
+    def from_db_value(self, value, expression, connection):
+        return '' if value is None else value
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        return None if value == '' else value
 
 
 class BaseModel(models.Model):
@@ -7,8 +44,22 @@ class BaseModel(models.Model):
     updated_time = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     is_delete = models.BooleanField(default=False, verbose_name='删除标记')
 
+    # 第一个管理器为默认管理器，Model.objects、关联查询和DRF的ModelSerializer都不会查到已软删除的数据；
+    # 通过外键访问单个关联对象时使用的是Django的_base_manager，不受影响
+    objects = SoftDeleteManager()
+    all_objects = AllObjectsManager()
+
     class Meta:
         # 声明这是一个抽象的模型，在执行迁移文件时，不会在数据中生成表
         abstract = True
         verbose_name = '公共字段模型'
         db_table = 'BaseTable'
+
+    def soft_delete(self):
+        """软删除单条数据，会触发post_save信号"""
+        self.is_delete = True
+        self.save(update_fields=['is_delete', 'updated_time'])
+
+    def restore(self):
+        self.is_delete = False
+        self.save(update_fields=['is_delete', 'updated_time'])
@@ -0,0 +1,192 @@
+"""
+上传文件（用户头像等）的下载：缓存校验、HTTP Range、零拷贝发送和nginx转发
+"""
+import asyncio
+import os
+from collections import namedtuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+from common.cache import LocalTTLCache
+
+FILE_SERVE_SETTINGS = {
+    # 转发模式：None（由Django发送文件）、'x-accel'（nginx）、'x-sendfile'（apache/lighttpd）
+    'OFFLOAD': None,
+    # x-accel模式下nginx中internal location的前缀
+    'ACCEL_PREFIX': '/protected/image/',
+    # Cache-Control中的max-age（秒）
+    'MAX_AGE': 86400,
+    # 文件stat结果在进程内缓存的时间（秒）和数量
+    'STAT_CACHE_TIMEOUT': 5,
+    'STAT_CACHE_SIZE': 4096,
+    **getattr(settings, 'FILE_SERVE', {}),
+}
+
+FileStat = namedtuple('FileStat', ['path', 'size', 'mtime', 'etag'])
+
+stat_cache = LocalTTLCache(FILE_SERVE_SETTINGS['STAT_CACHE_SIZE'], FILE_SERVE_SETTINGS['STAT_CACHE_TIMEOUT'])
+
+
+def stat_file(root, name):
+    """获取文件的大小和校验值，文件不存在或路径越出root目录时返回None"""
+    try:
+        path = safe_join(root, name)
+    except SuspiciousFileOperation:
+        return None
+    result = stat_cache.get(path)
+    if result is None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        # 强校验值：inode、修改时间（纳秒）和文件大小任意一个变化都会改变ETag
+        etag = '"%x-%x-%x"' % (st.st_ino, st.st_mtime_ns, st.st_size)
+        result = FileStat(path, st.st_size, int(st.st_mtime), etag)
+        stat_cache.set(path, result)
+    return result
+
+
+def is_not_modified(request, stat):
+    """判断条件请求是否可以返回304"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = [tag.strip() for tag in if_none_match.split(',')]
+        # If-None-Match使用弱比较
+        return '*' in etags or stat.etag in etags or 'W/' + stat.etag in etags
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and stat.mtime <= if_modified_since
+
+
+def parse_range(request, stat):
+    """
+    解析Range请求头，返回(start, end)闭区间；不需要按范围返回时返回None，
+    范围无法满足时抛出ValueError。多个范围的请求按完整文件返回
+    """
+    header = request.META.get('HTTP_RANGE', '')
+    if not header.startswith('bytes=') or ',' in header:
+        return None
+    # If-Range与当前文件不一致时返回完整文件
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != stat.etag and parse_http_date_safe(if_range) != stat.mtime:
+        return None
+    start, sep, end = header[6:].strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if start:
+            start = int(start)
+            end = int(end) if end else stat.size - 1
+        else:
+            # bytes=-500 表示最后500个字节
+            start = max(0, stat.size - int(end))
+            end = stat.size - 1
+    except ValueError:
+        return None
+    if start > end or start >= stat.size:
+        raise ValueError('range not satisfiable')
+    return start, min(end, stat.size - 1)
+
+
+class RangeFile:
+    """
+    只读取文件中一段数据的包装对象。
+    保留fileno()，WSGI服务器的wsgi.file_wrapper可以从当前偏移量开始按Content-Length调用sendfile
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def set_validators(response, stat):
+    response['ETag'] = stat.etag
+    response['Last-Modified'] = http_date(stat.mtime)
+    response['Cache-Control'] = 'public, max-age=%d' % FILE_SERVE_SETTINGS['MAX_AGE']
+    return response
+
+
+def offload_response(root, stat):
+    """返回由前端web服务器发送文件的响应，不占用Django的工作进程"""
+    response = HttpResponse()
+    # 由web服务器根据文件名决定Content-Type
+    del response['Content-Type']
+    if FILE_SERVE_SETTINGS['OFFLOAD'] == 'x-accel':
+        relative = os.path.relpath(stat.path, root).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = FILE_SERVE_SETTINGS['ACCEL_PREFIX'] + quote(relative)
+    else:
+        response['X-Sendfile'] = stat.path
+    return response
+
+
+def serve_file(request, root, name):
+    """返回root目录下name文件的响应，文件不存在时返回None"""
+    stat = stat_file(root, name)
+    if stat is None:
+        return None
+    if is_not_modified(request, stat):
+        return set_validators(HttpResponseNotModified(), stat)
+    if FILE_SERVE_SETTINGS['OFFLOAD']:
+        return set_validators(offload_response(root, stat), stat)
+
+    try:
+        byte_range = parse_range(request, stat)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % stat.size
+        return response
+
+    file = open(stat.path, 'rb')
+    if byte_range is None:
+        # FileResponse会交给wsgi.file_wrapper，由服务器使用sendfile零拷贝发送
+        response = FileResponse(file)
+    else:
+        start, end = byte_range
+        response = FileResponse(RangeFile(file, start, end - start + 1), status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, stat.size)
+    response['Accept-Ranges'] = 'bytes'
+    return set_validators(response, stat)
+
+
+async def _aread_chunks(filelike, block_size):
+    try:
+        while True:
+            chunk = await asyncio.to_thread(filelike.read, block_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        filelike.close()
+
+
+def to_async_response(response):
+    """
+    将FileResponse的文件内容改为异步迭代器，在ASGI中逐块读取文件并发送，
+    避免Django在事件循环中同步读取或一次性读入整个文件
+    """
+    if isinstance(response, FileResponse) and response.file_to_stream is not None:
+        filelike = response.file_to_stream
+        response.streaming_content = _aread_chunks(filelike, response.block_size)
+    return response
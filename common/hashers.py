@@ -0,0 +1,87 @@
+"""
+可配置计算强度的密码哈希类，以及在进程池中计算哈希的异步接口
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+HASHING_SETTINGS = {
+    'PBKDF2_ITERATIONS': hashers.PBKDF2PasswordHasher.iterations,
+    'ARGON2_TIME_COST': hashers.Argon2PasswordHasher.time_cost,
+    'ARGON2_MEMORY_COST': hashers.Argon2PasswordHasher.memory_cost,
+    'ARGON2_PARALLELISM': hashers.Argon2PasswordHasher.parallelism,
+    'BCRYPT_ROUNDS': hashers.BCryptSHA256PasswordHasher.rounds,
+    # 计算哈希的进程数，为0时在当前进程的线程池中计算
+    'OFFLOAD_WORKERS': 2,
+    **getattr(settings, 'PASSWORD_HASHING', {}),
+}
+
+
+class ConfigurablePBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """迭代次数可配置的PBKDF2，迭代次数变化后旧密码会在登录时自动重新哈希"""
+    iterations = HASHING_SETTINGS['PBKDF2_ITERATIONS']
+
+
+class ConfigurableArgon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """参数可配置的Argon2，需要安装argon2-cffi"""
+    time_cost = HASHING_SETTINGS['ARGON2_TIME_COST']
+    memory_cost = HASHING_SETTINGS['ARGON2_MEMORY_COST']
+    parallelism = HASHING_SETTINGS['ARGON2_PARALLELISM']
+
+
+class ConfigurableBCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    """轮数可配置的bcrypt，需要安装bcrypt"""
+    rounds = HASHING_SETTINGS['BCRYPT_ROUNDS']
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker(settings_module):
+    """子进程的初始化：加载Django配置"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def get_executor():
+    """获取计算哈希的进程池，使用spawn方式创建子进程，避免fork时复制线程和数据库连接"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = HASHING_SETTINGS['OFFLOAD_WORKERS']
+            if workers:
+                _executor = ProcessPoolExecutor(
+                    workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker, initargs=(os.environ['DJANGO_SETTINGS_MODULE'],))
+    return _executor
+
+
+async def acheck_password(password, encoded):
+    """在进程池中校验密码，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), hashers.check_password, password, encoded)
+
+
+async def amake_password(password):
+    """在进程池中生成密码哈希，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), hashers.make_password, password)
+
+
+async def acheck_user_password(user, password):
+    """异步版本的user.check_password，哈希算法或参数过期时同样会重新哈希并保存"""
+    if not await acheck_password(password, user.password):
+        return False
+    preferred = hashers.get_hasher('default')
+    if hashers.identify_hasher(user.password).algorithm != preferred.algorithm \
+            or preferred.must_update(user.password):
+        user.password = await amake_password(password)
+        await user.asave(update_fields=['password'])
+    return True
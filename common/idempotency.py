@@ -0,0 +1,143 @@
+"""
+POST接口的幂等处理：客户端在请求头中携带Idempotency-Key，同一个key的第一次响应（状态码 + 数据）保存在缓存中，
+重试时直接返回保存的响应，不再重复执行视图；相同的请求仍在处理中时，同步视图直接返回409，不占用工作线程等待，
+异步视图等待其完成，超时返回409
+"""
+import asyncio
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import UploadedFile
+from rest_framework import status
+from rest_framework.response import Response
+
+from common.throttling import client_ip
+
+IDEMPOTENCY_SETTINGS = {
+    # 响应保存的时间（秒）
+    'TIMEOUT': 24 * 3600,
+    # 处理中的标记的有效时间（秒），处理请求的进程崩溃后，超过该时间可以重新执行
+    'LOCK_TIMEOUT': 30,
+    # 相同的请求正在处理中时，异步视图最多等待的时间（秒）
+    'WAIT': 5,
+    **getattr(settings, 'IDEMPOTENCY', {}),
+}
+
+HEADER = 'Idempotency-Key'
+# 不保存的响应：服务端错误、限流和冲突，客户端重试时需要重新执行
+UNCACHED_STATUS = {status.HTTP_409_CONFLICT, status.HTTP_429_TOO_MANY_REQUESTS}
+
+
+def file_digest(upload):
+    """上传文件内容的摘要，读取后视图仍可以从头读取文件"""
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def request_fingerprint(request):
+    """请求参数的摘要，同一个key用于不同的请求参数时拒绝执行；上传的文件使用文件名和内容的摘要"""
+    data = request.data
+    if hasattr(data, 'keys'):
+        data = [(name, data[name]) for name in sorted(data.keys())]
+        data = [(name, (value.name, file_digest(value)) if isinstance(value, UploadedFile) else value)
+                for name, value in data]
+    raw = '%s %s %r' % (request.method, request.path, data)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def replay(item):
+    response = Response(item['data'], status=item['status'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def cache_keys(request, key):
+    """
+    保存响应和处理中标记的缓存key，同一个key只在同一个用户、同一个接口内有效；
+    未登录的请求（如注册）按客户端IP区分，其他客户端使用相同的key不能重放或阻塞该请求
+    """
+    user = request.user
+    client = 'user:%s' % user.id if user.is_authenticated else 'ip:%s' % client_ip(request)
+    scope = hashlib.md5(('%s:%s:%s' % (client, request.path, key)).encode()).hexdigest()
+    return 'idempotency:%s' % scope, 'idempotency:%s:lock' % scope
+
+
+def idempotent(view):
+    """DRF视图方法的装饰器，请求头中没有Idempotency-Key时不做任何处理"""
+    @functools.wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'error': '%s不能超过255个字符' % HEADER}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        result_key, lock_key = cache_keys(request, key)
+        fingerprint = request_fingerprint(request)
+
+        # 1. 已有保存的响应时直接返回
+        item = cache.get(result_key)
+        if item is None and not cache.add(lock_key, 1, IDEMPOTENCY_SETTINGS['LOCK_TIMEOUT']):
+            # 2. 相同的请求正在处理中，直接返回409，由客户端稍后重试，不在工作线程中等待
+            item = cache.get(result_key)
+            if item is None:
+                return Response({'error': '相同的请求正在处理中，请稍后再试'}, status=status.HTTP_409_CONFLICT)
+        if item is not None:
+            if item['fingerprint'] != fingerprint:
+                return Response({'error': '%s已被用于其他请求' % HEADER}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            return replay(item)
+
+        # 3. 第一次请求：执行视图并保存响应
+        try:
+            response = view(self, request, *args, **kwargs)
+            if response.status_code < 500 and response.status_code not in UNCACHED_STATUS:
+                item = {'status': response.status_code, 'data': response.data, 'fingerprint': fingerprint}
+                cache.set(result_key, item, IDEMPOTENCY_SETTINGS['TIMEOUT'])
+            return response
+        finally:
+            cache.delete(lock_key)
+    return wrapper
+
+
+async def acall_idempotent(request, view, respond):
+    """
+    异步视图中的幂等处理，和idempotent相同，缓存使用异步接口；相同的请求正在处理中时等待其完成，等待时不阻塞事件循环。
+    request为DRF的Request（用于计算请求参数的摘要），view为无参数的协程函数，返回的响应需要带有data属性，
+    respond(data, status)用于生成和视图相同格式的响应
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return await view()
+    if len(key) > 255:
+        return respond({'error': '%s不能超过255个字符' % HEADER}, status.HTTP_422_UNPROCESSABLE_ENTITY)
+    result_key, lock_key = cache_keys(request, key)
+    fingerprint = request_fingerprint(request)
+
+    item = await cache.aget(result_key)
+    if item is None and not await cache.aadd(lock_key, 1, IDEMPOTENCY_SETTINGS['LOCK_TIMEOUT']):
+        deadline = time.monotonic() + IDEMPOTENCY_SETTINGS['WAIT']
+        while item is None and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            item = await cache.aget(result_key)
+        if item is None:
+            return respond({'error': '相同的请求正在处理中，请稍后再试'}, status.HTTP_409_CONFLICT)
+    if item is not None:
+        if item['fingerprint'] != fingerprint:
+            return respond({'error': '%s已被用于其他请求' % HEADER}, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        response = respond(item['data'], item['status'])
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    try:
+        response = await view()
+        if response.status_code < 500 and response.status_code not in UNCACHED_STATUS:
+            item = {'status': response.status_code, 'data': response.data, 'fingerprint': fingerprint}
+            await cache.aset(result_key, item, IDEMPOTENCY_SETTINGS['TIMEOUT'])
+        return response
+    finally:
+        await cache.adelete(lock_key)
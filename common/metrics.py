@@ -0,0 +1,234 @@
+"""
+请求耗时统计：记录每个请求的总耗时、SQL查询次数和耗时、响应渲染（序列化）耗时，
+通过Server-Timing响应头返回给客户端，按路由汇总为直方图，由/metrics接口以Prometheus文本格式输出。
+统计数据保存在进程内，多进程部署时Prometheus需要分别抓取每个进程（或只作为单个进程的采样）
+"""
+import hmac
+import ipaddress
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+METRICS_SETTINGS = {
+    # 直方图的桶（秒）
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    # 超过耗时（秒）或SQL查询次数的请求输出警告日志，设置为None时不检查
+    'SLOW_REQUEST': 0.5,
+    'MAX_QUERIES': 20,
+    # 是否返回Server-Timing响应头
+    'SERVER_TIMING': True,
+    # 访问/metrics时需要携带的token（请求头Authorization: Bearer <token>）
+    'TOKEN': None,
+    # 不需要token即可访问/metrics的客户端地址（REMOTE_ADDR，支持网段如10.0.0.0/8）；
+    # 既没有配置token也不在这些地址中的请求一律拒绝
+    'ALLOWED_IPS': (),
+    **getattr(settings, 'METRICS', {}),
+}
+
+# 没有匹配到路由的请求（404）统一记录，避免扫描器的随机路径产生大量的统计项
+UNMATCHED = '<unmatched>'
+
+
+class RouteStats:
+    __slots__ = ('buckets', 'count', 'total', 'queries', 'db_time', 'render_time', 'statuses')
+
+    def __init__(self, size):
+        self.buckets = [0] * size
+        self.count = 0
+        self.total = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.statuses = {}
+
+
+class Registry:
+    """按（请求方法, 路由）汇总的统计数据，每个请求只在锁内做几次加法"""
+
+    def __init__(self, buckets):
+        self.bounds = tuple(buckets)
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def observe(self, method, route, status, elapsed, queries, db_time, render_time):
+        index = bisect_left(self.bounds, elapsed)
+        with self.lock:
+            stats = self.routes.get((method, route))
+            if stats is None:
+                # 最后一个桶为+Inf
+                stats = self.routes[(method, route)] = RouteStats(len(self.bounds) + 1)
+            stats.buckets[index] += 1
+            stats.count += 1
+            stats.total += elapsed
+            stats.queries += queries
+            stats.db_time += db_time
+            stats.render_time += render_time
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+
+    def render(self):
+        """输出Prometheus文本格式（text/plain; version=0.0.4）"""
+        with self.lock:
+            snapshot = [(key, stats.buckets[:], stats.count, stats.total, stats.queries, stats.db_time,
+                         stats.render_time, dict(stats.statuses)) for key, stats in sorted(self.routes.items())]
+        bounds = [repr(float(bound)) for bound in self.bounds] + ['+Inf']
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by route.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (method, route), buckets, count, total, *_ in snapshot:
+            labels = 'method="%s",route="%s"' % (method, escape(route))
+            cumulative = 0
+            for bound, number in zip(bounds, buckets):
+                cumulative += number
+                lines.append('http_request_duration_seconds_bucket{%s,le="%s"} %d' % (labels, bound, cumulative))
+            lines.append('http_request_duration_seconds_sum{%s} %r' % (labels, total))
+            lines.append('http_request_duration_seconds_count{%s} %d' % (labels, count))
+
+        counters = [
+            ('http_requests_total', 'Responses by route and status code.', None),
+            ('http_request_db_queries_total', 'SQL queries executed by route.', 4),
+            ('http_request_db_seconds_total', 'Time spent in SQL queries by route.', 5),
+            ('http_request_render_seconds_total', 'Time spent rendering (serializing) responses by route.', 6),
+        ]
+        for name, description, field in counters:
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s counter' % name)
+            for row in snapshot:
+                (method, route) = row[0]
+                labels = 'method="%s",route="%s"' % (method, escape(route))
+                if field is None:
+                    for code, number in sorted(row[7].items()):
+                        lines.append('%s{%s,status="%d"} %d' % (name, labels, code, number))
+                else:
+                    lines.append('%s{%s} %r' % (name, labels, row[field]))
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry(METRICS_SETTINGS['BUCKETS'])
+
+
+class QueryTimer:
+    """connection.execute_wrapper的回调，累计一个请求内的SQL查询次数和耗时"""
+
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.elapsed += time.perf_counter() - start
+            self.count += 1
+
+
+def route_of(request):
+    """路由的模板（如user/address/<int:pk>），而不是实际的路径，统计项的数量不会随参数增长"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED
+    return match.route or match.view_name or UNMATCHED
+
+
+class MetricsMiddleware:
+    """
+    请求耗时统计的中间件，放在MIDDLEWARE的第一个，统计的耗时包含其他中间件。
+    同时支持同步和异步，ASGI下不会让整个中间件链和异步视图退化为在线程中同步执行
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer, start = QueryTimer(), time.perf_counter()
+        request._metrics_render_time = 0.0
+        with self.wrap_queries(timer):
+            response = self.get_response(request)
+        return self.record(request, response, timer, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timer, start = QueryTimer(), time.perf_counter()
+        request._metrics_render_time = 0.0
+        # 数据库连接是线程本地的，异步视图的ORM查询在sync_to_async的线程中执行，需要在该线程中注册回调
+        stack = await sync_to_async(self.wrap_queries)(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.record(request, response, timer, time.perf_counter() - start)
+
+    @staticmethod
+    def wrap_queries(timer):
+        stack = ExitStack()
+        # 所有数据库连接（包括读写分离的从库）的查询都计入
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(timer))
+        return stack
+
+    def record(self, request, response, timer, elapsed):
+        route = route_of(request)
+        render_time = request._metrics_render_time
+        if route != 'metrics':
+            registry.observe(request.method, route, response.status_code, elapsed, timer.count, timer.elapsed,
+                             render_time)
+        if METRICS_SETTINGS['SERVER_TIMING']:
+            response['Server-Timing'] = 'db;desc="%d queries";dur=%.2f, render;dur=%.2f, total;dur=%.2f' % (
+                timer.count, timer.elapsed * 1000, render_time * 1000, elapsed * 1000)
+
+        slow, max_queries = METRICS_SETTINGS['SLOW_REQUEST'], METRICS_SETTINGS['MAX_QUERIES']
+        if (slow is not None and elapsed > slow) or (max_queries is not None and timer.count > max_queries):
+            logger.warning('慢请求：%s %s（%s）状态码%d，耗时%.1fms，SQL查询%d次共%.1fms，渲染%.1fms',
+                           request.method, request.get_full_path(), route, response.status_code, elapsed * 1000,
+                           timer.count, timer.elapsed * 1000, render_time * 1000)
+        return response
+
+    def process_template_response(self, request, response):
+        """DRF的Response在所有process_template_response之后渲染，通过渲染后的回调记录渲染耗时"""
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._metrics_render_time = time.perf_counter() - start
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def is_metrics_allowed(request):
+    """携带正确的token或来自允许的内网地址时才能访问/metrics，默认拒绝"""
+    token = METRICS_SETTINGS['TOKEN']
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer %s' % token):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in METRICS_SETTINGS['ALLOWED_IPS'])
+
+
+def metrics_view(request):
+    if not is_metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,133 @@
+"""
+基于游标（键集）的分页类，翻页时使用 WHERE 条件定位，不使用 OFFSET
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    按ordering中的字段做键集分页，ordering的最后一个字段必须唯一（通常为id）。
+    翻页条件为 (a, b, id) < (a0, b0, id0) 展开后的组合条件，可以直接利用对应的联合索引
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('-id',)
+    # 为False时，只有请求中携带cursor或page_size参数才进行分页
+    always_paginate = True
+    invalid_cursor_message = '无效的分页游标'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.get_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """异步版本的paginate_queryset，在异步视图中使用"""
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.get_page([row async for row in queryset])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """返回查询当前页数据的queryset，不需要分页时返回None"""
+        params = request.query_params
+        if not self.always_paginate and self.cursor_query_param not in params \
+                and self.page_size_query_param not in params:
+            return None
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.current_ordering = self.get_ordering(request, queryset, view)
+
+        queryset = queryset.order_by(*self.current_ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.build_filter(position))
+            except (TypeError, ValueError, ValidationError):
+                # 游标被篡改，其中的值和排序字段的类型不符
+                raise NotFound(self.invalid_cursor_message)
+        # 多取一条数据，用来判断是否还有下一页
+        return queryset[:self.page_size + 1]
+
+    def get_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+    def get_position(self, item):
+        """获取某条数据在排序字段上的值，支持模型对象和values()返回的字典"""
+        names = [name.lstrip('-') for name in self.current_ordering]
+        if isinstance(item, dict):
+            return [item[name] for name in names]
+        return [getattr(item, name) for name in names]
+
+    def build_filter(self, position):
+        """构建定位到游标之后的数据的查询条件"""
+        condition = Q()
+        equal = {}
+        for name, value in zip(self.current_ordering, position):
+            field = name.lstrip('-')
+            lookup = '%s__%s' % (field, 'lt' if name.startswith('-') else 'gt')
+            condition |= Q(**equal, **{lookup: value})
+            equal[field] = value
+        return condition
+
+    def encode_cursor(self, position):
+        raw = json.dumps(position, default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.current_ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
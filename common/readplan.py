@@ -0,0 +1,102 @@
+"""
+只读接口的快速序列化：根据序列化器的字段预先生成读取计划（输出的字段名、数据库列和转换函数），
+查询时通过values_list()只取需要的列，直接用元组构建响应的字典，不创建模型对象，也不逐个字段调用to_representation()。
+输出和序列化器相同，新增、修改数据时仍然使用序列化器校验
+"""
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+# 数据库返回的值可以直接输出的字段类型
+PLAIN_FIELDS = (serializers.BooleanField, serializers.CharField, serializers.IntegerField,
+                serializers.PrimaryKeyRelatedField)
+
+
+def file_converter(field, model_field):
+    """和FileField.to_representation()相同：输出文件的url，有请求时为完整的url"""
+    storage = model_field.storage
+    use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+
+    def convert(value, request):
+        # 数据库中的值为文件名，模型对象上的值为FieldFile
+        name = getattr(value, 'name', value)
+        if not name:
+            return None
+        if not use_url:
+            return name
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return convert
+
+
+class ReadPlan:
+    """序列化器对应的读取计划，第一次使用时根据序列化器的字段生成"""
+
+    def __init__(self, serializer_class, names=None):
+        self.serializer_class = serializer_class
+        self.selected = names
+        self.subsets = {}
+        self.built = False
+
+    def build(self):
+        model = self.serializer_class.Meta.model
+        names, columns, converters = [], [], []
+        for name, field in self.serializer_class().fields.items():
+            if field.write_only or (self.selected is not None and name not in self.selected):
+                continue
+            model_field = model._meta.get_field(field.source)
+            names.append(name)
+            columns.append(model_field.attname)
+            if isinstance(field, PLAIN_FIELDS):
+                continue
+            if isinstance(field, serializers.FileField):
+                converters.append((name, file_converter(field, model_field)))
+            else:
+                converters.append((name, lambda value, request, field=field: field.to_representation(value)))
+        self.names, self.columns, self.converters = tuple(names), tuple(columns), tuple(converters)
+        self.built = True
+
+    def select(self, names):
+        """只输出names中的字段的计划（字段顺序和序列化器相同），names需要由调用方校验"""
+        if not names:
+            return self
+        key = frozenset(names)
+        plan = self.subsets.get(key)
+        if plan is None:
+            plan = self.subsets[key] = ReadPlan(self.serializer_class, key)
+        return plan
+
+    def values(self, queryset, *extra, named=False):
+        """
+        查询计划中的列；extra为不输出但需要查询的列（如分页的排序字段），放在最后，
+        分页时使用named=True，分页类通过属性获取排序字段的值
+        """
+        if not self.built:
+            self.build()
+        columns = self.columns + tuple(column for column in extra if column not in self.columns)
+        return queryset.values_list(*columns, named=named)
+
+    def represent(self, rows, request=None):
+        """将values()查询的行转换为响应数据（字典的列表）"""
+        if not self.built:
+            self.build()
+        names = self.names
+        if not self.converters:
+            return [dict(zip(names, row)) for row in rows]
+        result = []
+        for row in rows:
+            item = dict(zip(names, row))
+            for name, convert in self.converters:
+                value = item[name]
+                if value is not None:
+                    item[name] = convert(value, request)
+            result.append(item)
+        return result
+
+    def represent_one(self, row, request=None):
+        return self.represent([row], request)[0]
+
+    def represent_instance(self, instance, request=None):
+        """已经查询出模型对象时（如权限校验需要对象），直接从对象上取值"""
+        if not self.built:
+            self.build()
+        return self.represent_one([getattr(instance, column) for column in self.columns], request)
@@ -0,0 +1,65 @@
+"""
+基于orjson的JSON渲染器和解析器，输出和DRF的JSONRenderer相同（不转义中文、紧凑格式）；
+未安装orjson或遇到orjson不支持的数据时，使用DRF自带的实现
+"""
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # 日期时间、Decimal、惰性翻译字符串等交给DRF的JSONEncoder处理，格式和JSONRenderer一致
+    OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+_default = JSONEncoder().default
+
+
+def dumps(data):
+    """将数据编码为JSON（bytes）"""
+    if orjson is not None:
+        try:
+            ret = orjson.dumps(data, default=_default, option=OPTIONS)
+        except TypeError:
+            # 超出64位的整数等，使用标准库编码
+            pass
+        else:
+            # 和JSONRenderer一样转义U+2028和U+2029，输出可以直接嵌入JavaScript
+            if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+                ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+            return ret
+    ret = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=not api_settings.STRICT_JSON,
+                     separators=(',', ':'))
+    return ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        # 需要缩进（如可浏览的API）或关闭紧凑格式时使用DRF的实现
+        if orjson is None or not self.compact or self.ensure_ascii or \
+                self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class ORJSONParser(JSONParser):
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
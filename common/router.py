@@ -0,0 +1,169 @@
+"""
+读写分离的数据库路由：写操作、事务中的查询和POST等请求中的查询使用主库，其他读操作随机使用一个健康的从库。
+客户端写入数据后的PIN_SECONDS秒内，它的读操作都使用主库，保证能读到自己刚写入的数据：
+登录用户的写入标记保存在缓存中（需要多个进程共享的缓存，如Redis），同时在响应中设置cookie，未登录的客户端按cookie识别。
+不按IP识别客户端，nginx等代理之后所有请求的REMOTE_ADDR相同，一个写请求会让所有客户端都使用主库。
+不在请求中执行的代码（管理命令、后台线程）只使用主库
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+from common.cache import is_process_local
+
+ROUTER_SETTINGS = {
+    # 从库在DATABASES中的别名，为空时所有操作都使用主库
+    'REPLICAS': [],
+    # 写入数据后读操作固定使用主库的时间（秒），应大于主从复制的延迟
+    'PIN_SECONDS': 5,
+    # 写入数据后设置的cookie，带有该cookie的请求使用主库
+    'PIN_COOKIE': 'db_pin',
+    # 每隔多少秒检查一次从库是否可用，不可用的从库在下一次检查成功之前不会被使用
+    'CHECK_INTERVAL': 10,
+    **getattr(settings, 'DB_ROUTER', {}),
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('db_router_state', default=None)
+# 从库的健康状态：{别名: (是否可用, 检查时间)}，每个进程各自检查
+_health = {}
+
+
+def pin_key(user_id):
+    return 'db:pin:user:%s' % user_id
+
+
+def request_user_id(request):
+    """已经完成认证的用户id；认证前返回None，不在路由中触发认证（认证本身会查询数据库）"""
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject):
+        user = user._wrapped
+        if user is empty:
+            return None
+    return getattr(user, 'id', None)
+
+
+class RequestState:
+    """一个请求的路由状态：本次请求是否写过数据，以及登录用户的写入标记"""
+    __slots__ = ('request', 'primary', 'written', 'pinned')
+
+    def __init__(self, request):
+        self.request = request
+        # 修改数据的请求中，写入之前的读操作（如更新前查询对象）也使用主库；
+        # 客户端带有写入后设置的cookie时同样使用主库
+        self.primary = request.method not in SAFE_METHODS or ROUTER_SETTINGS['PIN_COOKIE'] in request.COOKIES
+        self.written = False
+        self.pinned = None
+
+    def is_pinned(self):
+        if self.primary or self.written:
+            return True
+        if self.pinned is None:
+            # 认证前的查询（包括认证本身）不能确定用户，使用从库；认证后每个请求只查询一次缓存
+            user_id = request_user_id(self.request)
+            if user_id is None:
+                return False
+            self.pinned = cache.get(pin_key(user_id)) is not None
+        return self.pinned
+
+
+def is_healthy(alias):
+    healthy, checked_at = _health.get(alias, (True, 0.0))
+    now = time.monotonic()
+    if now - checked_at < ROUTER_SETTINGS['CHECK_INTERVAL']:
+        return healthy
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+        healthy = True
+    except DatabaseError:
+        healthy = False
+        connections[alias].close()
+    _health[alias] = (healthy, now)
+    return healthy
+
+
+class PrimaryReplicaRouter:
+    """DATABASE_ROUTERS中使用的路由类"""
+
+    def db_for_read(self, model, **hints):
+        replicas = ROUTER_SETTINGS['REPLICAS']
+        state = _state.get()
+        if not replicas or state is None or connections[DEFAULT_DB_ALIAS].in_atomic_block or state.is_pinned():
+            return DEFAULT_DB_ALIAS
+        healthy = [alias for alias in replicas if is_healthy(alias)]
+        return random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 主库和从库的数据相同，不同连接中取出的对象之间可以建立关联
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 从库的表结构通过复制同步
+        return db == DEFAULT_DB_ALIAS
+
+
+class PrimaryPinMiddleware:
+    """
+    为每个请求记录路由状态；请求中写入过数据时，在缓存中为登录用户设置标记，并在响应中设置cookie，
+    之后PIN_SECONDS秒内该客户端的请求（包括其他进程处理的请求）的读操作都使用主库。
+    同时支持同步和异步，异步视图中的ORM查询在sync_to_async的线程中执行，ContextVar会被复制到该线程
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if ROUTER_SETTINGS['REPLICAS'] and is_process_local():
+            raise ImproperlyConfigured('配置从库时需要使用多个进程共享的缓存（如Redis），否则其他进程读不到写入标记')
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestState(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.written and ROUTER_SETTINGS['REPLICAS']:
+            user_id = self.pin(state, response)
+            if user_id is not None:
+                cache.set(pin_key(user_id), 1, ROUTER_SETTINGS['PIN_SECONDS'])
+        return response
+
+    async def __acall__(self, request):
+        state = RequestState(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.written and ROUTER_SETTINGS['REPLICAS']:
+            user_id = self.pin(state, response)
+            if user_id is not None:
+                await cache.aset(pin_key(user_id), 1, ROUTER_SETTINGS['PIN_SECONDS'])
+        return response
+
+    @staticmethod
+    def pin(state, response):
+        """设置cookie，返回需要在缓存中设置标记的登录用户id"""
+        response.set_cookie(ROUTER_SETTINGS['PIN_COOKIE'], '1', max_age=ROUTER_SETTINGS['PIN_SECONDS'],
+                            httponly=True, samesite='Lax')
+        return request_user_id(state.request)
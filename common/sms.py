@@ -0,0 +1,44 @@
+"""
+短信发送，通过SMS_SENDER配置使用的发送类
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class BaseSmsSender:
+    """短信发送类的基类"""
+
+    def send(self, mobile, message):
+        raise NotImplementedError('subclasses of BaseSmsSender must provide a send() method')
+
+
+class ConsoleSmsSender(BaseSmsSender):
+    """将短信内容输出到日志中，用于本地开发；短信中包含验证码，使用DEBUG级别，生产环境的日志中不会出现"""
+
+    def send(self, mobile, message):
+        logger.debug('短信 -> %s：%s', mobile, message)
+
+
+class LocmemSmsSender(BaseSmsSender):
+    """将短信保存在内存的outbox列表中，用于离线测试"""
+    outbox = []
+    lock = threading.Lock()
+
+    def send(self, mobile, message):
+        with self.lock:
+            self.outbox.append((mobile, message))
+
+
+_sender = None
+
+
+def get_sms_sender():
+    global _sender
+    if _sender is None:
+        _sender = import_string(getattr(settings, 'SMS_SENDER', 'common.sms.ConsoleSmsSender'))()
+    return _sender
@@ -0,0 +1,106 @@
+"""
+登录、注册接口的限流类，使用滑动窗口计数，计数器保存在Django缓存中
+"""
+import hashlib
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+
+
+def client_ip(request):
+    """
+    客户端的IP：未配置NUM_PROXIES时DRF直接使用X-Forwarded-For，客户端每次伪造不同的值就能绕过限流，
+    这里只使用REMOTE_ADDR；部署在反向代理之后时配置NUM_PROXIES，从X-Forwarded-For中取代理添加的IP
+    """
+    if api_settings.NUM_PROXIES is None:
+        return request.META.get('REMOTE_ADDR')
+    return BaseThrottle().get_ident(request)
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    滑动窗口计数限流：请求数 = 当前窗口的计数 + 上一个窗口的计数 * 上一个窗口仍在滑动窗口内的比例。
+    每次请求先将当前窗口的计数原子加一，再读取上一个窗口的计数判断，被拒绝时减回；
+    和DRF自带的按请求时间列表限流相比，开销与请求数无关
+    """
+
+    def get_rate(self):
+        # 每次从配置中读取，修改REST_FRAMEWORK配置后立即生效
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = self.timer()
+        window = int(now // self.duration)
+        current_key = '%s:%d' % (self.key, window)
+        previous_key = '%s:%d' % (self.key, window - 1)
+        # 先原子地计入本次请求再判断，并发的请求各自得到不同的计数，不会在计数之前同时通过检查
+        current = self.incr(current_key)
+        # 上一个窗口中仍处于滑动窗口内的比例
+        weight = 1 - (now - window * self.duration) / self.duration
+        # 本次请求之前滑动窗口内的请求数
+        total = self.cache.get(previous_key, 0) * weight + current - 1
+        if total >= self.num_requests:
+            # 被拒绝的请求不计数
+            try:
+                self.cache.decr(current_key)
+            except ValueError:
+                pass
+            self.wait_seconds = (window + 1) * self.duration - now
+            return False
+        return True
+
+    def incr(self, key):
+        """计数器原子加一并返回加一后的值；有效期为两个窗口，下一个窗口中仍需要读取它"""
+        if self.cache.add(key, 1, self.duration * 2):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # 计数器在add和incr之间过期
+            self.cache.set(key, 1, self.duration * 2)
+            return 1
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+class IPThrottle(SlidingWindowThrottle):
+    """按客户端IP限流"""
+
+    def get_ident(self, request):
+        return client_ip(request)
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class LoginIPThrottle(IPThrottle):
+    scope = 'login_ip'
+
+
+class RegisterIPThrottle(IPThrottle):
+    scope = 'register_ip'
+
+
+class VerifCodeIPThrottle(IPThrottle):
+    scope = 'verifcode_ip'
+
+
+class LoginIdentifierThrottle(SlidingWindowThrottle):
+    """按登录账号限流，防止同一账号被从大量IP上撞库"""
+    scope = 'login_identifier'
+
+    def get_cache_key(self, request, view):
+        identifier = request.data.get('username')
+        if not identifier or not isinstance(identifier, str):
+            return None
+        ident = hashlib.md5(identifier.strip().lower().encode()).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
@@ -0,0 +1,155 @@
+"""
+带缓存的JWT认证类，避免每个请求都查询一次用户表
+"""
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from common.cache import LocalTTLCache
+
+USER_CACHE_SETTINGS = {
+    # 为True时直接使用token中的声明构建用户，不查询数据库
+    'STATELESS': False,
+    # Django缓存中用户数据的过期时间（秒）
+    'TIMEOUT': 300,
+    # 进程内缓存的过期时间（秒）。用户被修改时只能清除当前进程的进程内缓存，其他进程在这段时间内仍使用旧数据，
+    # 被禁用或取消管理员的用户最多在这段时间内保留原来的权限；为0时不使用进程内缓存，修改后立即生效
+    'LOCAL_TIMEOUT': 5,
+    'LOCAL_MAXSIZE': 1024,
+    **getattr(settings, 'JWT_USER_CACHE', {}),
+}
+
+local_users = LocalTTLCache(USER_CACHE_SETTINGS['LOCAL_MAXSIZE'], USER_CACHE_SETTINGS['LOCAL_TIMEOUT'])
+
+# 认证和权限判断用到的用户字段，缓存中只保存这些字段，密码哈希等数据不写入共享缓存
+AUTH_USER_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser', 'is_delete')
+
+
+def user_cache_key(user_id):
+    return 'auth:user:%s' % user_id
+
+
+def invalidate_user(user_id):
+    """清除用户的缓存，在用户被保存或禁用时调用"""
+    local_users.delete(user_cache_key(user_id))
+    cache.delete(user_cache_key(user_id))
+
+
+def invalidate_users(user_ids):
+    """批量清除用户的缓存，用于queryset.update()等不触发信号的批量修改（见users.models.UserQuerySet）"""
+    keys = [user_cache_key(user_id) for user_id in user_ids]
+    for key in keys:
+        local_users.delete(key)
+    cache.delete_many(keys)
+
+
+def auth_data(user):
+    """用户缓存中保存的数据；开启CHECK_REVOKE_TOKEN时只保存密码哈希的摘要，用于校验token是否已失效"""
+    data = {name: getattr(user, name) for name in AUTH_USER_FIELDS}
+    if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+        from rest_framework_simplejwt.utils import get_md5_hash_password
+        data['password_hash'] = get_md5_hash_password(user.password)
+    return data
+
+
+def get_local(key):
+    if not USER_CACHE_SETTINGS['LOCAL_TIMEOUT']:
+        return None
+    return local_users.get(key)
+
+
+def set_local(key, data):
+    if USER_CACHE_SETTINGS['LOCAL_TIMEOUT']:
+        local_users.set(key, data, USER_CACHE_SETTINGS['LOCAL_TIMEOUT'])
+
+
+def user_changed(sender, instance, **kwargs):
+    """用户模型保存/删除的信号处理函数"""
+    invalidate_user(instance.pk)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    先从进程内LRU缓存、再从Django缓存中获取用户的认证字段，都未命中时才查询数据库；
+    开启STATELESS模式后，直接根据token中的user_id、is_superuser构建轻量用户对象
+    """
+
+    def get_user(self, validated_token):
+        if USER_CACHE_SETTINGS['STATELESS']:
+            if api_settings.USER_ID_CLAIM not in validated_token:
+                raise InvalidToken('Token contained no recognizable user identification')
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        key = user_cache_key(user_id)
+        data = get_local(key)
+        if data is None:
+            data = cache.get(key)
+            if data is None:
+                # 缓存未命中，查询数据库（父类中会完成用户状态的校验）
+                user = super().get_user(validated_token)
+                data = auth_data(user)
+                cache.set(key, data, USER_CACHE_SETTINGS['TIMEOUT'])
+                set_local(key, data)
+                return user
+            set_local(key, data)
+        self.check_user(data, validated_token)
+        return self.build_user(data)
+
+    async def aauthenticate(self, request):
+        """异步视图中使用的认证，request为Django的HttpRequest"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        """异步版本的get_user，缓存未命中时使用异步ORM查询"""
+        if USER_CACHE_SETTINGS['STATELESS']:
+            return self.get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        key = user_cache_key(user_id)
+        data = get_local(key)
+        if data is None:
+            data = await cache.aget(key)
+            if data is None:
+                try:
+                    user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+                except self.user_model.DoesNotExist:
+                    raise AuthenticationFailed('User not found', code='user_not_found')
+                data = auth_data(user)
+                await cache.aset(key, data, USER_CACHE_SETTINGS['TIMEOUT'])
+            set_local(key, data)
+        self.check_user(data, validated_token)
+        return self.build_user(data)
+
+    def build_user(self, data):
+        """根据缓存的字段构建用户对象，只用于认证和权限判断，其他字段为默认值，不能用来保存"""
+        user = self.user_model(**{name: data[name] for name in AUTH_USER_FIELDS})
+        user._state.adding = False
+        return user
+
+    def check_user(self, data, validated_token):
+        """对缓存中取出的用户数据执行和数据库查询时相同的校验"""
+        if not data['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if data['is_delete']:
+            # 批量软删除在提交后会清除缓存（见users.models.UserQuerySet），这里拦截save()软删除时其他进程的进程内缓存
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != data.get('password_hash'):
+                raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
@@ -0,0 +1,147 @@
+"""
+进程启动时的预热：在处理第一个请求之前加载URL路由、序列化器字段、JWT签名算法、进程内缓存和中间件，
+避免每个新启动的worker的前几个请求出现延迟尖刺。
+在wsgi.py/asgi.py中调用warm_up()；使用gunicorn --preload时在主进程中执行一次，fork出的worker共享预热后的内存，
+warm_up()最后会冻结GC，避免GC扫描这些对象时修改内存页导致写时复制
+"""
+import gc
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.urls import URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+WARMUP_SETTINGS = {
+    # 是否在启动时预热
+    'ENABLED': True,
+    # fork出worker后是否立即打开数据库连接（需要CONN_MAX_AGE大于0才能在请求中复用）
+    'CONNECT': True,
+    # 预热后冻结GC，预热时创建的对象不再被GC扫描
+    'FREEZE_GC': True,
+    # 预热时通过完整的中间件处理的请求（不需要登录的接口），加载中间件中延迟导入的模块
+    'PATHS': ['/user/area'],
+    **getattr(settings, 'WARMUP', {}),
+}
+
+# 最近一次预热各步骤的耗时（毫秒）
+timings = {}
+
+
+def iter_patterns(patterns):
+    for pattern in patterns:
+        # 编译路由的正则表达式
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            yield from iter_patterns(pattern.url_patterns)
+        else:
+            yield pattern
+
+
+def warm_urls():
+    """加载所有的视图，编译所有路由，生成反向解析的数据"""
+    resolver = get_resolver()
+    patterns = list(iter_patterns(resolver.url_patterns))
+    resolver.reverse_dict
+    return patterns
+
+
+def warm_serializers(patterns):
+    """创建每个DRF视图的序列化器，生成字段（ModelSerializer根据模型推断字段）"""
+    seen = set()
+    for pattern in patterns:
+        view = getattr(pattern.callback, 'cls', None)
+        serializer_class = getattr(view, 'serializer_class', None)
+        if serializer_class is None or serializer_class in seen:
+            continue
+        seen.add(serializer_class)
+        serializer_class().fields
+        # 视图中使用的认证、权限、限流和分页类
+        for name in ('authentication_classes', 'permission_classes', 'throttle_classes'):
+            for cls in getattr(view, name, ()):
+                cls()
+        if getattr(view, 'pagination_class', None) is not None:
+            view.pagination_class()
+    # 只读接口的读取计划
+    from users.serializers import addr_plan, user_plan
+    for plan in (user_plan, addr_plan):
+        plan.build()
+
+
+def warm_jwt():
+    """加载DRF的默认配置和JWT的签名算法，生成并校验一次token"""
+    from rest_framework.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    for name in ('DEFAULT_AUTHENTICATION_CLASSES', 'DEFAULT_PERMISSION_CLASSES', 'DEFAULT_RENDERER_CLASSES',
+                 'DEFAULT_PARSER_CLASSES', 'DEFAULT_FILTER_BACKENDS'):
+        getattr(api_settings, name)
+    AccessToken(str(AccessToken()))
+
+
+def warm_caches():
+    """加载进程内的缓存：地区树和商品搜索索引"""
+    from goods.search import get_index
+    from users.regions import get_tree
+
+    get_tree()
+    get_index()
+
+
+def warm_requests():
+    from django.test import Client
+
+    from common.metrics import registry
+
+    # 使用允许的域名，避免请求被ALLOWED_HOSTS拒绝
+    host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')), 'localhost')
+    client = Client(HTTP_HOST=host, raise_request_exception=False)
+    for path in WARMUP_SETTINGS['PATHS']:
+        client.get(path)
+    # 预热的请求不计入接口耗时统计
+    registry.reset()
+
+
+def warm_up():
+    if not WARMUP_SETTINGS['ENABLED']:
+        return timings
+    start = time.perf_counter()
+    patterns = []
+    steps = [
+        ('urls', lambda: patterns.extend(warm_urls())),
+        ('serializers', lambda: warm_serializers(patterns)),
+        ('jwt', warm_jwt),
+        ('caches', warm_caches),
+        ('requests', warm_requests),
+    ]
+    for name, step in steps:
+        begin = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            # 预热失败不影响启动，第一个请求时再加载
+            logger.exception('预热失败：%s', name)
+        timings[name] = round((time.perf_counter() - begin) * 1000, 3)
+    # 预热时打开的数据库连接不能被fork出的子进程共享
+    connections.close_all()
+    if WARMUP_SETTINGS['FREEZE_GC']:
+        gc.collect()
+        gc.freeze()
+    timings['total'] = round((time.perf_counter() - start) * 1000, 3)
+    logger.info('进程%d预热完成：%s', os.getpid(), timings)
+    return timings
+
+
+def post_fork():
+    """fork出worker后调用（gunicorn的post_fork钩子），提前打开数据库连接"""
+    if not WARMUP_SETTINGS['ENABLED'] or not WARMUP_SETTINGS['CONNECT'] or not apps.ready:
+        return
+    for alias in connections:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('数据库%s连接失败', alias, exc_info=True)
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class GoodsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'goods'
+
+    def ready(self):
+        from goods.cache import goods_changed
+        from goods.models import Goods, GoodsGroup
+        from goods.search import goods_indexed, goods_unindexed
+        # 商品或分类修改后，使商品的缓存失效
+        for model in (Goods, GoodsGroup):
+            post_save.connect(goods_changed, sender=model, dispatch_uid='goods.invalidate_%s_save' % model.__name__)
+            post_delete.connect(goods_changed, sender=model, dispatch_uid='goods.invalidate_%s_delete' % model.__name__)
+        # 商品修改后更新搜索的增量索引
+        post_save.connect(goods_indexed, sender=Goods, dispatch_uid='goods.search_index_save')
+        post_delete.connect(goods_unindexed, sender=Goods, dispatch_uid='goods.search_index_delete')
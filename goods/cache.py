@@ -0,0 +1,67 @@
+"""
+商品列表和商品详情的读穿透缓存：
+列表的缓存key中带有版本号，任意商品修改（包括下单和取消订单时修改库存和销量）后版本号加一，
+旧版本的缓存不再被读取并自然过期；商品详情的缓存在该商品修改后直接删除
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+GOODS_CACHE_SETTINGS = {
+    'LIST_TIMEOUT': 60,
+    'DETAIL_TIMEOUT': 300,
+    **getattr(settings, 'GOODS_CACHE', {}),
+}
+
+LIST_VERSION_KEY = 'goods:list:version'
+
+
+def new_version():
+    # 版本号丢失（如缓存被清空）后从当前时间重新开始，不会和旧的版本号重复
+    return int(time.time() * 1000)
+
+
+def get_list_version():
+    version = cache.get(LIST_VERSION_KEY)
+    if version is None:
+        cache.add(LIST_VERSION_KEY, new_version(), None)
+        version = cache.get(LIST_VERSION_KEY)
+    return version
+
+
+def bump_list_version():
+    try:
+        cache.incr(LIST_VERSION_KEY)
+    except ValueError:
+        cache.set(LIST_VERSION_KEY, new_version(), None)
+
+
+def list_cache_key(params):
+    """
+    列表的缓存key：版本号 + 规范化后的筛选、排序和分页参数（params为{参数名: 值}），
+    由视图只取白名单中的参数，其他参数和参数的顺序不会产生新的缓存
+    """
+    raw = '&'.join('%s=%s' % (name, params[name]) for name in sorted(params))
+    return 'goods:list:v%s:%s' % (get_list_version(), hashlib.md5(raw.encode()).hexdigest())
+
+
+def detail_cache_key(pk):
+    return 'goods:detail:%s' % pk
+
+
+def get_or_set(key, build, timeout):
+    """读穿透：缓存中没有数据时调用build生成并写入缓存"""
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout)
+    return data
+
+
+def goods_changed(sender, instance, **kwargs):
+    """商品或分类修改、删除后，使列表缓存和该商品的详情缓存失效"""
+    bump_list_version()
+    if sender.__name__ == 'Goods':
+        cache.delete(detail_cache_key(instance.pk))
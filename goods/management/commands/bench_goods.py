@@ -0,0 +1,80 @@
+import json
+import random
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management.base import CommandError
+
+from common.bench import BenchCommand, bench_client, summarize
+from goods.models import Goods, GoodsGroup
+
+
+class Command(BenchCommand):
+    help = '生成大量商品数据，测试商品列表首页和深度翻页的p50/p99延迟（分别测试无缓存和有缓存）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--rounds', type=int, default=200)
+        parser.add_argument('--depth', type=int, default=50, help='深度翻页时连续翻页的页数')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        self.seed(options['products'], options['groups'], options['batch_size'])
+        client = bench_client()
+        group_ids = list(GoodsGroup.objects.values_list('id', flat=True))
+        orderings = ['-id', 'price', '-price', '-sales']
+
+        def first_pages():
+            return ['/goods/?group=%d&ordering=%s' % (random.choice(group_ids), random.choice(orderings))
+                    for _ in range(options['rounds'])]
+
+        result = {'products': Goods.objects.count()}
+        cache.clear()
+        urls = first_pages()
+        result['first_page_cold'] = summarize(self.fetch(client, urls))
+        result['first_page_warm'] = summarize(self.fetch(client, urls))
+
+        # 沿着next链接连续翻页，每一页的耗时应当和第一页接近
+        samples = []
+        url = '/goods/?ordering=-sales'
+        for _ in range(options['depth']):
+            start = time.perf_counter()
+            response = client.get(url)
+            samples.append(time.perf_counter() - start)
+            self.check_response(response)
+            data = response.json()
+            if not data['next']:
+                break
+            url = data['next']
+        result['deep_pages_cold'] = summarize(samples)
+        self.stdout.write(json.dumps(result, indent=2))
+
+    def fetch(self, client, urls):
+        samples = []
+        for url in urls:
+            start = time.perf_counter()
+            response = client.get(url)
+            samples.append(time.perf_counter() - start)
+            self.check_response(response)
+        return samples
+
+    @staticmethod
+    def check_response(response):
+        if response.status_code != 200:
+            raise CommandError('请求失败%d：%s' % (response.status_code, response.content.decode()[:200]))
+
+    def seed(self, count, groups, batch_size):
+        for i in range(GoodsGroup.objects.count(), groups):
+            GoodsGroup.objects.create(name='分类%d' % i)
+        group_ids = list(GoodsGroup.objects.values_list('id', flat=True))
+        rnd = random.Random(0)
+        for offset in range(Goods.objects.count(), count, batch_size):
+            Goods.objects.bulk_create([
+                Goods(group_id=rnd.choice(group_ids), title='测试商品%d' % n, is_on=rnd.random() < 0.9,
+                      price=Decimal(rnd.randint(100, 1000000)) / 100, stock=rnd.randint(0, 1000),
+                      sales=rnd.randint(0, 100000))
+                for n in range(offset, min(offset + batch_size, count))
+            ])
+            self.stdout.write('已生成 %d 个商品' % min(offset + batch_size, count))
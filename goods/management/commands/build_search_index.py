@@ -0,0 +1,21 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from goods.models import Goods
+from goods.search import SEARCH_SETTINGS, build_index
+
+
+class Command(BaseCommand):
+    help = '从数据库全量生成商品搜索的索引文件，运行中的进程会在RELOAD_INTERVAL秒内加载新的索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help='索引文件的路径，默认使用GOODS_SEARCH中的INDEX_PATH')
+
+    def handle(self, *args, **options):
+        path = options['path'] or SEARCH_SETTINGS['INDEX_PATH']
+        start = time.perf_counter()
+        header = build_index(Goods.objects.filter(is_on=True), path)
+        self.stdout.write('已索引 %d 个商品，文件大小 %.1f MB，耗时 %.1f 秒' % (
+            header['docs'], os.path.getsize(path) / 1024 / 1024, time.perf_counter() - start))
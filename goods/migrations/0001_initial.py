@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoodsGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('is_delete', models.BooleanField(default=False, verbose_name='删除标记')),
+                ('name', models.CharField(max_length=20, verbose_name='分类名称')),
+                ('image', models.ImageField(blank=True, null=True, upload_to='', verbose_name='分类图标')),
+                ('status', models.BooleanField(default=True, verbose_name='是否启用')),
+            ],
+            options={
+                'verbose_name': '商品分类表',
+                'db_table': 'goods_group',
+            },
+        ),
+        migrations.CreateModel(
+            name='Goods',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('is_delete', models.BooleanField(default=False, verbose_name='删除标记')),
+                ('title', models.CharField(max_length=200, verbose_name='商品名称')),
+                ('desc', models.CharField(blank=True, default='', max_length=200, verbose_name='商品描述')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='商品价格')),
+                ('cover', models.ImageField(blank=True, null=True, upload_to='', verbose_name='封面图')),
+                ('stock', models.IntegerField(default=0, verbose_name='库存')),
+                ('sales', models.IntegerField(default=0, verbose_name='销量')),
+                ('is_on', models.BooleanField(default=False, verbose_name='是否上架')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='goods.goodsgroup', verbose_name='所属分类')),
+            ],
+            options={
+                'verbose_name': '商品表',
+                'db_table': 'goods',
+                'indexes': [models.Index(fields=['group', 'is_on', 'price', 'id'], name='goods_group_price_idx'), models.Index(fields=['group', 'is_on', 'sales', 'id'], name='goods_group_sales_idx'), models.Index(fields=['is_on', 'price', 'id'], name='goods_on_price_idx'), models.Index(fields=['is_on', 'sales', 'id'], name='goods_on_sales_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='goods',
+            name='goods_group_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='goods',
+            name='goods_group_sales_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='goods',
+            name='goods_on_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='goods',
+            name='goods_on_sales_idx',
+        ),
+        migrations.AddIndex(
+            model_name='goods',
+            index=models.Index(fields=['is_delete', 'group', 'is_on', 'price', 'id'], name='goods_group_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goods',
+            index=models.Index(fields=['is_delete', 'group', 'is_on', 'sales', 'id'], name='goods_group_sales_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goods',
+            index=models.Index(fields=['is_delete', 'is_on', 'price', 'id'], name='goods_on_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goods',
+            index=models.Index(fields=['is_delete', 'is_on', 'sales', 'id'], name='goods_on_sales_idx'),
+        ),
+    ]
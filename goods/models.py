@@ -1,3 +1,38 @@
 from django.db import models
+from common.db import BaseModel
+
 
 # Create your models here.
+class GoodsGroup(BaseModel):
+    """商品分类模型"""
+    name = models.CharField(verbose_name='分类名称', max_length=20)
+    image = models.ImageField(verbose_name='分类图标', blank=True, null=True)
+    status = models.BooleanField(verbose_name='是否启用', default=True)
+
+    class Meta:
+        db_table = 'goods_group'
+        verbose_name = '商品分类表'
+
+
+class Goods(BaseModel):
+    """商品模型"""
+    group = models.ForeignKey('GoodsGroup', verbose_name='所属分类', on_delete=models.CASCADE)
+    title = models.CharField(verbose_name='商品名称', max_length=200)
+    desc = models.CharField(verbose_name='商品描述', max_length=200, blank=True, default='')
+    price = models.DecimalField(verbose_name='商品价格', max_digits=10, decimal_places=2)
+    cover = models.ImageField(verbose_name='封面图', blank=True, null=True)
+    stock = models.IntegerField(verbose_name='库存', default=0)
+    sales = models.IntegerField(verbose_name='销量', default=0)
+    is_on = models.BooleanField(verbose_name='是否上架', default=False)
+
+    class Meta:
+        db_table = 'goods'
+        verbose_name = '商品表'
+        indexes = [
+            # 商品列表的常用筛选和排序：分类 + 上架状态 + 价格/销量，最后一列id用于游标分页；
+            # 默认管理器的每个查询都带有is_delete = 0，放在第一列（MySQL不支持部分索引）
+            models.Index(fields=['is_delete', 'group', 'is_on', 'price', 'id'], name='goods_group_price_idx'),
+            models.Index(fields=['is_delete', 'group', 'is_on', 'sales', 'id'], name='goods_group_sales_idx'),
+            models.Index(fields=['is_delete', 'is_on', 'price', 'id'], name='goods_on_price_idx'),
+            models.Index(fields=['is_delete', 'is_on', 'sales', 'id'], name='goods_on_sales_idx'),
+        ]
@@ -0,0 +1,379 @@
+"""
+商品搜索：内存中的倒排索引（词 -> 商品id列表），BM25排序和商品名称的前缀联想。
+
+索引分为两部分：
+1. 基础索引：由build_search_index命令从数据库全量生成并写入文件，启动时通过mmap映射，不需要读入内存；
+2. 增量索引：进程启动后通过商品的保存、删除信号维护，覆盖基础索引中的同一商品。
+   增量索引只在修改商品的进程中，其他worker进程要等重新生成索引文件后才能搜索到新增、修改的商品，
+   需要定时运行build_search_index（各进程在RELOAD_INTERVAL秒内加载新文件）；
+   下架、删除的商品在返回结果前会按数据库过滤，不会出现在其他进程的搜索结果中。
+中文按相邻两个字切分（bigram），索引中同时保留单个汉字，用于只有一个字的查询；英文和数字按单词切分。
+"""
+import bisect
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict, namedtuple
+from operator import itemgetter
+
+from django.conf import settings
+
+SEARCH_SETTINGS = {
+    # 索引文件的路径
+    'INDEX_PATH': os.path.join(settings.BASE_DIR, 'data', 'goods_search.idx'),
+    # 每隔多少秒检查一次索引文件是否被重新生成
+    'RELOAD_INTERVAL': 30,
+    **getattr(settings, 'GOODS_SEARCH', {}),
+}
+
+TOKEN_RE = re.compile(r'[一-鿿]+|[a-z0-9]+')
+MAGIC = b'GSIDX001'
+# BM25的参数
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text, query=False):
+    """
+    中文连续的汉字切分为bigram，英文和数字按单词切分。
+    索引时同时保留每个汉字，查询时只有单个汉字才按单字查询，多个汉字只使用bigram
+    """
+    tokens = []
+    for run in TOKEN_RE.findall(text.lower()):
+        if run[0] >= '一' and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            if not query:
+                tokens.extend(run)
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def document_text(goods):
+    return '%s %s' % (goods.title, goods.desc)
+
+
+def term_weights(text, avgdl):
+    """
+    计算商品中每个词的BM25词频部分 tf*(k1+1)/(tf+k1*(1-b+b*dl/avgdl))，
+    生成索引时预先算好，查询时只需要乘以词的idf再相加
+    """
+    tf = Counter(tokenize(text))
+    norm = K1 * (1 - B + B * sum(tf.values()) / (avgdl or 1.0))
+    return {term: count * (K1 + 1) / (count + norm) for term, count in tf.items()}
+
+
+# 增量索引中的商品：每个词的权重、标题、销量和修改时间；weights为None表示该商品已被删除
+DeltaDoc = namedtuple('DeltaDoc', ['weights', 'title', 'sales', 'time'])
+
+
+class Segment:
+    """
+    mmap映射的基础索引文件。文件结构：
+    MAGIC | 头部长度(8字节) | 头部JSON | 各个数组区（按8字节对齐）
+    词表按UTF-8字节序排序，查询时二分查找，不需要在内存中构建字典
+    """
+
+    def __init__(self, path=None):
+        self.header = {'docs': 0, 'avgdl': 0.0, 'built_at': 0.0}
+        self.mm = None
+        self.sections = {}
+        if path and os.path.exists(path):
+            self.open(path)
+
+    def open(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:8] != MAGIC:
+            raise ValueError('无效的索引文件：%s' % path)
+        (length,) = struct.unpack('<Q', self.mm[8:16])
+        self.header = json.loads(self.mm[16:16 + length].decode())
+        view = memoryview(self.mm)
+        for name, (typecode, start, end) in self.header['sections'].items():
+            self.sections[name] = view[start:end].cast(typecode) if typecode != 'B' else view[start:end]
+
+    @property
+    def terms(self):
+        return len(self.sections['term_offsets']) - 1 if self.sections else 0
+
+    def term_at(self, i):
+        offsets = self.sections['term_offsets']
+        return bytes(self.sections['term_blob'][offsets[i]:offsets[i + 1]])
+
+    def find_term(self, term):
+        """二分查找词在词表中的位置，不存在时返回-1"""
+        target = term.encode()
+        lo, hi = 0, self.terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term_at(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.terms and self.term_at(lo) == target else -1
+
+    def postings(self, term):
+        """返回(商品id数组, 权重数组)"""
+        i = self.find_term(term) if self.sections else -1
+        if i < 0:
+            return (), ()
+        start, end = self.sections['term_postings'][i], self.sections['term_postings'][i + 1]
+        return self.sections['post_ids'][start:end], self.sections['post_weights'][start:end]
+
+    def title_range(self, prefix):
+        """按标题前缀查找，返回(标题排序后的位置范围)"""
+        if not self.sections:
+            return range(0)
+        keys = _TitleKeys(self)
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix + '\U0010ffff')
+        return range(lo, hi)
+
+    def title_at(self, i):
+        offsets = self.sections['title_offsets']
+        return bytes(self.sections['title_blob'][offsets[i]:offsets[i + 1]]).decode()
+
+    def close(self):
+        """立即解除映射，只能在没有线程使用该索引时调用；索引被替换时不调用，由引用计数在最后一个读者结束后释放"""
+        self.sections = {}
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+
+class _TitleKeys:
+    """让bisect可以直接在mmap中的标题数组上二分查找"""
+
+    def __init__(self, segment):
+        self.segment = segment
+
+    def __len__(self):
+        return len(self.segment.sections['title_docs'])
+
+    def __getitem__(self, i):
+        return self.segment.title_at(i).lower()
+
+
+def write_segment(path, documents):
+    """
+    将商品写入索引文件，documents为(商品id, 索引文本, 标题, 销量)的可迭代对象。
+    先写入临时文件再重命名，正在使用旧文件的进程不受影响
+    """
+    # 第一遍统计文档长度，得到平均长度后才能计算每个词的权重
+    documents = sorted(documents)
+    lengths = [len(tokenize(text)) for _, text, _, _ in documents]
+    avgdl = sum(lengths) / len(lengths) if lengths else 0.0
+    postings = defaultdict(list)
+    titles = []
+    for doc_id, text, title, sales in documents:
+        for term, weight in term_weights(text, avgdl).items():
+            postings[term].append((doc_id, weight))
+        titles.append((title.lower(), title, doc_id, sales))
+
+    terms = sorted(postings, key=str.encode)
+    term_blob, term_offsets, term_postings = bytearray(), array('I', [0]), array('I', [0])
+    post_ids, post_weights = array('q'), array('f')
+    for term in terms:
+        term_blob += term.encode()
+        term_offsets.append(len(term_blob))
+        for doc_id, weight in postings.pop(term):
+            post_ids.append(doc_id)
+            post_weights.append(weight)
+        term_postings.append(len(post_ids))
+
+    titles.sort()
+    title_blob, title_offsets = bytearray(), array('I', [0])
+    title_docs, title_sales = array('q'), array('I')
+    for _, title, doc_id, sales in titles:
+        title_blob += title.encode()
+        title_offsets.append(len(title_blob))
+        title_docs.append(doc_id)
+        title_sales.append(max(0, min(sales, 2 ** 32 - 1)))
+
+    blocks = [
+        ('term_blob', term_blob), ('term_offsets', term_offsets), ('term_postings', term_postings),
+        ('post_ids', post_ids), ('post_weights', post_weights),
+        ('title_blob', title_blob), ('title_offsets', title_offsets),
+        ('title_docs', title_docs), ('title_sales', title_sales),
+    ]
+    header = {
+        'docs': len(documents),
+        'avgdl': avgdl,
+        'built_at': time.time(),
+        'sections': {},
+    }
+    # 头部中需要记录各个数组区的位置，先按最大长度预留头部空间再计算偏移
+    header_size = 4096 + 64 * len(blocks)
+    offset = 16 + header_size
+    for name, data in blocks:
+        size = len(data) * (data.itemsize if isinstance(data, array) else 1)
+        typecode = data.typecode if isinstance(data, array) else 'B'
+        header['sections'][name] = (typecode, offset, offset + size)
+        offset += size + (-size) % 8
+    raw_header = json.dumps(header).encode().ljust(header_size)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', header_size) + raw_header)
+        for name, data in blocks:
+            raw = data.tobytes() if isinstance(data, array) else bytes(data)
+            f.write(raw + b'\0' * ((-len(raw)) % 8))
+    os.replace(tmp, path)
+    return header
+
+
+class SearchIndex:
+    """基础索引 + 增量索引，线程安全"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.base = Segment(path)
+        self.mtime = self.file_mtime()
+        self.checked_at = time.monotonic()
+        self.delta = {}
+        self.delta_terms = defaultdict(set)
+
+    def file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns if self.path else None
+        except OSError:
+            return None
+
+    def maybe_reload(self):
+        """索引文件被重新生成后重新映射，只保留文件生成之后的增量修改"""
+        now = time.monotonic()
+        if now - self.checked_at < SEARCH_SETTINGS['RELOAD_INTERVAL']:
+            return
+        self.checked_at = now
+        mtime = self.file_mtime()
+        if mtime == self.mtime:
+            return
+        base = Segment(self.path)
+        with self.lock:
+            # 正在查询的线程仍持有旧索引和其中的memoryview，不能关闭旧的mmap，
+            # 最后一个引用释放后旧索引的sections和mmap随之释放
+            self.base, self.mtime = base, mtime
+            built_at = base.header['built_at']
+            for doc_id, doc in list(self.delta.items()):
+                if doc.time <= built_at:
+                    self.drop_delta(doc_id)
+
+    def drop_delta(self, doc_id):
+        doc = self.delta.pop(doc_id, None)
+        if doc is not None and doc.weights:
+            for term in doc.weights:
+                self.delta_terms[term].discard(doc_id)
+
+    def update(self, doc_id, text, title, sales):
+        """新增或修改商品"""
+        weights = term_weights(text, self.base.header['avgdl'])
+        with self.lock:
+            self.drop_delta(doc_id)
+            self.delta[doc_id] = DeltaDoc(weights, title, sales, time.time())
+            for term in weights:
+                self.delta_terms[term].add(doc_id)
+
+    def remove(self, doc_id):
+        """删除商品（下架、删除）"""
+        with self.lock:
+            self.drop_delta(doc_id)
+            self.delta[doc_id] = DeltaDoc(None, '', 0, time.time())
+
+    def search(self, query, limit=20):
+        """返回按BM25得分排序的(商品id, 得分)列表"""
+        self.maybe_reload()
+        terms = set(tokenize(query, query=True))
+        if not terms:
+            return []
+        with self.lock:
+            base, delta = self.base, dict(self.delta)
+            delta_terms = {term: set(self.delta_terms.get(term, ())) for term in terms}
+        total = max(1, base.header['docs'] + sum(1 for doc in delta.values() if doc.weights))
+        scores = {}
+        for term in terms:
+            ids, weights = base.postings(term)
+            df = len(ids) + len(delta_terms[term])
+            if not df:
+                continue
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            # 倒排列表可能很长，用zip/map在C中生成得分，只在合并多个词时逐个相加
+            term_scores = dict(zip(ids, map(idf.__mul__, weights)))
+            # 增量索引中的商品覆盖基础索引：被修改或删除的商品去掉基础索引中的得分
+            for doc_id in delta:
+                term_scores.pop(doc_id, None)
+            for doc_id in delta_terms[term]:
+                term_scores[doc_id] = idf * delta[doc_id].weights[term]
+            if len(term_scores) > len(scores):
+                scores, term_scores = term_scores, scores
+            for doc_id, score in term_scores.items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+        return heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+
+    def suggest(self, prefix, limit=10):
+        """按商品标题的前缀联想，返回销量最高的limit个标题"""
+        self.maybe_reload()
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        with self.lock:
+            base, delta = self.base, dict(self.delta)
+        candidates = []
+        positions = base.title_range(prefix)
+        # 前缀过短时匹配的标题可能很多，只取前2000个按销量排序
+        for i in positions[:2000]:
+            doc_id = base.sections['title_docs'][i]
+            if doc_id not in delta:
+                candidates.append((base.sections['title_sales'][i], base.title_at(i)))
+        for doc in delta.values():
+            if doc.weights and doc.title.lower().startswith(prefix):
+                candidates.append((doc.sales, doc.title))
+        seen, result = set(), []
+        for _, title in sorted(candidates, reverse=True):
+            if title not in seen:
+                seen.add(title)
+                result.append(title)
+            if len(result) >= limit:
+                break
+        return result
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """获取当前进程的搜索索引，第一次调用时映射索引文件"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SearchIndex(SEARCH_SETTINGS['INDEX_PATH'])
+    return _index
+
+
+def build_index(queryset, path=None):
+    """从数据库全量生成索引文件"""
+    rows = queryset.values_list('id', 'title', 'desc', 'sales').iterator(chunk_size=5000)
+    documents = ((pk, '%s %s' % (title, desc), title, sales) for pk, title, desc, sales in rows)
+    return write_segment(path or SEARCH_SETTINGS['INDEX_PATH'], documents)
+
+
+def goods_indexed(sender, instance, **kwargs):
+    """商品保存后更新增量索引，只有上架的商品可以被搜索到"""
+    if instance.is_on and not instance.is_delete:
+        get_index().update(instance.pk, document_text(instance), instance.title, instance.sales)
+    else:
+        get_index().remove(instance.pk)
+
+
+def goods_unindexed(sender, instance, **kwargs):
+    get_index().remove(instance.pk)
@@ -0,0 +1,16 @@
+from rest_framework import serializers
+from goods.models import Goods, GoodsGroup
+
+
+class GoodsGroupSerializer(serializers.ModelSerializer):
+    """商品分类的序列化器"""
+    class Meta:
+        model = GoodsGroup
+        fields = ['id', 'name', 'image']
+
+
+class GoodsSerializer(serializers.ModelSerializer):
+    """商品的序列化器"""
+    class Meta:
+        model = Goods
+        fields = ['id', 'group', 'title', 'desc', 'price', 'cover', 'stock', 'sales', 'is_on']
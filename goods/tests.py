@@ -1,3 +1,120 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from cart import storage
+from goods import search
+from goods.models import Goods, GoodsGroup
+from order.services import place_order
+from users.models import Addr, User
+
+
+class SearchIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'goods_search.idx')
+        patcher = mock.patch.dict(search.SEARCH_SETTINGS, RELOAD_INTERVAL=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, documents):
+        search.write_segment(self.path, [(pk, title, title, sales) for pk, title, sales in documents])
+
+    def test_reload_while_searching(self):
+        self.write([(1, '运动鞋', 10), (2, '跑步鞋', 5)])
+        index = search.SearchIndex(self.path)
+        old = index.base
+        # 正在查询的线程持有旧索引中的切片
+        ids, weights = old.postings('运动')
+        self.write([(1, '运动鞋', 10), (2, '跑步鞋', 5), (3, '运动裤', 1)])
+        self.assertEqual([doc_id for doc_id, _ in index.search('运动')], [1, 3])
+        self.assertIsNot(index.base, old)
+        self.assertEqual(list(ids), [1])
+        self.assertEqual(old.title_at(0), '跑步鞋')
+
+    def test_single_character_query(self):
+        self.write([(1, '运动鞋', 10), (2, '皮鞋', 5), (3, '运动裤', 1)])
+        index = search.SearchIndex(self.path)
+        self.assertEqual({doc_id for doc_id, _ in index.search('鞋')}, {1, 2})
+        # 多个汉字只按bigram查询，不会因为单字命中其他商品
+        self.assertEqual([doc_id for doc_id, _ in index.search('皮鞋')], [2])
+        index.update(4, '拖鞋', '拖鞋', 0)
+        self.assertEqual({doc_id for doc_id, _ in index.search('鞋')}, {1, 2, 4})
+
+
+class SearchViewTests(TestCase):
+
+    def test_invalid_limit(self):
+        for limit in ('-1', '0', 'abc'):
+            response = self.client.get('/goods/search', {'q': '鞋', 'limit': limit})
+            self.assertEqual(response.status_code, 422)
+
+
+class GoodsCacheTests(TestCase):
+    """商品列表和详情的缓存：只按白名单中的参数缓存，商品修改和下单后失效"""
+
+    @classmethod
+    def setUpTestData(cls):
+        group = GoodsGroup.objects.create(name='缓存测试')
+        cls.goods = Goods.objects.bulk_create([
+            Goods(group=group, title='缓存测试商品%d' % i, price=Decimal('%d.00' % (i + 1)), stock=10, is_on=True)
+            for i in range(3)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def list_keys(self):
+        return [key for key in cache._cache if ':goods:list:v' in key and not key.endswith(':version')]
+
+    def test_list_key_ignores_other_params(self):
+        first = self.client.get('/goods/', {'ordering': 'price', 'page_size': 2, 'utm': 'a'})
+        self.assertEqual([item['id'] for item in first.json()['results']], [self.goods[0].id, self.goods[1].id])
+        with self.assertNumQueries(0):
+            second = self.client.get('/goods/?utm=b&page_size=2&x=1&ordering=price', HTTP_HOST='example.com')
+        self.assertEqual(second.json()['results'], first.json()['results'])
+        self.assertEqual(len(self.list_keys()), 1)
+        # 下一页的链接按当前请求生成
+        self.assertRegex(second.json()['next'], r'^http://example\.com/goods/\?cursor=.+&utm=b&x=1$')
+        third = self.client.get(second.json()['next'])
+        self.assertEqual([item['id'] for item in third.json()['results']], [self.goods[2].id])
+        self.assertIsNone(third.json()['next'])
+        # 不同的筛选条件分别缓存
+        self.client.get('/goods/', {'ordering': 'price', 'page_size': 2, 'min_price': '2'})
+        self.assertEqual(len(self.list_keys()), 3)
+
+    def test_detail_cache_and_invalidation(self):
+        goods = self.goods[0]
+        self.client.get('/goods/%d' % goods.id)
+        self.client.get('/goods/')
+        with self.assertNumQueries(0):
+            self.client.get('/goods/%d' % goods.id)
+            self.client.get('/goods/')
+        goods.title = '修改后的标题'
+        goods.save()
+        self.assertEqual(self.client.get('/goods/%d' % goods.id).json()['title'], '修改后的标题')
+        self.assertIn('修改后的标题', [item['title'] for item in self.client.get('/goods/').json()['results']])
+
+    def test_order_invalidates_stock(self):
+        goods = self.goods[0]
+        self.client.get('/goods/%d' % goods.id)
+        self.client.get('/goods/')
+        user = User.objects.create(username='goods_cache')
+        addr = Addr.objects.create(user=user, phone='13800000000', name='测试', province='广东省', city='深圳市',
+                                   county='南山区', address='测试地址')
+        storage.set_item(user.id, goods.id, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(user.id, addr.id)
+        # 库存和销量通过update修改，列表和详情的缓存同样失效
+        detail = self.client.get('/goods/%d' % goods.id).json()
+        self.assertEqual((detail['stock'], detail['sales']), (7, 3))
+        listed = {item['id']: item for item in self.client.get('/goods/').json()['results']}
+        self.assertEqual((listed[goods.id]['stock'], listed[goods.id]['sales']), (7, 3))
@@ -0,0 +1,15 @@
+from django.urls import path
+from goods import views
+
+urlpatterns = [
+    # 商品列表
+    path('', views.GoodsView.as_view({'get': 'list'})),
+    # 商品详情
+    path('<int:pk>', views.GoodsView.as_view({'get': 'retrieve'})),
+    # 商品分类列表
+    path('group', views.GoodsGroupView.as_view({'get': 'list'})),
+    # 商品搜索
+    path('search', views.GoodsSearchView.as_view()),
+    # 搜索联想
+    path('suggest', views.GoodsSuggestView.as_view()),
+]
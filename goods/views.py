@@ -1,3 +1,111 @@
-from django.shortcuts import render
+from collections import OrderedDict
 
-# Create your views here.
+from django_filters import rest_framework as filters
+from rest_framework import mixins, status
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+from rest_framework.viewsets import GenericViewSet
+
+from common.pagination import KeysetPagination
+from goods.cache import GOODS_CACHE_SETTINGS, detail_cache_key, get_or_set, list_cache_key
+from goods.models import Goods, GoodsGroup
+from goods.search import get_index
+from goods.serializers import GoodsSerializer, GoodsGroupSerializer
+
+
+class GoodsFilter(filters.FilterSet):
+    """商品列表的过滤：分类、价格区间"""
+    min_price = filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = filters.NumberFilter(field_name='price', lookup_expr='lte')
+
+    class Meta:
+        model = Goods
+        fields = ['group', 'min_price', 'max_price']
+
+
+class GoodsPagination(KeysetPagination):
+    """商品列表的游标分页，通过ordering参数指定排序：-id（默认）、price、-price、-sales"""
+    ordering_query_param = 'ordering'
+    orderings = {
+        '-id': ('-id',),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        '-sales': ('-sales', '-id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        return self.orderings.get(request.query_params.get(self.ordering_query_param), self.ordering)
+
+
+class GoodsView(GenericViewSet, mixins.ListModelMixin, mixins.RetrieveModelMixin):
+    """商品视图集：商品列表和商品详情"""
+    queryset = Goods.objects.filter(is_on=True)
+    serializer_class = GoodsSerializer
+    filterset_class = GoodsFilter
+    pagination_class = GoodsPagination
+
+    def list_cache_params(self, request):
+        """列表缓存key使用的参数：只取筛选、排序和分页参数，并规范化排序和每页数量"""
+        params, paginator = request.query_params, self.paginator
+        values = {name: params[name] for name in self.filterset_class.base_filters if params.get(name)}
+        values['ordering'] = ','.join(paginator.get_ordering(request, None, self))
+        values['page_size'] = paginator.get_page_size(request)
+        if params.get(paginator.cursor_query_param):
+            values['cursor'] = params[paginator.cursor_query_param]
+        return values
+
+    def list(self, request, *args, **kwargs):
+        # 列表页的数据缓存在Django缓存中，商品修改后失效
+        def build():
+            data = super(GoodsView, self).list(request, *args, **kwargs).data
+            # 缓存中只保存下一页的游标，下一页的链接按当前请求的url生成，不包含其他请求的参数和域名
+            paginator = self.paginator
+            cursor = paginator.encode_cursor(paginator.next_position) if paginator.has_next else None
+            return {'cursor': cursor, 'results': data['results']}
+
+        data = get_or_set(list_cache_key(self.list_cache_params(request)), build, GOODS_CACHE_SETTINGS['LIST_TIMEOUT'])
+        cursor = data['cursor']
+        next_link = cursor and replace_query_param(request.build_absolute_uri(), self.paginator.cursor_query_param,
+                                                   cursor)
+        return Response(OrderedDict([('next', next_link), ('results', data['results'])]))
+
+    def retrieve(self, request, *args, **kwargs):
+        data = get_or_set(detail_cache_key(kwargs['pk']),
+                          lambda: super(GoodsView, self).retrieve(request, *args, **kwargs).data,
+                          GOODS_CACHE_SETTINGS['DETAIL_TIMEOUT'])
+        return Response(data)
+
+
+class GoodsGroupView(GenericViewSet, mixins.ListModelMixin):
+    """商品分类视图集"""
+    queryset = GoodsGroup.objects.filter(status=True)
+    serializer_class = GoodsGroupSerializer
+
+
+class GoodsSearchView(APIView):
+    """商品搜索：按关键词搜索上架的商品，结果按BM25得分排序"""
+    max_limit = 100
+
+    def get(self, request):
+        keyword = request.query_params.get('q', '').strip()
+        if not keyword:
+            return Response({'error': '请输入搜索关键词'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), self.max_limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({'error': 'limit参数有误'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        ranked = get_index().search(keyword, limit)
+        # 一次查询取出所有命中的商品，再按得分的顺序返回
+        goods = Goods.objects.filter(is_on=True).in_bulk([pk for pk, _ in ranked])
+        results = [goods[pk] for pk, _ in ranked if pk in goods]
+        return Response({'results': GoodsSerializer(results, many=True).data})
+
+
+class GoodsSuggestView(APIView):
+    """搜索框的联想：按输入的前缀返回销量最高的商品标题"""
+
+    def get(self, request):
+        return Response(get_index().suggest(request.query_params.get('q', ''), 10))
@@ -0,0 +1,21 @@
+"""
+gunicorn的配置：gunicorn -c gunicorn.conf.py hyy_python.wsgi:application
+主进程中加载应用并预热（hyy_python/wsgi.py），fork出的worker直接处理请求
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hyy_python.settings')
+
+bind = os.environ.get('HYY_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('HYY_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# 在主进程中加载应用，worker通过写时复制共享预热后的内存
+preload_app = True
+# worker处理一定数量的请求后重启，避免内存持续增长；重启的worker从主进程fork，不需要重新预热
+max_requests = 10000
+max_requests_jitter = 1000
+
+
+def post_fork(server, worker):
+    from common.warmup import post_fork
+    post_fork()
@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hyy_python.settings')
+# 通过ASGI部署时，用户相关的接口使用异步视图
+os.environ.setdefault('HYY_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+# 在处理第一个请求之前预热；使用gunicorn --preload时在主进程中执行，worker共享预热的结果
+from common.warmup import warm_up  # noqa: E402
+
+warm_up()
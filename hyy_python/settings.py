@@ -10,9 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from datetime import timedelta
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -49,6 +52,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 请求耗时统计，放在第一个，统计的耗时包含其他中间件
+    'common.metrics.MetricsMiddleware',
+    # 读写分离时，记录请求中是否写入过数据
+    'common.router.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +88,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'hyy_python.wsgi.application'
 
+# 是否使用异步视图，由asgi.py设置，通过ASGI部署时为True
+ASYNC_VIEWS = os.environ.get('HYY_ASYNC_VIEWS') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -92,11 +102,56 @@ DATABASES = {
         'USER': 'root',
         'PASSWORD': '123456',
         'HOST': 'localhost',
-        'PORT': 3306
-    }
+        'PORT': 3306,
+        # 连接在请求之间复用的时间（秒），每个请求开始时检查复用的连接是否可用
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # 从库，配置后需要加入DB_ROUTER的REPLICAS中
+    # 'replica1': {
+    #     'ENGINE': 'django.db.backends.mysql',
+    #     'NAME': 'ceshi',
+    #     'USER': 'readonly',
+    #     'PASSWORD': '123456',
+    #     'HOST': 'replica1',
+    #     'PORT': 3306,
+    #     'CONN_MAX_AGE': 60,
+    #     'CONN_HEALTH_CHECKS': True,
+    # },
+}
+
+# 读写分离：写操作使用主库（default），读操作使用从库
+DATABASE_ROUTERS = ['common.router.PrimaryReplicaRouter']
+DB_ROUTER = {
+    "REPLICAS": [],  # 从库的别名，例如['replica1']，为空时只使用主库；配置从库时CACHES需要使用Redis等共享缓存
+    "PIN_SECONDS": 5,  # 用户写入数据后，读操作使用主库的时间（秒），应大于主从复制的延迟
+    "PIN_COOKIE": "db_pin",  # 写入数据后设置的cookie，未登录的客户端按cookie使用主库
+    "CHECK_INTERVAL": 10,  # 检查从库是否可用的间隔（秒）
 }
 
 
+# 密码哈希的配置
+PASSWORD_HASHING = {
+    "ALGORITHM": "pbkdf2",  # 新密码使用的算法：pbkdf2、argon2（需要argon2-cffi）、bcrypt（需要bcrypt）
+    "PBKDF2_ITERATIONS": 600000,  # 修改计算强度后，旧密码会在用户下次登录时自动重新哈希
+    "ARGON2_TIME_COST": 2,
+    "ARGON2_MEMORY_COST": 102400,
+    "ARGON2_PARALLELISM": 8,
+    "BCRYPT_ROUNDS": 12,
+    "OFFLOAD_WORKERS": 2,  # ASGI中计算哈希的进程数
+}
+
+_PASSWORD_HASHER_CHOICES = {
+    'pbkdf2': 'common.hashers.ConfigurablePBKDF2PasswordHasher',
+    'argon2': 'common.hashers.ConfigurableArgon2PasswordHasher',
+    'bcrypt': 'common.hashers.ConfigurableBCryptSHA256PasswordHasher',
+}
+# 第一个为新密码使用的算法，其余的用于校验旧密码
+PASSWORD_HASHERS = [_PASSWORD_HASHER_CHOICES[PASSWORD_HASHING['ALGORITHM']]] + [
+    hasher for name, hasher in _PASSWORD_HASHER_CHOICES.items() if name != PASSWORD_HASHING['ALGORITHM']
+]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -139,6 +194,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # 运行所有用户跨域请求
 CORS_ORIGIN_ALLOW_ALL = True
+# 允许跨域请求携带幂等处理的请求头
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 # 指定自定义用户模型
 AUTH_USER_MODEL = 'users.User'
@@ -147,12 +204,32 @@ AUTH_USER_MODEL = 'users.User'
 REST_FRAMEWORK = {
     # 配置登录鉴权方式
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',  # 进行token认证
+        'common.token_auth.CachedJWTAuthentication',  # 进行token认证（带用户缓存）
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication'
     ),
     # 配置DRF使用的过滤器
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    # 使用orjson编码和解析JSON（需要安装orjson，未安装时使用DRF自带的实现）
+    'DEFAULT_RENDERER_CLASSES': (
+        'common.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'common.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # 前面的反向代理的层数，按IP限流时从X-Forwarded-For中取最后一层代理添加的客户端IP；
+    # 为0时只使用REMOTE_ADDR（直接对外提供服务时），不能信任客户端自己发送的X-Forwarded-For
+    'NUM_PROXIES': 0,
+    # 限流的频率，设置为None时不限流
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',  # 每个IP的登录次数
+        'login_identifier': '10/min',  # 每个账号的登录次数
+        'register_ip': '20/hour',  # 每个IP的注册次数
+        'verifcode_ip': '30/hour',  # 每个IP发送和校验验证码的次数
+    }
 }
 
 # token的相关配置
@@ -175,6 +252,23 @@ SIMPLE_JWT = {
     "USER_ID_CLAIM": "user_id"
 }
 
+# token认证时用户对象的缓存配置
+JWT_USER_CACHE = {
+    "STATELESS": False,  # 若为True，则直接使用token中的user_id、is_superuser构建用户，不查询数据库
+    "TIMEOUT": 300,  # Django缓存中用户认证字段的有效时间（秒）
+    "LOCAL_TIMEOUT": 5,  # 进程内缓存的有效时间（秒），其他进程中被禁用的用户最多在这段时间内仍能访问，为0时不使用
+    "LOCAL_MAXSIZE": 1024,  # 进程内缓存的最大用户数
+}
+
+# 缓存配置，生产环境可替换为Redis：django.core.cache.backends.redis.RedisCache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # 条目数超过上限时会被淘汰（默认只有300条）；使用Redis时购物车以缓存为主副本，淘汰策略需要设置为noeviction
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+}
+
 # 使用自定义的认证类进行身份认证（登录时验证用户信息）
 AUTHENTICATION_BACKENDS = [
     'common.authenticate.MyBackend'
@@ -184,3 +278,104 @@ AUTHENTICATION_BACKENDS = [
 MEDIA_ROOT = BASE_DIR / 'file/image'
 # 指定文件的获取的url路径
 MEDIA_URL = 'file/image/'
+
+# 文件下载的配置
+FILE_SERVE = {
+    "OFFLOAD": None,  # 'x-accel'：由nginx发送文件（X-Accel-Redirect），'x-sendfile'：使用X-Sendfile
+    "ACCEL_PREFIX": "/protected/image/",  # nginx中指向MEDIA_ROOT的internal location
+    "MAX_AGE": 86400,  # 浏览器缓存的有效时间（秒）
+    "STAT_CACHE_TIMEOUT": 5,  # 文件信息在进程内缓存的时间（秒）
+    "STAT_CACHE_SIZE": 4096,
+}
+
+# 用户头像的缩略图配置
+AVATAR = {
+    "SIZES": (64, 128, 256),  # 预先生成的缩略图尺寸
+    "WORKERS": 2,  # 生成缩略图的后台线程数
+    "MAX_PENDING": 64,  # 最多排队等待生成缩略图的头像数
+    "QUALITY": 85,
+}
+
+# 地区数据的配置
+REGIONS = {
+    "CHECK_INTERVAL": 10,  # 每隔多少秒检查一次地区数据是否被修改
+}
+
+# 手机验证码的配置
+VERIFCODE = {
+    "TIMEOUT": 300,  # 验证码的有效时间（秒）
+    "SEND_INTERVAL": 60,  # 同一手机号两次发送的最小间隔（秒）
+    "MAX_ATTEMPTS": 5,  # 每个验证码最多校验的次数
+    "KEEP_DAYS": 7,  # 发送记录保留的天数，由reap_verifcodes命令清理
+}
+
+# 短信的发送类：common.sms.ConsoleSmsSender（输出到日志）、common.sms.LocmemSmsSender（保存在内存中，用于测试）
+SMS_SENDER = 'common.sms.ConsoleSmsSender'
+
+# 商品缓存的有效时间（秒），商品修改后缓存会立即失效
+GOODS_CACHE = {
+    "LIST_TIMEOUT": 60,
+    "DETAIL_TIMEOUT": 300,
+}
+
+# POST接口的幂等处理（请求头Idempotency-Key）
+IDEMPOTENCY = {
+    "TIMEOUT": 24 * 3600,  # 第一次请求的响应保存的时间（秒）
+    "LOCK_TIMEOUT": 30,  # 请求处理中的标记的有效时间（秒）
+    "WAIT": 5,  # 相同的请求正在处理中时，最多等待的时间（秒）
+}
+
+# 购物车
+CART = {
+    # 是否以缓存为主副本、后台批量写入数据库：None为缓存被多个进程共享（Redis）时启用，进程内缓存时直接读写数据库
+    "WRITE_BEHIND": None,
+    # 购物车在缓存中保存的时间（秒）
+    "TIMEOUT": 7 * 24 * 3600,
+    # 后台线程将修改批量写入数据库的间隔（秒）
+    "FLUSH_INTERVAL": 1.0,
+    "FLUSH_BATCH_SIZE": 500,
+    "MAX_NUMBER": 999,
+    "MAX_ITEMS": 100,
+}
+
+# 购物车的满减活动：金额满threshold元减discount元，同时满足多个时使用优惠最多的一个
+CART_PROMOTIONS = [
+    {"name": "满99减10", "threshold": "99", "discount": "10"},
+    {"name": "满299减40", "threshold": "299", "discount": "40"},
+]
+
+# 订单
+ORDER = {
+    # 订单的支付时间（秒），超时未支付的订单由 python manage.py sweep_orders 取消并归还库存
+    "PAY_TIMEOUT": 15 * 60,
+    # 每次回收的超时订单数
+    "SWEEP_BATCH_SIZE": 500,
+}
+
+# 商品搜索
+GOODS_SEARCH = {
+    # 索引文件，通过 python manage.py build_search_index 生成；商品的修改只进入当前进程的增量索引，
+    # 需要定时重新生成，其他worker进程才能搜索到新增、修改的商品
+    "INDEX_PATH": BASE_DIR / 'data' / 'goods_search.idx',
+    # 每隔多少秒检查一次索引文件是否被重新生成
+    "RELOAD_INTERVAL": 30,
+}
+
+# 请求耗时统计（common.metrics），通过/metrics接口输出
+METRICS = {
+    "SLOW_REQUEST": 0.5,  # 耗时超过多少秒的请求输出警告日志，为None时不检查
+    "MAX_QUERIES": 20,  # SQL查询超过多少次的请求输出警告日志，为None时不检查
+    "SERVER_TIMING": True,  # 是否返回Server-Timing响应头
+    "TOKEN": os.environ.get('HYY_METRICS_TOKEN'),  # 访问/metrics需要的token（Authorization: Bearer <token>）
+    # 不需要token即可访问/metrics的地址或网段，逗号分隔；都没有配置时/metrics拒绝所有请求。
+    # 按REMOTE_ADDR判断，经由本机nginx转发/metrics时所有请求都来自127.0.0.1，此时不要配置本机地址
+    "ALLOWED_IPS": [ip for ip in os.environ.get('HYY_METRICS_ALLOWED_IPS', '').split(',') if ip],
+}
+
+# 进程启动时的预热（common.warmup），通过 python manage.py startup_time 测试效果
+WARMUP = {
+    "ENABLED": os.environ.get('HYY_WARMUP', '1') == '1',
+    "CONNECT": True,  # gunicorn fork出worker后立即打开数据库连接
+    "FREEZE_GC": True,  # 预热后冻结GC，减少--preload时worker的写时复制
+    "PATHS": ['/user/area'],  # 预热时请求的接口（不需要登录），加载中间件和视图中延迟导入的模块
+}
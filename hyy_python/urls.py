@@ -14,13 +14,22 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include, re_path
 # 获取文件的视图
 from users.views import FileView
+from users.async_views import file_view
+from common.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    re_path(r'file/image/(.+?)/', FileView.as_view()),
-    path('user/', include('users.urls'))
+    # 通过ASGI部署时使用异步视图
+    re_path(r'file/image/(.+?)/', file_view if settings.ASYNC_VIEWS else FileView.as_view()),
+    path('user/', include('users.urls')),
+    path('goods/', include('goods.urls')),
+    path('cart/', include('cart.urls')),
+    path('order/', include('order.urls')),
+    # Prometheus抓取的接口耗时统计
+    path('metrics', metrics_view)
 ]
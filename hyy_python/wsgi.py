@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hyy_python.settings')
 
 application = get_wsgi_application()
+
+# 在处理第一个请求之前预热；使用gunicorn --preload时在主进程中执行，worker共享预热的结果
+from common.warmup import warm_up  # noqa: E402
+
+warm_up()
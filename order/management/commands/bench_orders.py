@@ -0,0 +1,89 @@
+import json
+import threading
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import close_old_connections
+from django.db.models import Sum
+
+from cart import storage
+from common.bench import BenchCommand, summarize
+from goods.models import Goods, GoodsGroup
+from order.models import Order, OrderGoods
+from order.services import OrderError, place_order, sweep_expired_orders
+from users.models import User, Addr
+
+
+class Command(BenchCommand):
+    help = '秒杀压力测试：多个线程同时购买同一个商品，检查是否超卖，并统计每秒的下单数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=200)
+        parser.add_argument('--stock', type=int, default=100)
+        parser.add_argument('--number', type=int, default=1, help='每个用户购买的数量')
+
+    def handle(self, *args, **options):
+        buyers = self.seed(options['buyers'])
+        group = GoodsGroup.objects.first() or GoodsGroup.objects.create(name='秒杀测试')
+        goods = Goods.objects.create(group=group, title='秒杀测试商品', price=Decimal('1.00'),
+                                     stock=options['stock'], is_on=True)
+        for user_id, _ in buyers:
+            storage.set_item(user_id, goods.id, options['number'])
+        storage.flusher.flush()
+
+        results = {'ok': 0, 'sold_out': 0, 'error': 0}
+        samples = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(buyers))
+
+        def buyer(user_id, addr_id):
+            barrier.wait()
+            start = time.perf_counter()
+            try:
+                place_order(user_id, addr_id, [goods.id])
+                key = 'ok'
+            except OrderError:
+                key = 'sold_out'
+            except Exception as e:
+                key = 'error'
+                self.stderr.write('下单失败：%r' % e)
+            with lock:
+                results[key] += 1
+                samples.append(time.perf_counter() - start)
+            close_old_connections()
+
+        threads = [threading.Thread(target=buyer, args=buyer_args) for buyer_args in buyers]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        goods.refresh_from_db()
+        sold = OrderGoods.objects.filter(goods=goods).aggregate(total=Sum('number'))['total'] or 0
+        result = dict(results, buyers=len(buyers), stock_before=options['stock'], stock_after=goods.stock,
+                      sold=sold, oversold=max(0, sold - options['stock']),
+                      orders_per_second=round(results['ok'] / elapsed, 1), latency=summarize(samples))
+
+        # 订单全部过期后，回收进程应当归还所有库存
+        Order.objects.filter(lines__goods=goods).update(expire_time='2000-01-01T00:00:00Z')
+        sweep_expired_orders()
+        goods.refresh_from_db()
+        result['stock_after_sweep'] = goods.stock
+        self.stdout.write(json.dumps(result, indent=2))
+
+        if goods.stock != options['stock'] or sold + result['stock_after'] != options['stock'] or result['oversold']:
+            raise CommandError('库存不一致')
+
+    def seed(self, count):
+        cache.clear()
+        for i in range(User.objects.filter(username__startswith='order_bench_').count(), count):
+            user = User.objects.create(username='order_bench_%d' % i)
+            Addr.objects.create(user=user, phone='13800000000', name='测试', province='广东省', city='深圳市',
+                                county='南山区', address='测试地址')
+        users = User.objects.filter(username__startswith='order_bench_').order_by('id')[:count]
+        addrs = dict(Addr.objects.filter(user__in=users).values_list('user_id', 'id'))
+        return [(user.id, addrs[user.id]) for user in users]
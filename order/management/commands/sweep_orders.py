@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from order.services import ORDER_SETTINGS, sweep_expired_orders
+
+
+class Command(BaseCommand):
+    help = '取消超时未支付的订单并归还库存，可以由定时任务执行，或者使用--interval常驻运行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ORDER_SETTINGS['SWEEP_BATCH_SIZE'])
+        parser.add_argument('--interval', type=float, default=0, help='每隔多少秒回收一次，为0时只执行一次')
+
+    def handle(self, *args, **options):
+        while True:
+            count = sweep_expired_orders(options['batch_size'])
+            if count:
+                self.stdout.write('已取消 %d 个超时订单' % count)
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('users', '0008_verifcode_indexes'),
+        ('goods', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('is_delete', models.BooleanField(default=False, verbose_name='删除标记')),
+                ('order_code', models.CharField(max_length=32, unique=True, verbose_name='订单编号')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='商品总金额')),
+                ('discount', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='优惠金额')),
+                ('pay_amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='实付金额')),
+                ('status', models.SmallIntegerField(choices=[(1, '待支付'), (2, '待发货'), (3, '待收货'), (4, '已完成'), (5, '已取消')], default=1, verbose_name='订单状态')),
+                ('expire_time', models.DateTimeField(verbose_name='支付截止时间')),
+                ('pay_time', models.DateTimeField(blank=True, null=True, verbose_name='支付时间')),
+                ('addr', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='users.addr', verbose_name='收货地址')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='下单用户')),
+            ],
+            options={
+                'verbose_name': '订单表',
+                'db_table': 'orders',
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderGoods',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('is_delete', models.BooleanField(default=False, verbose_name='删除标记')),
+                ('number', models.IntegerField(verbose_name='商品数量')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='下单时的单价')),
+                ('goods', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='goods.goods', verbose_name='商品')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='order.order', verbose_name='所属订单')),
+            ],
+            options={
+                'verbose_name': '订单商品表',
+                'db_table': 'order_goods',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'expire_time'], name='order_status_expire_idx'),
+        ),
+    ]
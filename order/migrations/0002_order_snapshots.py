@@ -0,0 +1,105 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Concat
+import django.db.models.deletion
+
+
+def fill_snapshots(apps, schema_editor):
+    """为已有的订单补充收货地址和商品的快照，并统计每个用户各状态的订单数"""
+    Order = apps.get_model('order', 'Order')
+    OrderGoods = apps.get_model('order', 'OrderGoods')
+    OrderCount = apps.get_model('order', 'OrderCount')
+    Addr = apps.get_model('users', 'Addr')
+    Goods = apps.get_model('goods', 'Goods')
+    addr = Addr.objects.filter(pk=OuterRef('addr_id'))
+    Order.objects.filter(addr__isnull=False).update(**{
+        field: Subquery(addr.values(source)[:1])
+        for field, source in (('receiver', 'name'), ('phone', 'phone'), ('province', 'province'),
+                              ('city', 'city'), ('county', 'county'), ('address', 'address'))
+    })
+    goods = Goods.objects.filter(pk=OuterRef('goods_id'))
+    OrderGoods.objects.update(title=Subquery(goods.values('title')[:1]))
+    OrderGoods.objects.filter(goods__cover__gt='').update(
+        cover=Concat(Value(settings.MEDIA_URL), Subquery(goods.values('cover')[:1])))
+
+    fields = {1: 'unpaid', 2: 'paid', 3: 'shipped', 4: 'finished', 5: 'canceled'}
+    counts = {}
+    for row in Order.objects.values('user_id', 'status').annotate(total=Count('id')).order_by():
+        counts.setdefault(row['user_id'], {})[fields[row['status']]] = row['total']
+    OrderCount.objects.bulk_create([OrderCount(user_id=user_id, **values) for user_id, values in counts.items()],
+                                   batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_verifcode_indexes'),
+        ('order', '0001_initial'),
+        ('goods', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCount',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='所属用户')),
+                ('unpaid', models.IntegerField(default=0, verbose_name='待支付')),
+                ('paid', models.IntegerField(default=0, verbose_name='待发货')),
+                ('shipped', models.IntegerField(default=0, verbose_name='待收货')),
+                ('finished', models.IntegerField(default=0, verbose_name='已完成')),
+                ('canceled', models.IntegerField(default=0, verbose_name='已取消')),
+            ],
+            options={
+                'verbose_name': '用户订单数统计表',
+                'db_table': 'order_count',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='address',
+            field=models.CharField(default='', max_length=200, verbose_name='详细地址'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='city',
+            field=models.CharField(default='', max_length=20, verbose_name='城市'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='county',
+            field=models.CharField(default='', max_length=20, verbose_name='区县'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='phone',
+            field=models.CharField(default='', max_length=11, verbose_name='收货人手机号'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='province',
+            field=models.CharField(default='', max_length=20, verbose_name='省份'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='receiver',
+            field=models.CharField(default='', max_length=20, verbose_name='收货人'),
+        ),
+        migrations.AddField(
+            model_name='ordergoods',
+            name='cover',
+            field=models.CharField(blank=True, default='', max_length=200, verbose_name='封面图路径'),
+        ),
+        migrations.AddField(
+            model_name='ordergoods',
+            name='title',
+            field=models.CharField(default='', max_length=200, verbose_name='商品名称'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_time'], name='order_user_time_idx'),
+        ),
+        migrations.RunPython(fill_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0002_order_snapshots'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_status_expire_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_user_time_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['is_delete', 'status', 'expire_time'], name='order_status_expire_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['is_delete', 'user', 'created_time'], name='order_user_time_idx'),
+        ),
+    ]
@@ -1,3 +1,86 @@
 from django.db import models
+from common.db import BaseModel
+
 
 # Create your models here.
+class Order(BaseModel):
+    """订单模型"""
+    # 订单状态
+    UNPAID = 1
+    PAID = 2
+    SHIPPED = 3
+    FINISHED = 4
+    CANCELED = 5
+    STATUS_CHOICES = (
+        (UNPAID, '待支付'),
+        (PAID, '待发货'),
+        (SHIPPED, '待收货'),
+        (FINISHED, '已完成'),
+        (CANCELED, '已取消'),
+    )
+
+    user = models.ForeignKey('users.User', verbose_name='下单用户', on_delete=models.CASCADE)
+    order_code = models.CharField(verbose_name='订单编号', max_length=32, unique=True)
+    addr = models.ForeignKey('users.Addr', verbose_name='收货地址', on_delete=models.SET_NULL, null=True)
+    # 下单时收货地址的快照，之后修改、删除收货地址不影响订单
+    receiver = models.CharField(verbose_name='收货人', max_length=20, default='')
+    phone = models.CharField(verbose_name='收货人手机号', max_length=11, default='')
+    province = models.CharField(verbose_name='省份', max_length=20, default='')
+    city = models.CharField(verbose_name='城市', max_length=20, default='')
+    county = models.CharField(verbose_name='区县', max_length=20, default='')
+    address = models.CharField(verbose_name='详细地址', max_length=200, default='')
+    amount = models.DecimalField(verbose_name='商品总金额', max_digits=10, decimal_places=2)
+    discount = models.DecimalField(verbose_name='优惠金额', max_digits=10, decimal_places=2, default=0)
+    pay_amount = models.DecimalField(verbose_name='实付金额', max_digits=10, decimal_places=2)
+    status = models.SmallIntegerField(verbose_name='订单状态', choices=STATUS_CHOICES, default=UNPAID)
+    expire_time = models.DateTimeField(verbose_name='支付截止时间')
+    pay_time = models.DateTimeField(verbose_name='支付时间', blank=True, null=True)
+
+    class Meta:
+        db_table = 'orders'
+        verbose_name = '订单表'
+        indexes = [
+            # 默认管理器的查询都带有is_delete = 0，索引以is_delete开头
+            # 超时未支付订单的回收：status = 待支付 and expire_time <= now
+            models.Index(fields=['is_delete', 'status', 'expire_time'], name='order_status_expire_idx'),
+            # 用户的订单列表按下单时间倒序做游标分页（InnoDB的二级索引末尾自带主键id）
+            models.Index(fields=['is_delete', 'user', 'created_time'], name='order_user_time_idx'),
+        ]
+
+
+class OrderGoods(BaseModel):
+    """订单商品模型"""
+    order = models.ForeignKey('Order', verbose_name='所属订单', on_delete=models.CASCADE, related_name='lines')
+    goods = models.ForeignKey('goods.Goods', verbose_name='商品', on_delete=models.PROTECT)
+    number = models.IntegerField(verbose_name='商品数量')
+    # 下单时商品的快照，查询订单时不需要关联商品表
+    price = models.DecimalField(verbose_name='下单时的单价', max_digits=10, decimal_places=2)
+    title = models.CharField(verbose_name='商品名称', max_length=200, default='')
+    cover = models.CharField(verbose_name='封面图路径', max_length=200, blank=True, default='')
+
+    class Meta:
+        db_table = 'order_goods'
+        verbose_name = '订单商品表'
+
+
+class OrderCount(models.Model):
+    """用户各状态的订单数，订单状态改变时在同一个事务中增减，查询时不需要COUNT(*)"""
+    # 订单状态 -> 字段名
+    STATUS_FIELDS = {
+        Order.UNPAID: 'unpaid',
+        Order.PAID: 'paid',
+        Order.SHIPPED: 'shipped',
+        Order.FINISHED: 'finished',
+        Order.CANCELED: 'canceled',
+    }
+
+    user = models.OneToOneField('users.User', verbose_name='所属用户', on_delete=models.CASCADE, primary_key=True)
+    unpaid = models.IntegerField(verbose_name='待支付', default=0)
+    paid = models.IntegerField(verbose_name='待发货', default=0)
+    shipped = models.IntegerField(verbose_name='待收货', default=0)
+    finished = models.IntegerField(verbose_name='已完成', default=0)
+    canceled = models.IntegerField(verbose_name='已取消', default=0)
+
+    class Meta:
+        db_table = 'order_count'
+        verbose_name = '用户订单数统计表'
@@ -0,0 +1,25 @@
+from rest_framework import serializers
+from order.models import Order, OrderGoods
+
+
+class OrderGoodsSerializer(serializers.ModelSerializer):
+    """订单商品的序列化器"""
+    class Meta:
+        model = OrderGoods
+        fields = ['goods', 'title', 'cover', 'number', 'price']
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    """订单的序列化器"""
+    lines = OrderGoodsSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'order_code', 'receiver', 'phone', 'province', 'city', 'county', 'address', 'amount',
+                  'discount', 'pay_amount', 'status', 'expire_time', 'pay_time', 'created_time', 'lines']
+
+
+class OrderCreateSerializer(serializers.Serializer):
+    """下单的参数校验：收货地址和购物车中要购买的商品（不传时购买购物车中的全部商品）"""
+    addr = serializers.IntegerField(min_value=1)
+    goods = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
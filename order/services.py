@@ -0,0 +1,170 @@
+"""
+下单和库存：
+1. 扣减库存使用条件更新 UPDATE goods SET stock = stock - n WHERE id = ? AND stock >= n，
+   更新的行数为0表示库存不足，不需要先查询再加锁，不会超卖；
+2. 一个订单的所有商品在同一个事务中按商品id从小到大扣减，多个订单加行锁的顺序一致，不会死锁；
+3. 超时未支付的订单由sweep_orders命令批量取消并归还库存；
+4. 订单状态改变时在同一个事务中增减用户各状态的订单数（OrderCount），加锁顺序为 商品 -> 订单数。
+"""
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from cart import storage
+from cart.pricing import price_cart
+from goods.cache import bump_list_version, detail_cache_key
+from goods.models import Goods
+from order.models import Order, OrderCount, OrderGoods
+from users.models import Addr
+
+ORDER_SETTINGS = {
+    # 订单的支付时间（秒），超时后取消订单并归还库存
+    'PAY_TIMEOUT': 15 * 60,
+    # 每次回收的超时订单数
+    'SWEEP_BATCH_SIZE': 500,
+    **getattr(settings, 'ORDER', {}),
+}
+
+
+class OrderError(Exception):
+    pass
+
+
+def make_order_code(user_id):
+    """订单编号：下单时间 + 用户id后6位 + 6位随机数"""
+    return '%s%06d%06d' % (timezone.localtime().strftime('%Y%m%d%H%M%S'), user_id % 1000000,
+                           secrets.randbelow(1000000))
+
+
+def invalidate_goods(goods_ids):
+    """库存和销量通过update修改，不会触发商品的post_save信号，需要手动使列表缓存和商品详情的缓存失效"""
+    bump_list_version()
+    cache.delete_many([detail_cache_key(goods_id) for goods_id in goods_ids])
+
+
+def reserve_stock(items):
+    """在事务中按商品id的顺序扣减库存，items为{商品id: 数量}，任意商品库存不足时抛出OrderError"""
+    for goods_id in sorted(items):
+        number = items[goods_id]
+        updated = Goods.objects.filter(pk=goods_id, is_on=True, stock__gte=number).update(
+            stock=F('stock') - number, sales=F('sales') + number)
+        if not updated:
+            raise OrderError('商品库存不足')
+
+
+def release_stock(items):
+    """归还库存，同样按商品id的顺序加锁；下单后被软删除的商品也要归还"""
+    for goods_id in sorted(items):
+        number = items[goods_id]
+        Goods.all_objects.filter(pk=goods_id).update(stock=F('stock') + number, sales=F('sales') - number)
+
+
+def change_counts(changes):
+    """修改用户各状态的订单数，changes为{用户id: {订单状态: 增减的数量}}，需要在事务中调用"""
+    for user_id in sorted(changes):
+        values = {OrderCount.STATUS_FIELDS[status]: number for status, number in changes[user_id].items() if number}
+        if not values:
+            continue
+        updates = {field: F(field) + number for field, number in values.items()}
+        if OrderCount.objects.filter(user_id=user_id).update(**updates):
+            continue
+        # 用户的第一个订单，并发创建时由主键冲突拦截后改为更新
+        try:
+            with transaction.atomic():
+                OrderCount.objects.create(user_id=user_id, **values)
+        except IntegrityError:
+            OrderCount.objects.filter(user_id=user_id).update(**updates)
+
+
+def get_counts(user_id):
+    """获取用户各状态的订单数"""
+    fields = list(OrderCount.STATUS_FIELDS.values())
+    row = OrderCount.objects.filter(user_id=user_id).values(*fields).first()
+    return row or dict.fromkeys(fields, 0)
+
+
+def place_order(user_id, addr_id, goods_ids=None):
+    """使用购物车中的商品（goods_ids为空时为全部商品）创建订单"""
+    # 1. 获取要购买的商品和收货地址
+    items = storage.get_cart(user_id)
+    if goods_ids:
+        items = {goods_id: number for goods_id, number in items.items() if goods_id in set(goods_ids)}
+    if not items:
+        raise OrderError('请选择要购买的商品')
+    addr = Addr.objects.filter(pk=addr_id, user_id=user_id).first()
+    if addr is None:
+        raise OrderError('收货地址不存在')
+
+    # 2. 使用数据库中最新的价格和库存计算金额，在事务之外完成，不延长持有行锁的时间
+    priced = price_cart(items, use_cache=False)
+    for line in priced['items']:
+        if line['warning']:
+            raise OrderError('%s：%s' % (line.get('title', line['goods']), line['warning']))
+
+    # 3. 在一个事务中扣减所有商品的库存并创建订单
+    with transaction.atomic():
+        reserve_stock(items)
+        # 保存收货地址和商品的快照，订单列表和详情不再关联会被修改的地址表和商品表
+        order = Order.objects.create(
+            user_id=user_id, order_code=make_order_code(user_id), addr=addr,
+            receiver=addr.name, phone=addr.phone, province=addr.province, city=addr.city, county=addr.county,
+            address=addr.address,
+            amount=priced['total_amount'], discount=priced['discount'], pay_amount=priced['pay_amount'],
+            expire_time=timezone.now() + timedelta(seconds=ORDER_SETTINGS['PAY_TIMEOUT']))
+        OrderGoods.objects.bulk_create([
+            OrderGoods(order=order, goods_id=line['goods'], number=line['number'], price=line['price'],
+                       title=line['title'], cover=line['cover'] or '')
+            for line in priced['items']
+        ])
+        change_counts({user_id: {Order.UNPAID: 1}})
+        # 4. 提交成功后从购物车中移除已下单的商品
+        transaction.on_commit(lambda: [storage.remove_item(user_id, goods_id) for goods_id in items])
+        transaction.on_commit(lambda: invalidate_goods(items))
+    return order
+
+
+def release_orders(queryset, batch_size=None):
+    """
+    取消queryset中待支付的订单并归还库存，返回取消的订单数。
+    SKIP LOCKED跳过正在被其他事务处理（支付、取消）的订单，多个回收进程可以同时运行
+    """
+    batch_size = batch_size or ORDER_SETTINGS['SWEEP_BATCH_SIZE']
+    with transaction.atomic():
+        orders = dict(queryset.filter(status=Order.UNPAID).select_for_update(skip_locked=True)
+                      .values_list('id', 'user_id')[:batch_size])
+        if not orders:
+            return 0
+        Order.all_objects.filter(id__in=orders).update(status=Order.CANCELED)
+        # 多个订单中的同一商品合并后一次归还
+        rows = (OrderGoods.all_objects.filter(order_id__in=orders).values('goods_id')
+                .annotate(number=Sum('number')).order_by())
+        items = {row['goods_id']: row['number'] for row in rows}
+        release_stock(items)
+        changes = {}
+        for user_id in orders.values():
+            changes[user_id] = changes.get(user_id, 0) + 1
+        change_counts({user_id: {Order.UNPAID: -n, Order.CANCELED: n} for user_id, n in changes.items()})
+        transaction.on_commit(lambda: invalidate_goods(items))
+    return len(orders)
+
+
+def cancel_order(user_id, order_id):
+    """用户取消待支付的订单"""
+    if not release_orders(Order.objects.filter(pk=order_id, user_id=user_id)):
+        raise OrderError('订单不存在或不能取消')
+
+
+def sweep_expired_orders(batch_size=None):
+    """分批取消所有超时未支付的订单，返回取消的订单数；已软删除的订单同样要归还库存"""
+    batch_size = batch_size or ORDER_SETTINGS['SWEEP_BATCH_SIZE']
+    total = 0
+    while True:
+        released = release_orders(Order.all_objects.filter(expire_time__lte=timezone.now()), batch_size)
+        total += released
+        if released < batch_size:
+            return total
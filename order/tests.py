@@ -1,3 +1,209 @@
-from django.test import TestCase
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from cart import storage
+from cart.pricing import price_cart
+from common.token_auth import local_users
+from goods.models import Goods, GoodsGroup
+from order.models import Order, OrderCount, OrderGoods
+from order.services import OrderError, place_order, sweep_expired_orders
+from users.models import Addr, User
+
+
+class OversellTests(TransactionTestCase):
+    """秒杀：多个线程同时购买同一个商品，成功的订单数等于库存，不会超卖，超时回收后库存全部归还"""
+    buyers = 40
+    stock = 15
+
+    def setUp(self):
+        # 购物车以缓存为主副本（测试在单进程中运行），提交订单后移除购物车商品时不写数据库
+        patcher = mock.patch.dict(storage.CART_SETTINGS, WRITE_BEHIND=True, FLUSH_INTERVAL=3600)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 测试在单进程中运行，进程内缓存相当于共享的缓存，不输出只能用于单进程的警告
+        patcher = mock.patch.object(storage, 'is_process_local', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(storage.flusher.dirty.clear)
+        self.addCleanup(cache.clear)
+        cache.clear()
+        group = GoodsGroup.objects.create(name='秒杀测试')
+        self.goods = Goods.objects.create(group=group, title='秒杀测试商品', price=Decimal('1.00'), stock=self.stock,
+                                          is_on=True)
+        self.accounts = []
+        for i in range(self.buyers):
+            user = User.objects.create(username='oversell_%d' % i)
+            addr = Addr.objects.create(user=user, phone='13800000000', name='测试', province='广东省', city='深圳市',
+                                       county='南山区', address='测试地址')
+            storage.set_item(user.id, self.goods.id, 1)
+            self.accounts.append((user.id, addr.id))
+
+    def buy(self, user_id, addr_id):
+        while True:
+            try:
+                place_order(user_id, addr_id, [self.goods.id])
+                return 'ok'
+            except OrderError:
+                return 'sold_out'
+            except OperationalError as e:
+                # 测试使用的SQLite共享缓存内存数据库在并发写入时不等待锁，直接报错，整个下单事务已回滚，重试即可
+                if 'locked' not in str(e):
+                    raise
+                time.sleep(0.001)
+
+    def test_no_oversell(self):
+        results = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.buyers, timeout=30)
+        local = threading.local()
+
+        def priced_together(items, use_cache=True):
+            # 所有用户都在库存充足时完成价格检查后才开始扣减库存，重试时也使用第一次检查的结果，
+            # 只能依靠扣减库存时的条件防止超卖
+            if not hasattr(local, 'priced'):
+                local.priced = price_cart(items, use_cache)
+                barrier.wait()
+            return local.priced
+
+        def worker(user_id, addr_id):
+            try:
+                result = self.buy(user_id, addr_id)
+            except Exception as e:
+                result = e
+            finally:
+                connection.close()
+            with lock:
+                results.append(result)
+
+        threads = [threading.Thread(target=worker, args=account) for account in self.accounts]
+        with mock.patch('order.services.price_cart', priced_together):
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        self.assertEqual(sorted(map(str, results)), ['ok'] * self.stock + ['sold_out'] * (self.buyers - self.stock))
+        self.goods.refresh_from_db()
+        self.assertEqual((self.goods.stock, self.goods.sales), (0, self.stock))
+        self.assertEqual(OrderGoods.objects.filter(goods=self.goods).aggregate(total=Sum('number'))['total'],
+                         self.stock)
+        self.assertEqual(OrderCount.objects.aggregate(total=Sum('unpaid'))['total'], self.stock)
+        # 只有下单成功的用户的购物车被清空
+        empty = sum(not storage.get_cart(user_id) for user_id, _ in self.accounts)
+        self.assertEqual(empty, self.stock)
+
+        # 订单全部过期后归还所有库存
+        Order.objects.update(expire_time='2000-01-01T00:00:00Z')
+        self.assertEqual(sweep_expired_orders(), self.stock)
+        self.goods.refresh_from_db()
+        self.assertEqual((self.goods.stock, self.goods.sales), (self.stock, 0))
+        self.assertEqual(OrderCount.objects.aggregate(total=Sum('unpaid'))['total'], 0)
+
+
+class SweepTests(TestCase):
+
+    def test_soft_deleted_orders_are_released(self):
+        group = GoodsGroup.objects.create(name='回收测试')
+        goods = Goods.objects.create(group=group, title='回收测试商品', price=Decimal('1.00'), stock=5, is_on=True)
+        user = User.objects.create(username='sweep')
+        addr = Addr.objects.create(user=user, phone='13800000000', name='测试', province='广东省', city='深圳市',
+                                   county='南山区', address='测试地址')
+        storage.set_item(user.id, goods.id, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(user.id, addr.id)
+        # 待支付的订单在过期前被软删除
+        Order.objects.filter(pk=order.pk).soft_delete()
+        OrderGoods.objects.filter(order=order).soft_delete()
+        Order.all_objects.filter(pk=order.pk).update(expire_time='2000-01-01T00:00:00Z')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_expired_orders(), 1)
+        goods.refresh_from_db()
+        self.assertEqual((goods.stock, goods.sales), (5, 0))
+        self.assertEqual(Order.all_objects.get(pk=order.pk).status, Order.CANCELED)
+        self.assertEqual(OrderCount.objects.get(user=user).unpaid, 0)
+        self.assertEqual(sweep_expired_orders(), 0)
+
+
+class OrderApiTests(TestCase):
+    """订单中的快照、各状态的订单数和订单列表的分页"""
+
+    @classmethod
+    def setUpTestData(cls):
+        group = GoodsGroup.objects.create(name='订单测试')
+        cls.goods = Goods.objects.create(group=group, title='订单测试商品', price=Decimal('2.50'), stock=10,
+                                         cover='goods/cover.jpg', is_on=True)
+        cls.user = User.objects.create(username='order_api')
+        cls.addr = Addr.objects.create(user=cls.user, phone='13800000000', name='测试', province='广东省',
+                                       city='深圳市', county='南山区', address='测试地址')
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(local_users.clear)
+        self.headers = {'HTTP_AUTHORIZATION': 'Bearer %s' % RefreshToken.for_user(self.user).access_token}
+
+    def place(self, number=1):
+        storage.set_item(self.user.id, self.goods.id, number)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/order/', {'addr': self.addr.id}, content_type='application/json',
+                                        **self.headers)
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def test_snapshot_is_kept_after_changes(self):
+        order = self.place(2)
+        Goods.objects.filter(pk=self.goods.pk).update(title='改名后的商品', price=Decimal('9.90'), cover='')
+        self.addr.name, self.addr.address = '改名', '新地址'
+        self.addr.save()
+        detail = self.client.get('/order/%d' % order['id'], **self.headers).json()
+        self.assertEqual(detail, order)
+        self.assertEqual((detail['receiver'], detail['address'], detail['amount']), ('测试', '测试地址', '5.00'))
+        self.assertEqual(detail['lines'], [{'goods': self.goods.id, 'title': '订单测试商品', 'cover': '/file/image/goods/cover.jpg',
+                                            'number': 2, 'price': '2.50'}])
+        # 收货地址被删除后订单不受影响
+        self.addr.delete()
+        self.assertEqual(self.client.get('/order/%d' % order['id'], **self.headers).json(), detail)
+
+    def test_counts(self):
+        expected = dict.fromkeys(OrderCount.STATUS_FIELDS.values(), 0)
+        self.assertEqual(self.client.get('/order/counts', **self.headers).json(), expected)
+        first, second = self.place(), self.place()
+        self.assertEqual(self.client.get('/order/counts', **self.headers).json(), {**expected, 'unpaid': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put('/order/%d/cancel' % first['id'], **self.headers)
+        self.assertEqual(response.status_code, 200)
+        # 已取消的订单不能再取消，订单数不变
+        self.assertEqual(self.client.put('/order/%d/cancel' % first['id'], **self.headers).status_code, 422)
+        counts = {**expected, 'unpaid': 1, 'canceled': 1}
+        self.assertEqual(self.client.get('/order/counts', **self.headers).json(), counts)
+        # 订单数和订单表中的实际数量一致
+        for status, field in OrderCount.STATUS_FIELDS.items():
+            self.assertEqual(Order.objects.filter(user=self.user, status=status).count(), counts[field])
+        self.goods.refresh_from_db()
+        self.assertEqual((self.goods.stock, self.goods.sales), (9, 1))
+        response = self.client.get('/order/', {'status': Order.UNPAID}, **self.headers)
+        self.assertEqual([row['id'] for row in response.json()['results']], [second['id']])
+
+    def test_pagination_with_equal_created_time(self):
+        orders = [Order.objects.create(user=self.user, order_code='page%d' % i, amount=1, pay_amount=1,
+                                       expire_time=timezone.now()) for i in range(5)]
+        # 同一时间创建的订单按id倒序，翻页时不会重复或遗漏
+        Order.objects.update(created_time=timezone.now())
+        ids, params = [], {'page_size': 2}
+        while True:
+            data = self.client.get('/order/', params, **self.headers).json()
+            ids += [row['id'] for row in data['results']]
+            if data['next'] is None:
+                break
+            params = {'page_size': 2, 'cursor': parse_qs(urlsplit(data['next']).query)['cursor'][0]}
+        self.assertEqual(ids, sorted((order.id for order in orders), reverse=True))
@@ -0,0 +1,13 @@
+from django.urls import path
+from order import views
+
+urlpatterns = [
+    # 下单和订单列表
+    path('', views.OrderView.as_view({'post': 'create', 'get': 'list'})),
+    # 各状态的订单数
+    path('counts', views.OrderView.as_view({'get': 'counts'})),
+    # 订单详情
+    path('<int:pk>', views.OrderView.as_view({'get': 'retrieve'})),
+    # 取消订单
+    path('<int:pk>/cancel', views.OrderView.as_view({'put': 'cancel'})),
+]
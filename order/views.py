@@ -1,3 +1,55 @@
-from django.shortcuts import render
+from rest_framework import mixins, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.viewsets import GenericViewSet
 
-# Create your views here.
+from common.idempotency import idempotent
+from common.pagination import KeysetPagination
+from order import services
+from order.models import Order
+from order.serializers import OrderCreateSerializer, OrderSerializer
+
+
+class OrderPagination(KeysetPagination):
+    """订单列表按下单时间倒序的游标分页，使用(user, created_time)索引"""
+    ordering = ('-created_time', '-id')
+    page_size = 10
+
+
+class OrderView(GenericViewSet, mixins.ListModelMixin, mixins.RetrieveModelMixin):
+    """订单视图集：下单、订单列表、订单详情、取消订单和各状态的订单数"""
+    serializer_class = OrderSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = OrderPagination
+
+    def get_queryset(self):
+        # 只能查看自己的订单，订单商品使用一条IN查询批量获取
+        queryset = Order.objects.filter(user_id=self.request.user.id).prefetch_related('lines')
+        status_value = self.request.query_params.get('status')
+        if status_value in {str(value) for value, _ in Order.STATUS_CHOICES}:
+            queryset = queryset.filter(status=status_value)
+        return queryset
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """使用购物车中的商品下单"""
+        serializer = OrderCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            order = services.place_order(request.user.id, serializer.validated_data['addr'],
+                                         serializer.validated_data.get('goods'))
+        except services.OrderError as e:
+            return Response({'error': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+    def cancel(self, request, *args, **kwargs):
+        """取消待支付的订单，归还库存"""
+        try:
+            services.cancel_order(request.user.id, kwargs['pk'])
+        except services.OrderError as e:
+            return Response({'error': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response({"message": "订单已取消"}, status=status.HTTP_200_OK)
+
+    def counts(self, request, *args, **kwargs):
+        """获取各状态的订单数"""
+        return Response(services.get_counts(request.user.id))
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from common.token_auth import user_changed
+        from users.models import User, Area
+        from users.regions import regions_changed
+        # 用户信息修改或删除后，清除认证时使用的用户缓存
+        post_save.connect(user_changed, sender=User, dispatch_uid='users.invalidate_auth_cache')
+        post_delete.connect(user_changed, sender=User, dispatch_uid='users.invalidate_auth_cache_delete')
+        # 地区数据修改后重新加载内存中的地区树
+        post_save.connect(regions_changed, sender=Area, dispatch_uid='users.reload_regions')
+        post_delete.connect(regions_changed, sender=Area, dispatch_uid='users.reload_regions_delete')
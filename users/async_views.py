@@ -0,0 +1,262 @@
+"""
+ASGI部署时使用的异步视图：登录、注册、用户信息、收货地址的增删改查和文件下载。
+使用Django的异步ORM，不经过sync_to_async线程池；登录和注册时密码哈希在进程池中计算，不阻塞事件循环；
+返回的数据和同步视图保持一致
+"""
+import functools
+import io
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.http import HttpResponse
+from rest_framework import exceptions, serializers, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from common.authenticate import aauthenticate
+from common.files import to_async_response
+from common.hashers import amake_password
+from common.idempotency import acall_idempotent
+from common.renderers import ORJSONParser, dumps
+from common.token_auth import CachedJWTAuthentication
+from users.models import User, Addr
+from users.regions import get_tree
+from users.serializers import AddrSerializer, MyTokenObtainPairSerializer, user_plan, addr_plan
+from users.views import AddrPagination, AddrView, LoginView, RegisterView, login_result, serve_media
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    # 和同步视图使用相同的JSON编码，输出完全一致
+    response = HttpResponse(dumps(data), status=status_code, content_type='application/json')
+    # 和DRF的Response一样保留数据，幂等处理时保存
+    response.data = data
+    return response
+
+
+def exception_response(exc):
+    """使用DRF的异常处理生成和同步视图相同的响应，包括限流时的Retry-After响应头"""
+    response = exception_handler(exc, {})
+    result = json_response(response.data, response.status_code)
+    for name, value in response.items():
+        result[name] = value
+    return result
+
+
+def check_throttles(request, throttle_classes):
+    """和APIView.check_throttles相同：检查所有的限流类，被限流时按最长的等待时间返回429"""
+    durations = []
+    for throttle_class in throttle_classes:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, None):
+            durations.append(throttle.wait())
+    if durations:
+        raise exceptions.Throttled(max((d for d in durations if d is not None), default=None))
+
+
+def async_api(methods, authenticated=True, throttle_classes=None, idempotent_methods=()):
+    """
+    异步视图的装饰器：限制请求方法，进行token认证（authenticated为True时必须登录）和限流
+    （默认使用DEFAULT_THROTTLE_CLASSES，和同步视图相同），idempotent_methods中的请求方法支持Idempotency-Key，
+    并将DRF的异常转换为和同步视图相同格式的响应
+    """
+    if throttle_classes is None:
+        throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return json_response({'detail': '方法 “%s” 不被允许。' % request.method},
+                                      status.HTTP_405_METHOD_NOT_ALLOWED)
+            try:
+                if authenticated:
+                    result = await CachedJWTAuthentication().aauthenticate(request)
+                    if result is None:
+                        raise exceptions.NotAuthenticated()
+                    request.user = result[0]
+                else:
+                    # 不使用会话中的用户，避免在事件循环中同步查询数据库
+                    request.user = AnonymousUser()
+                # 先读取请求体，DRF的Request和parse_body都使用读取后的缓存
+                request.body
+                drf_request = Request(request, parsers=[ORJSONParser()])
+                drf_request.user = request.user
+                if throttle_classes:
+                    # 限流的计数器保存在缓存中，和cache.aget()一样在线程中访问
+                    await sync_to_async(check_throttles)(drf_request, throttle_classes)
+                if request.method in idempotent_methods:
+                    return await acall_idempotent(drf_request, functools.partial(view, request, *args, **kwargs),
+                                                  json_response)
+                return await view(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                    # 和同步视图一样返回WWW-Authenticate响应头
+                    exc.auth_header = CachedJWTAuthentication().authenticate_header(request)
+                return exception_response(exc)
+        return wrapper
+    return decorator
+
+
+def parse_body(request):
+    if not request.body:
+        return {}
+    return ORJSONParser().parse(io.BytesIO(request.body), parser_context={'encoding': request.encoding or 'utf-8'})
+
+
+def not_found(model):
+    """和同步视图中get_object_or_404相同的404响应"""
+    return exceptions.NotFound('No %s matches the given query.' % model._meta.object_name)
+
+
+def check_owner(request, user_id):
+    """管理员或数据所属的用户才有权限操作"""
+    if not (request.user.is_superuser or user_id == request.user.id):
+        raise exceptions.PermissionDenied()
+
+
+class AsyncAddrSerializer(AddrSerializer):
+    """异步视图中创建、修改地址的序列化器，所属用户直接取登录用户，校验时不需要查询数据库"""
+    class Meta(AddrSerializer.Meta):
+        read_only_fields = ['user']
+
+
+def save_default_addr(addr):
+    """保存默认地址，并在同一个事务中取消用户原来的默认地址"""
+    with transaction.atomic():
+        Addr.switch_default(addr.user_id, addr.pk)
+        addr.save()
+
+
+@async_api(['POST'], authenticated=False, throttle_classes=LoginView.throttle_classes)
+async def login(request):
+    """用户登录，和LoginView相同：账号使用异步ORM查询，密码在进程池中校验，参数过期时重新哈希"""
+    serializer = MyTokenObtainPairSerializer(data=parse_body(request))
+    # 只校验字段，账号密码的认证不使用序列化器中同步的authenticate()
+    attrs = serializer.to_internal_value(serializer.initial_data)
+    try:
+        user = await aauthenticate(attrs['username'], attrs['password'])
+    except serializers.ValidationError as exc:
+        # 和序列化器的is_valid()一样，错误信息转换为列表
+        raise serializers.ValidationError(serializers.as_serializer_error(exc))
+    if not jwt_settings.USER_AUTHENTICATION_RULE(user):
+        raise exceptions.AuthenticationFailed(serializer.error_messages['no_active_account'], 'no_active_account')
+    refresh = serializer.get_token(user)
+    if jwt_settings.UPDATE_LAST_LOGIN:
+        user.last_login = timezone.now()
+        await user.asave(update_fields=['last_login'])
+    return json_response(login_result(user, {'refresh': str(refresh), 'access': str(refresh.access_token)}))
+
+
+@async_api(['POST'], authenticated=False, throttle_classes=RegisterView.throttle_classes,
+           idempotent_methods=['POST'])
+async def register(request):
+    """用户注册，和RegisterView相同，密码哈希在进程池中计算"""
+    data = parse_body(request)
+    username, email = data.get('username'), data.get('email')
+    error = RegisterView.check_params(username, email, data.get('password'), data.get('password_confirmation'))
+    if not error:
+        used = [row async for row in RegisterView.used_accounts(username, email)]
+        error = RegisterView.check_unique(username, email, used)
+    if error:
+        return json_response({'error': error}, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    # 和create_user()相同，并发注册相同的用户名或邮箱时由数据库的唯一约束拦截
+    user = User(username=User.normalize_username(username), email=User.objects.normalize_email(email),
+                password=await amake_password(data['password']))
+    try:
+        await user.asave()
+    except IntegrityError:
+        return json_response({'error': "用户名或邮箱已存在"}, status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return json_response({'username': username, 'id': user.id, 'email': user.email}, status.HTTP_201_CREATED)
+
+
+@async_api(['GET'])
+async def user_detail(request, pk):
+    """获取单个用户信息"""
+    # 和同步视图一样，用户不存在时返回404，存在时再校验权限
+    try:
+        row = await user_plan.values(User.objects.filter(pk=pk)).aget()
+    except User.DoesNotExist:
+        raise not_found(User)
+    check_owner(request, pk)
+    return json_response(user_plan.represent_one(row, request))
+
+
+# 和同步视图一样，添加地址时客户端重试不会重复添加
+@async_api(['GET', 'POST'], idempotent_methods=['POST'])
+async def address(request):
+    """获取收货地址列表（GET）和添加收货地址（POST）"""
+    if request.method == 'POST':
+        return await address_create(request)
+
+    drf_request = Request(request)
+    queryset = Addr.objects.filter(user_id=request.user.id)
+    fields = request.GET.get('fields')
+    if fields:
+        fields = fields.split(',')
+        if not set(fields) <= set(AddrView.projection_fields):
+            return json_response({'error': 'fields参数有误'}, status.HTTP_422_UNPROCESSABLE_ENTITY)
+    plan = addr_plan.select(fields)
+
+    if request.GET.get('default') == '1':
+        row = await plan.values(queryset.filter(is_default=True)).afirst()
+        if row is None:
+            return json_response({'error': "没有设置默认收货地址"}, status.HTTP_404_NOT_FOUND)
+        return json_response(plan.represent_one(row))
+
+    paginator = AddrPagination()
+    queryset = queryset.order_by(*AddrPagination.ordering)
+    page = await paginator.apaginate_queryset(plan.values(queryset, 'is_default', 'id', named=True), drf_request)
+    if page is not None:
+        return json_response({'next': paginator.get_next_link(), 'results': plan.represent(page)})
+    return json_response(plan.represent([row async for row in plan.values(queryset)]))
+
+
+async def address_create(request):
+    # 地区树可能需要从数据库加载，在线程中获取后传给序列化器校验地址
+    regions = await sync_to_async(get_tree)()
+    serializer = AsyncAddrSerializer(data=parse_body(request), context={'regions': regions})
+    serializer.is_valid(raise_exception=True)
+    addr = Addr(user_id=request.user.id, **serializer.validated_data)
+    if addr.is_default:
+        await sync_to_async(save_default_addr)(addr)
+    else:
+        await addr.asave()
+    return json_response(AddrSerializer(addr).data, status.HTTP_201_CREATED)
+
+
+@async_api(['PUT', 'DELETE'])
+async def address_detail(request, pk):
+    """修改收货地址（PUT）和删除收货地址（DELETE）"""
+    try:
+        addr = await Addr.objects.aget(pk=pk)
+    except Addr.DoesNotExist:
+        raise not_found(Addr)
+    check_owner(request, addr.user_id)
+
+    if request.method == 'DELETE':
+        await addr.adelete()
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+    regions = await sync_to_async(get_tree)()
+    serializer = AsyncAddrSerializer(addr, data=parse_body(request), context={'regions': regions})
+    serializer.is_valid(raise_exception=True)
+    for name, value in serializer.validated_data.items():
+        setattr(addr, name, value)
+    if addr.is_default:
+        await sync_to_async(save_default_addr)(addr)
+    else:
+        await addr.asave()
+    return json_response(AddrSerializer(addr).data)
+
+
+async def file_view(request, name):
+    """获取文件：查找和打开文件（可能还会安排缩略图的生成）在线程中执行，文件内容在线程中分块读取，不阻塞事件循环"""
+    response = await sync_to_async(serve_media)(request, name)
+    if response is None:
+        return json_response({'error': "没有找到该文件！"}, status.HTTP_404_NOT_FOUND)
+    return to_async_response(response)
@@ -0,0 +1,139 @@
+"""
+用户头像的处理：按内容哈希命名去重，在后台线程池中生成不同尺寸的缩略图
+"""
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from PIL import Image
+
+from hyy_python.settings import MEDIA_ROOT
+
+logger = logging.getLogger(__name__)
+
+AVATAR_SETTINGS = {
+    # 预先生成的缩略图尺寸（像素）
+    'SIZES': (64, 128, 256),
+    # 生成缩略图的后台线程数
+    'WORKERS': 2,
+    # 最多等待处理的头像数，超过时不再排队，下载时回退到原图
+    'MAX_PENDING': 64,
+    'QUALITY': 85,
+    **getattr(settings, 'AVATAR', {}),
+}
+
+# 缩略图格式：文件扩展名 -> Pillow的保存格式
+VARIANT_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+# 原图的扩展名：Pillow解析出的格式 -> 文件扩展名，其他格式使用格式名的小写
+IMAGE_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+_slots = threading.BoundedSemaphore(AVATAR_SETTINGS['MAX_PENDING'])
+
+
+def write_atomic(path, write):
+    """先写入临时文件再重命名，其他进程不会读到写了一半的文件"""
+    tmp = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+    try:
+        with open(tmp, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def image_extension(upload):
+    """按Pillow实际解析出的图片格式确定扩展名，不使用客户端提供的文件名"""
+    upload.seek(0)
+    with Image.open(upload) as img:
+        fmt = img.format
+    upload.seek(0)
+    return IMAGE_EXTENSIONS.get(fmt, '.%s' % fmt.lower())
+
+
+def store_avatar(upload):
+    """保存上传的头像（需要已经校验是图片），文件名为内容的sha256，相同内容的头像只保存一份"""
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    ext = image_extension(upload)
+    name = 'avatar_%s%s' % (digest.hexdigest(), ext)
+    path = os.path.join(MEDIA_ROOT, name)
+    if not os.path.exists(path):
+        os.makedirs(MEDIA_ROOT, exist_ok=True)
+
+        def write(f):
+            for chunk in upload.chunks():
+                f.write(chunk)
+        write_atomic(path, write)
+    return name
+
+
+def variant_name(name, size, ext):
+    return '%s_%d.%s' % (os.path.splitext(name)[0], size, ext)
+
+
+def generate_variants(name):
+    """生成头像的所有尺寸和格式的缩略图，已经存在的会跳过"""
+    with Image.open(os.path.join(MEDIA_ROOT, name)) as img:
+        img = img.convert('RGB')
+        for size in AVATAR_SETTINGS['SIZES']:
+            thumb = None
+            for ext, fmt in VARIANT_FORMATS.items():
+                path = os.path.join(MEDIA_ROOT, variant_name(name, size, ext))
+                if os.path.exists(path):
+                    continue
+                if thumb is None:
+                    thumb = img.copy()
+                    thumb.thumbnail((size, size), Image.LANCZOS)
+                write_atomic(path, lambda f: thumb.save(f, fmt, quality=AVATAR_SETTINGS['QUALITY']))
+
+
+def _run(name):
+    try:
+        generate_variants(name)
+    except Exception:
+        logger.exception('生成头像缩略图失败：%s', name)
+    finally:
+        with _executor_lock:
+            _pending.discard(name)
+        _slots.release()
+
+
+def schedule_variants(name):
+    """将缩略图的生成交给后台线程池，队列已满或已在处理中时直接返回False"""
+    global _executor
+    with _executor_lock:
+        if name in _pending:
+            return False
+        if not _slots.acquire(blocking=False):
+            return False
+        _pending.add(name)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(AVATAR_SETTINGS['WORKERS'], thread_name_prefix='avatar')
+    _executor.submit(_run, name)
+    return True
+
+
+def pick_variant(name, size, accept=''):
+    """
+    根据请求的尺寸和Accept请求头选择缩略图的文件名：
+    使用不小于请求尺寸的最小缩略图，浏览器支持时优先返回webp
+    """
+    if not name.startswith('avatar_'):
+        return name
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        return name
+    sizes = sorted(AVATAR_SETTINGS['SIZES'])
+    size = next((s for s in sizes if s >= size), sizes[-1])
+    ext = 'webp' if 'image/webp' in accept else 'jpg'
+    return variant_name(name, size, ext)
@@ -0,0 +1,120 @@
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from common.db import BaseModel
+
+
+def archive_table(model):
+    return '%s_archive' % model._meta.db_table
+
+
+class Command(BaseCommand):
+    help = '将软删除超过N天的数据分批移动到归档表（<表名>_archive），仍被其他数据引用的行会被跳过'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='归档软删除超过多少天的数据')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每批移动的行数')
+        parser.add_argument('--sleep', type=float, default=0.1, help='每批之间暂停的秒数，减少对数据库的压力')
+        parser.add_argument('--models', nargs='*', help='只归档指定的模型，例如goods.Goods，默认为所有继承BaseModel的模型')
+        parser.add_argument('--dry-run', action='store_true', help='只统计需要归档的行数')
+
+    def handle(self, *args, **options):
+        # 软删除时会更新updated_time，作为删除时间
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        for model in self.get_models(options['models']):
+            queryset = model.all_objects.filter(is_delete=True, updated_time__lt=cutoff)
+            if options['dry_run']:
+                self.stdout.write('%s：%d 行待归档' % (model._meta.label, queryset.count()))
+                continue
+            self.ensure_archive_table(model)
+            moved, skipped = self.archive(model, queryset, options['chunk_size'], options['sleep'])
+            self.stdout.write('%s：已归档 %d 行，跳过仍被引用的 %d 行' % (model._meta.label, moved, skipped))
+
+    def get_models(self, labels):
+        models = [model for model in apps.get_models()
+                  if issubclass(model, BaseModel) and model._meta.managed and not model._meta.proxy]
+        if labels:
+            selected = {label.lower() for label in labels}
+            unknown = selected - {model._meta.label_lower for model in models}
+            if unknown:
+                raise CommandError('未知的模型：%s' % '、'.join(sorted(unknown)))
+            models = [model for model in models if model._meta.label_lower in selected]
+
+        # 引用其他模型的表排在前面（如订单商品先于订单和商品），被引用的数据归档时，引用它的数据已经先被归档
+        depth = {}
+
+        def get_depth(model, seen=()):
+            if model not in depth:
+                parents = [field.related_model for field in model._meta.concrete_fields
+                           if field.many_to_one or field.one_to_one]
+                depth[model] = 1 + max([get_depth(parent, seen + (model,)) for parent in parents
+                                        if parent in models and parent not in seen + (model,)] or [-1])
+            return depth[model]
+        return sorted(models, key=get_depth, reverse=True)
+
+    def ensure_archive_table(self, model):
+        """创建归档表，只复制列定义，不复制索引和唯一约束（归档表中允许出现重复的用户名等）"""
+        qn = connection.ops.quote_name
+        table, archive = model._meta.db_table, archive_table(model)
+        with connection.cursor() as cursor:
+            if archive not in connection.introspection.table_names(cursor):
+                if connection.vendor == 'postgresql':
+                    sql = 'CREATE TABLE %s (LIKE %s)'
+                else:
+                    # MySQL和SQLite：CREATE TABLE ... AS SELECT复制列的类型，不复制索引、约束和自增属性
+                    sql = 'CREATE TABLE %s AS SELECT * FROM %s WHERE 1 = 0'
+                cursor.execute(sql % (qn(archive), qn(table)))
+                cursor.execute('CREATE INDEX %s ON %s (%s)' % (
+                    qn('%s_pk' % archive), qn(archive), qn(model._meta.pk.column)))
+                return
+            # 在线表新增的字段同步到归档表
+            columns = {column.name for column in connection.introspection.get_table_description(cursor, archive)}
+            for field in model._meta.concrete_fields:
+                if field.column not in columns:
+                    cursor.execute('ALTER TABLE %s ADD COLUMN %s %s NULL' % (
+                        qn(archive), qn(field.column), field.db_type(connection)))
+
+    def archive(self, model, queryset, chunk_size, pause):
+        moved = skipped = 0
+        last = None
+        while True:
+            # 按主键向后分批，跳过的行不会被重复读取
+            batch = queryset.order_by('pk')
+            if last is not None:
+                batch = batch.filter(pk__gt=last)
+            ids = list(batch.values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                return moved, skipped
+            last = ids[-1]
+            try:
+                self.move(model, ids)
+                moved += len(ids)
+            except IntegrityError:
+                # 这一批中有数据仍被其他表通过外键引用，逐行移动，跳过被引用的行
+                for pk in ids:
+                    try:
+                        self.move(model, [pk])
+                        moved += 1
+                    except IntegrityError:
+                        skipped += 1
+            time.sleep(pause)
+
+    def move(self, model, ids):
+        """在一个事务中复制到归档表并从在线表删除；删除违反外键约束时整个事务回滚"""
+        qn = connection.ops.quote_name
+        table, archive = qn(model._meta.db_table), qn(archive_table(model))
+        columns = ', '.join(qn(field.column) for field in model._meta.concrete_fields)
+        # 再次检查is_delete，期间被恢复的数据不会被归档
+        where = '%s IN (%s) AND %s = %%s' % (qn(model._meta.pk.column), ', '.join(['%s'] * len(ids)),
+                                            qn(model._meta.get_field('is_delete').column))
+        params = list(ids) + [True]
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('INSERT INTO %s (%s) SELECT %s FROM %s WHERE %s' % (
+                    archive, columns, columns, table, where), params)
+                cursor.execute('DELETE FROM %s WHERE %s' % (table, where), params)
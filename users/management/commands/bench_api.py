@@ -0,0 +1,400 @@
+import io
+import json
+import platform
+import random
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import CommandError
+from django.db import connection
+from PIL import Image
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from common.bench import BenchCommand, bench_client, summarize, without_throttling
+from common.metrics import QueryTimer
+from users.models import User, Addr, Area
+from users.regions import get_tree, regions_changed
+
+PASSWORD = 'bench123456'
+PREFIX = 'bench_api_'
+# 每个接口测试一个请求列表，status为视为成功的状态码
+Request = namedtuple('Request', ['method', 'path', 'data', 'json', 'headers'])
+Scenario = namedtuple('Scenario', ['name', 'status', 'build'])
+
+
+def send(client, request):
+    extra = {'HTTP_%s' % name.upper().replace('-', '_'): value for name, value in request.headers.items()}
+    if request.json:
+        extra['content_type'] = 'application/json'
+    args = (request.path,) if request.data is None else (request.path, request.data)
+    response = getattr(client, request.method)(*args, **extra)
+    if getattr(response, 'streaming', False):
+        b''.join(response.streaming_content)
+    return response
+
+
+def compare(report, baseline, tolerance, min_delta_ms):
+    """和基准结果比较，返回性能回退的描述列表；p95和吞吐量允许tolerance比例的波动，查询次数和失败数不允许增加"""
+    regressions = []
+    for name, phases in report['scenarios'].items():
+        for phase, current in phases.items():
+            old = baseline.get('scenarios', {}).get(name, {}).get(phase)
+            if not old:
+                continue
+            label = '%s（%s）' % (name, phase)
+            if current['p95_ms'] > old['p95_ms'] * (1 + tolerance) + min_delta_ms:
+                regressions.append('%s p95：%.2fms -> %.2fms' % (label, old['p95_ms'], current['p95_ms']))
+            # 吞吐量换算为每个请求的平均耗时后比较，同样允许min_delta_ms的绝对波动
+            if old['throughput_rps'] and current['throughput_rps'] and \
+                    1000 / current['throughput_rps'] > 1000 / old['throughput_rps'] * (1 + tolerance) + min_delta_ms:
+                regressions.append('%s 吞吐量：%.1f -> %.1f 请求/秒' % (
+                    label, old['throughput_rps'], current['throughput_rps']))
+            if current['queries_per_request'] > old['queries_per_request'] + 0.01:
+                regressions.append('%s 每个请求的查询次数：%.2f -> %.2f' % (
+                    label, old['queries_per_request'], current['queries_per_request']))
+            if current['errors'] > old['errors']:
+                regressions.append('%s 失败请求数：%d -> %d' % (label, old['errors'], current['errors']))
+    return regressions
+
+
+class Command(BenchCommand):
+    help = ('生成可重复的测试数据（用户、收货地址、地区），通过测试客户端串行和多线程测试users的所有接口，'
+            '输出吞吐量、p50/p95/p99和每个请求的查询次数（JSON），可以和保存的基准结果比较，性能回退时命令失败')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='生成的用户数量')
+        parser.add_argument('--addrs', type=int, default=5, help='每个用户的收货地址数量')
+        parser.add_argument('--provinces', type=int, default=34, help='地区表为空时生成的省份数量')
+        parser.add_argument('--cities', type=int, default=10, help='每个省份的城市数量')
+        parser.add_argument('--counties', type=int, default=10, help='每个城市的区县数量')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=200, help='每个接口、每个阶段的请求数')
+        parser.add_argument('--threads', type=int, default=8, help='并发阶段的线程数，为0时只测试串行')
+        parser.add_argument('--scenarios', nargs='*', help='只测试指定的接口')
+        parser.add_argument('--seed', type=int, default=0, help='随机数种子，相同的种子生成相同的数据和请求顺序')
+        parser.add_argument('--output', help='测试结果保存的文件，可以作为之后的--baseline')
+        parser.add_argument('--baseline', help='基准结果文件')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='p95和吞吐量允许的波动比例')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0, help='p95和平均耗时允许的绝对波动（毫秒），避免亚毫秒接口的误报')
+
+    def handle(self, *args, **options):
+        scenarios = self.get_scenarios()
+        if options['scenarios']:
+            unknown = set(options['scenarios']) - {scenario.name for scenario in scenarios}
+            if unknown:
+                raise CommandError('未知的接口：%s' % '、'.join(sorted(unknown)))
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['scenarios']]
+
+        self.rnd = random.Random(options['seed'])
+        self.seed_areas(options['provinces'], options['cities'], options['counties'])
+        self.seed_users(options['users'], options['addrs'], options['batch_size'])
+        self.prepare()
+
+        report = {
+            'environment': {
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'users': User.objects.filter(username__startswith=PREFIX).count(),
+                'addrs': Addr.objects.count(),
+                'areas': Area.objects.count(),
+                'requests': options['requests'],
+                'threads': options['threads'],
+                'seed': options['seed'],
+            },
+            'scenarios': {},
+        }
+        with without_throttling():
+            for scenario in scenarios:
+                result = {'serial': self.run_serial(scenario.build(options['requests']), scenario.status)}
+                if options['threads'] > 0:
+                    result['concurrent'] = self.run_concurrent(
+                        scenario.build(options['requests']), scenario.status, options['threads'])
+                report['scenarios'][scenario.name] = result
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = compare(report, baseline, options['tolerance'], options['min_delta_ms'])
+            if regressions:
+                raise CommandError('和基准结果相比出现性能回退：\n' + '\n'.join(regressions))
+            self.stdout.write('和基准结果相比没有性能回退')
+
+    # 测试数据
+
+    def seed_areas(self, provinces, cities, counties):
+        """地区表为空时生成省、市、区县三级地区，已有地区数据时直接使用"""
+        if Area.objects.exists():
+            return
+        for level, parents, count in (('province', [None], provinces), ('city', None, cities),
+                                      ('county', None, counties)):
+            if parents is None:
+                parents = list(Area.objects.filter(level=previous).order_by('id'))
+            Area.objects.bulk_create([
+                Area(pid=parent, name='%s%d' % (parent.name if parent else '省份', n), level=level)
+                for parent in parents for n in range(count)
+            ], batch_size=5000)
+            previous = level
+        regions_changed(sender=Area)
+        self.stdout.write('已生成 %d 个地区' % Area.objects.count())
+
+    def random_path(self):
+        tree = get_tree()
+        path, pid = [], None
+        for _ in range(3):
+            children = tree.get_children(pid)
+            if not children:
+                break
+            region = self.rnd.choice(children)
+            path.append(region.name)
+            pid = region.id
+        return path + [''] * (3 - len(path))
+
+    def seed_users(self, count, addrs, batch_size):
+        """批量生成测试用户和收货地址，所有用户共用一个密码哈希以节省时间"""
+        password = make_password(PASSWORD)
+        start = User.objects.filter(username__startswith=PREFIX).count()
+        for offset in range(start, count, batch_size):
+            users = User.objects.bulk_create([
+                User(username='%s%d' % (PREFIX, n), email='%s%d@example.com' % (PREFIX, n),
+                     mobile='1%010d' % (4000000000 + n), password=password)
+                for n in range(offset, min(offset + batch_size, count))
+            ])
+            if not users[0].pk:
+                # MySQL的bulk_create不返回主键
+                users = list(User.objects.filter(username__in=[user.username for user in users]))
+            Addr.objects.bulk_create([self.make_addr(user.pk, i == 0) for user in users for i in range(addrs)],
+                                     batch_size=batch_size)
+            self.stdout.write('已生成 %d 个用户' % min(offset + batch_size, count))
+
+    def make_addr(self, user_id, is_default=False):
+        province, city, county = self.random_path()
+        return Addr(user_id=user_id, phone='13800000000', name='测试', province=province, city=city,
+                    county=county, address='测试地址%d' % self.rnd.randrange(100000), is_default=is_default)
+
+    def prepare(self):
+        """参与测试的用户：每个用户一个token，上传一次头像作为文件下载的数据"""
+        users = list(User.objects.filter(username__startswith=PREFIX).order_by('id')[:100])
+        if not users:
+            raise CommandError('没有测试用户，--users需要大于0')
+        self.accounts = []
+        for user in users:
+            refresh = RefreshToken.for_user(user)
+            self.accounts.append({'user': user, 'refresh': str(refresh), 'access': str(refresh.access_token)})
+        buf = io.BytesIO()
+        Image.new('RGB', (256, 256), (200, 80, 40)).save(buf, 'JPEG', quality=80)
+        self.image = buf.getvalue()
+        account = self.accounts[0]
+        response = bench_client().post('/user/%d/avatar/upload' % account['user'].pk,
+                                       {'avatar': SimpleUploadedFile('a.jpg', self.image, 'image/jpeg')},
+                                       HTTP_AUTHORIZATION='Bearer %s' % account['access'])
+        if response.status_code != 200:
+            raise CommandError('上传头像失败：%s' % response.content.decode())
+        self.avatar = User.objects.get(pk=account['user'].pk).avatar.name
+        # 预热用户缓存和地区树，每个请求的查询次数不受测试顺序的影响
+        client = bench_client()
+        for account in self.accounts:
+            client.get('/user/user/%d' % account['user'].pk, HTTP_AUTHORIZATION='Bearer %s' % account['access'])
+        get_tree()
+
+    def account(self):
+        return self.rnd.choice(self.accounts)
+
+    def auth(self, account):
+        return {'Authorization': 'Bearer %s' % account['access']}
+
+    def addr_data(self, user_id):
+        province, city, county = self.random_path()
+        return {'user': user_id, 'phone': '13800000000', 'name': '测试', 'province': province, 'city': city,
+                'county': county, 'address': '测试地址%d' % self.rnd.randrange(100000)}
+
+    def own_addrs(self, count):
+        """为随机用户新增count个地址，返回(用户, 地址id)，用于修改和删除"""
+        accounts = [self.account() for _ in range(count)]
+        addrs = Addr.objects.bulk_create([self.make_addr(account['user'].pk) for account in accounts])
+        if not addrs or not addrs[0].pk:
+            ids = Addr.objects.order_by('-id').values_list('id', flat=True)[:count]
+            addrs = [Addr(pk=pk) for pk in reversed(ids)]
+        return list(zip(accounts, [addr.pk for addr in addrs]))
+
+    # 测试的接口
+
+    def get_scenarios(self):
+        return [
+            Scenario('login', {200}, self.build_login),
+            Scenario('register', {201}, self.build_register),
+            Scenario('token_refresh', {200}, self.build_token_refresh),
+            Scenario('token_verify', {200}, self.build_token_verify),
+            Scenario('user_retrieve', {200}, self.build_user_retrieve),
+            Scenario('avatar_upload', {200}, self.build_avatar_upload),
+            Scenario('file_download', {200}, self.build_file_download),
+            Scenario('address_list', {200}, self.build_address_list),
+            Scenario('address_default', {200}, self.build_address_default),
+            Scenario('address_create', {201}, self.build_address_create),
+            Scenario('address_update', {200}, self.build_address_update),
+            Scenario('address_set_default', {200}, self.build_address_set_default),
+            Scenario('address_delete', {204}, self.build_address_delete),
+            Scenario('area_children', {200}, self.build_area_children),
+            Scenario('area_path', {200}, self.build_area_path),
+            Scenario('verifcode_send', {200}, self.build_verifcode_send),
+            # 使用错误的验证码，测试校验失败的路径
+            Scenario('verifcode_check', {422}, self.build_verifcode_check),
+        ]
+
+    def build_login(self, count):
+        total = User.objects.filter(username__startswith=PREFIX).count()
+        requests = []
+        for _ in range(count):
+            n = self.rnd.randrange(total)
+            # 三种登录方式各占三分之一
+            username = self.rnd.choice(['%s%d' % (PREFIX, n), '%s%d@example.com' % (PREFIX, n),
+                                        '1%010d' % (4000000000 + n)])
+            requests.append(Request('post', '/user/login', {'username': username, 'password': PASSWORD}, True, {}))
+        return requests
+
+    def build_register(self, count):
+        requests = []
+        for _ in range(count):
+            name = 'bench_reg_%s' % uuid.uuid4().hex[:12]
+            data = {'username': name, 'email': '%s@example.com' % name,
+                    'password': PASSWORD, 'password_confirmation': PASSWORD}
+            requests.append(Request('post', '/user/register', data, True, {}))
+        return requests
+
+    def build_token_refresh(self, count):
+        return [Request('post', '/user/token/refresh', {'refresh': self.account()['refresh']}, True, {})
+                for _ in range(count)]
+
+    def build_token_verify(self, count):
+        return [Request('post', '/user/token/verify', {'token': self.account()['access']}, True, {})
+                for _ in range(count)]
+
+    def build_user_retrieve(self, count):
+        requests = []
+        for _ in range(count):
+            account = self.account()
+            requests.append(Request('get', '/user/user/%d' % account['user'].pk, None, False, self.auth(account)))
+        return requests
+
+    def build_avatar_upload(self, count):
+        requests = []
+        for _ in range(count):
+            account = self.account()
+            data = {'avatar': SimpleUploadedFile('a.jpg', self.image, 'image/jpeg')}
+            requests.append(Request('post', '/user/%d/avatar/upload' % account['user'].pk, data, False,
+                                    self.auth(account)))
+        return requests
+
+    def build_file_download(self, count):
+        return [Request('get', '/file/image/%s/' % self.avatar, None, False, {}) for _ in range(count)]
+
+    def build_address_list(self, count):
+        return [Request('get', '/user/address', None, False, self.auth(self.account())) for _ in range(count)]
+
+    def build_address_default(self, count):
+        return [Request('get', '/user/address', {'default': '1'}, False, self.auth(self.account()))
+                for _ in range(count)]
+
+    def build_address_create(self, count):
+        requests = []
+        for _ in range(count):
+            account = self.account()
+            requests.append(Request('post', '/user/address', self.addr_data(account['user'].pk), True,
+                                    self.auth(account)))
+        return requests
+
+    def build_address_update(self, count):
+        return [Request('put', '/user/address/%d' % pk, self.addr_data(account['user'].pk), True, self.auth(account))
+                for account, pk in self.own_addrs(count)]
+
+    def build_address_set_default(self, count):
+        return [Request('put', '/user/address/%d/default' % pk, None, False, self.auth(account))
+                for account, pk in self.own_addrs(count)]
+
+    def build_address_delete(self, count):
+        return [Request('delete', '/user/address/%d' % pk, None, False, self.auth(account))
+                for account, pk in self.own_addrs(count)]
+
+    def build_area_children(self, count):
+        tree = get_tree()
+        pids = [None] + [region.id for region in tree.get_children(None)]
+        return [Request('get', '/user/area', {'pid': self.rnd.choice(pids) or ''}, False, {}) for _ in range(count)]
+
+    def build_area_path(self, count):
+        ids = list(Area.objects.filter(level='county').values_list('id', flat=True)[:1000]) or \
+            list(Area.objects.values_list('id', flat=True)[:1000])
+        return [Request('get', '/user/area', {'id': self.rnd.choice(ids)}, False, {}) for _ in range(count)]
+
+    def build_verifcode_send(self, count):
+        # 同一手机号有发送间隔的限制，每个请求使用不同的手机号
+        base = time.time_ns() % 10 ** 8
+        return [Request('post', '/user/verifcode', {'mobile': '139%08d' % ((base + i) % 10 ** 8)}, True, {})
+                for i in range(count)]
+
+    def build_verifcode_check(self, count):
+        return [Request('post', '/user/verifcode/check', {'mobile': '139%08d' % self.rnd.randrange(10 ** 8),
+                                                          'code': '000000'}, True, {})
+                for _ in range(count)]
+
+    # 测试的执行
+
+    def run_serial(self, requests, expected):
+        client = bench_client(raise_request_exception=False)
+        samples, queries, errors = [], 0, 0
+        start = time.perf_counter()
+        for request in requests:
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                begin = time.perf_counter()
+                response = send(client, request)
+                samples.append(time.perf_counter() - begin)
+            queries += timer.count
+            errors += response.status_code not in expected
+        total = time.perf_counter() - start
+        return dict(summarize(samples), throughput_rps=round(len(samples) / total, 2),
+                    queries_per_request=round(queries / max(1, len(samples)), 2), errors=errors)
+
+    def run_concurrent(self, requests, expected, threads):
+        """多个线程同时发起请求，每个线程使用自己的测试客户端和数据库连接"""
+        chunks = [requests[i::threads] for i in range(threads)]
+        barrier = threading.Barrier(threads + 1)
+
+        def worker(chunk):
+            client = bench_client(raise_request_exception=False)
+            samples, queries, errors = [], 0, 0
+            barrier.wait()
+            try:
+                for request in chunk:
+                    timer = QueryTimer()
+                    with connection.execute_wrapper(timer):
+                        begin = time.perf_counter()
+                        response = send(client, request)
+                        samples.append(time.perf_counter() - begin)
+                    queries += timer.count
+                    errors += response.status_code not in expected
+            finally:
+                connection.close()
+            return samples, queries, errors
+
+        with ThreadPoolExecutor(threads) as executor:
+            futures = [executor.submit(worker, chunk) for chunk in chunks]
+            barrier.wait()
+            start = time.perf_counter()
+            results = [future.result() for future in futures]
+            total = time.perf_counter() - start
+        samples = [sample for result in results for sample in result[0]]
+        queries = sum(result[1] for result in results)
+        errors = sum(result[2] for result in results)
+        return dict(summarize(samples), throughput_rps=round(len(samples) / total, 2),
+                    queries_per_request=round(queries / max(1, len(samples)), 2), errors=errors)
@@ -0,0 +1,70 @@
+import io
+import json
+import random
+import time
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import CommandError
+from PIL import Image
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from common.bench import BenchCommand, bench_client, summarize
+from users.avatar import AVATAR_SETTINGS, generate_variants
+from users.models import User
+
+
+def make_image(seed, size=360):
+    """生成一张随机内容的JPEG图片，每张图片的内容都不同"""
+    rnd = random.Random(seed)
+    img = Image.frombytes('RGB', (size, size), bytes(rnd.getrandbits(8) for _ in range(size * size * 3)))
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=60)
+    return buf.getvalue()
+
+
+class Command(BenchCommand):
+    help = '测试头像上传的延迟，以及每次查看头像时原图和缩略图的传输字节数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=50)
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='bench_avatar')
+        client = bench_client(HTTP_AUTHORIZATION='Bearer %s' % RefreshToken.for_user(user).access_token)
+        url = '/user/%d/avatar/upload' % user.id
+
+        def upload(seed):
+            data = make_image(seed)
+            start = time.perf_counter()
+            response = client.post(url, {'avatar': SimpleUploadedFile('a.jpg', data, 'image/jpeg')})
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise CommandError('上传头像失败：%s' % response.content.decode()[:200])
+            return elapsed, response
+
+        # 缩略图在后台线程池中生成
+        async_samples = [upload(time.time_ns())[0] for _ in range(options['rounds'])]
+        # 对照组：在请求中同步生成缩略图
+        sync_samples = []
+        for _ in range(options['rounds']):
+            elapsed, response = upload(time.time_ns())
+            start = time.perf_counter()
+            generate_variants(User.objects.get(pk=user.pk).avatar.name)
+            sync_samples.append(elapsed + time.perf_counter() - start)
+
+        name = User.objects.get(pk=user.pk).avatar.name
+        generate_variants(name)
+        served = {'original': self.fetch(client, name, '')}
+        for size in AVATAR_SETTINGS['SIZES']:
+            served['%d_webp' % size] = self.fetch(client, name, size, 'image/webp,*/*')
+            served['%d_jpg' % size] = self.fetch(client, name, size, '*/*')
+
+        self.stdout.write(json.dumps({
+            'upload_background_variants': summarize(async_samples),
+            'upload_inline_variants': summarize(sync_samples),
+            'bytes_per_view': served,
+        }, indent=2))
+
+    def fetch(self, client, name, size, accept='*/*'):
+        response = client.get('/file/image/%s/' % name, {'size': size} if size else {}, HTTP_ACCEPT=accept)
+        return len(b''.join(response.streaming_content))
@@ -0,0 +1,61 @@
+import json
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import CommandError
+from django.test import override_settings
+from django.utils.module_loading import import_string
+
+from common.bench import BenchCommand, bench_client, without_throttling
+from users.models import User
+
+HASHERS = {
+    'pbkdf2': 'common.hashers.ConfigurablePBKDF2PasswordHasher',
+    'argon2': 'common.hashers.ConfigurableArgon2PasswordHasher',
+    'bcrypt': 'common.hashers.ConfigurableBCryptSHA256PasswordHasher',
+}
+
+
+class Command(BenchCommand):
+    help = '测试每种密码哈希算法下单核每秒可以处理的登录请求数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help='每种算法的登录请求数')
+
+    def handle(self, *args, **options):
+        result = {}
+        for name, path in HASHERS.items():
+            hasher = import_string(path)()
+            try:
+                if hasher.library:
+                    hasher._load_library()
+            except ValueError:
+                result[name] = '未安装依赖库，已跳过'
+                continue
+            # 当前算法排在第一位，登录时不会触发重新哈希
+            with override_settings(PASSWORD_HASHERS=[path] + [p for p in HASHERS.values() if p != path]), \
+                    without_throttling():
+                result[name] = self.bench_login(name, options['requests'])
+        self.stdout.write(json.dumps(result, indent=2, ensure_ascii=False))
+
+    def bench_login(self, name, count):
+        username = 'bench_hasher_%s' % name
+        user, _ = User.objects.get_or_create(username=username)
+        user.password = make_password('bench123456')
+        user.save(update_fields=['password'])
+
+        client = bench_client()
+        # 单线程顺序请求，每秒请求数即为单核的处理能力
+        start = time.process_time()
+        wall = time.perf_counter()
+        for _ in range(count):
+            response = client.post('/user/login', {'username': username, 'password': 'bench123456'},
+                                   content_type='application/json')
+            if response.status_code != 200:
+                raise CommandError('登录失败：%s' % response.content.decode()[:200])
+        cpu = time.process_time() - start
+        return {
+            'requests': count,
+            'login_per_second_per_core': round(count / cpu, 2),
+            'mean_ms': round((time.perf_counter() - wall) / count * 1000, 3),
+        }
@@ -0,0 +1,57 @@
+import json
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db.models import Q
+
+from common.authenticate import get_login_user
+from common.bench import BenchCommand, measure, summarize
+from users.models import User
+
+
+class Command(BenchCommand):
+    help = '对比登录时三字段OR查询和按账号类型单字段查询的延迟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000, help='生成的用户数量')
+        parser.add_argument('--rounds', type=int, default=1000, help='每种查询的执行次数')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--no-seed', action='store_true', help='使用已有数据，不再生成用户')
+
+    def handle(self, *args, **options):
+        if not options['no_seed']:
+            self.seed(options['users'], options['batch_size'])
+        total = User.objects.count()
+        # 随机抽取账号，三种登录方式各占三分之一
+        identifiers = []
+        for _ in range(options['rounds']):
+            n = random.randrange(total)
+            identifiers.append(random.choice(['bench%d' % n, 'bench%d@example.com' % n, '1%010d' % (3000000000 + n)]))
+
+        def or_lookup(identifier):
+            User.objects.filter(Q(username=identifier) | Q(mobile=identifier) | Q(email=identifier)).first()
+
+        def resolved_lookup(identifier):
+            try:
+                get_login_user(identifier)
+            except User.DoesNotExist:
+                pass
+
+        result = {
+            'users': total,
+            'before_or_query': summarize(measure(or_lookup, [(i,) for i in identifiers])),
+            'after_resolved_query': summarize(measure(resolved_lookup, [(i,) for i in identifiers])),
+        }
+        self.stdout.write(json.dumps(result, indent=2))
+
+    def seed(self, count, batch_size):
+        """批量生成测试用户，所有用户共用一个密码哈希以节省时间"""
+        password = make_password('bench123456')
+        start = User.objects.filter(username__startswith='bench').count()
+        for offset in range(start, count, batch_size):
+            User.objects.bulk_create([
+                User(username='bench%d' % n, email='bench%d@example.com' % n,
+                     mobile='1%010d' % (3000000000 + n), password=password)
+                for n in range(offset, min(offset + batch_size, count))
+            ])
+            self.stdout.write('已生成 %d 个用户' % min(offset + batch_size, count))
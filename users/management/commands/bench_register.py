@@ -0,0 +1,68 @@
+import json
+import random
+import time
+import uuid
+
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from common.bench import BenchCommand, bench_client, summarize, without_throttling
+
+
+def make_payload(valid):
+    """生成一个注册请求，无效请求随机选择一种错误"""
+    name = 'reg_%s' % uuid.uuid4().hex[:12]
+    data = {'username': name, 'email': '%s@example.com' % name,
+            'password': 'abc123456', 'password_confirmation': 'abc123456'}
+    if not valid:
+        error = random.choice(['empty', 'mismatch', 'length', 'email'])
+        if error == 'empty':
+            data['username'] = ''
+        elif error == 'mismatch':
+            data['password_confirmation'] = 'abc654321'
+        elif error == 'length':
+            data['password'] = data['password_confirmation'] = 'abc'
+        else:
+            data['email'] = 'not-an-email'
+    return data
+
+
+class Command(BenchCommand):
+    help = '测试注册接口在混合无效请求时的吞吐量和每个请求的查询次数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--invalid-ratio', type=float, default=0.5, help='无效请求所占的比例')
+
+    def handle(self, *args, **options):
+        with without_throttling():
+            self.run(options)
+
+    def run(self, options):
+        client = bench_client()
+        payloads = [(make_payload(random.random() >= options['invalid_ratio'])) for _ in range(options['requests'])]
+        samples = {'valid': [], 'invalid': []}
+        queries = {'valid': 0, 'invalid': 0}
+        start = time.perf_counter()
+        for data in payloads:
+            with CaptureQueriesContext(connection) as ctx:
+                begin = time.perf_counter()
+                response = client.post('/user/register', data, content_type='application/json')
+                elapsed = time.perf_counter() - begin
+            if response.status_code not in (201, 422):
+                # 请求被拒绝（如ALLOWED_HOSTS、限流）时不能算作无效请求，否则测试结果没有意义
+                raise CommandError('注册请求返回了意外的状态码%d：%s' % (
+                    response.status_code, response.content.decode()[:200]))
+            kind = 'valid' if response.status_code == 201 else 'invalid'
+            samples[kind].append(elapsed)
+            queries[kind] += len(ctx)
+        total = time.perf_counter() - start
+
+        self.stdout.write(json.dumps({
+            'requests': len(payloads),
+            'throughput_rps': round(len(payloads) / total, 2),
+            **{kind: dict(summarize(samples[kind]),
+                          queries_per_request=round(queries[kind] / max(1, len(samples[kind])), 2))
+               for kind in samples},
+        }, indent=2))
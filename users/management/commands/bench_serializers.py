@@ -0,0 +1,57 @@
+import json
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+from common.bench import BenchCommand, summarize
+from common.renderers import ORJSONRenderer
+from users.models import User, Addr
+from users.serializers import AddrSerializer, addr_plan
+
+
+class Command(BenchCommand):
+    help = '对比ModelSerializer和读取计划序列化大量收货地址的耗时，以及DRF的JSONRenderer和orjson渲染的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--addrs', type=int, default=10000)
+        parser.add_argument('--rounds', type=int, default=20)
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='bench_serializers')
+        count = Addr.objects.filter(user=user).count()
+        if count < options['addrs']:
+            Addr.objects.bulk_create([
+                Addr(user=user, phone='13800000000', name='测试%d' % i, province='广东省', city='深圳市',
+                     county='南山区', address='测试地址%d' % i)
+                for i in range(count, options['addrs'])
+            ], batch_size=5000)
+        queryset = Addr.objects.filter(user=user).order_by('-id')[:options['addrs']]
+
+        strategies = {
+            'model_serializer': lambda: AddrSerializer(queryset.all(), many=True).data,
+            'read_plan': lambda: addr_plan.represent(addr_plan.values(queryset.all())),
+        }
+        renderers = {'drf_json': JSONRenderer(), 'orjson': ORJSONRenderer()}
+        result = {'addrs': queryset.count()}
+        outputs = {}
+        for name, build in strategies.items():
+            samples = []
+            for _ in range(options['rounds']):
+                start = time.perf_counter()
+                data = build()
+                samples.append(time.perf_counter() - start)
+            # 包含查询数据库的时间
+            result['%s_query_and_serialize' % name] = summarize(samples)
+            outputs[name] = data
+        for name, renderer in renderers.items():
+            samples = []
+            for _ in range(options['rounds']):
+                start = time.perf_counter()
+                renderer.render(outputs['read_plan'])
+                samples.append(time.perf_counter() - start)
+            result['%s_render' % name] = summarize(samples)
+        # 两种方式的输出必须相同
+        result['same_output'] = all(
+            renderer.render(outputs['model_serializer']) == renderer.render(outputs['read_plan'])
+            for renderer in renderers.values())
+        self.stdout.write(json.dumps(result, indent=2))
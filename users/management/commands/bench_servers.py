@@ -0,0 +1,76 @@
+import asyncio
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from common.bench import BenchCommand, http_load, summarize
+from users.models import User, Addr
+
+SERVERS = {
+    # ASGI：异步视图
+    'uvicorn': ['-m', 'uvicorn', 'hyy_python.asgi:application', '--log-level', 'warning',
+                '--host', '127.0.0.1', '--port', '{port}', '--workers', '{workers}'],
+    # WSGI：同步视图，每个进程使用多线程处理请求
+    'gunicorn': ['-m', 'gunicorn', 'hyy_python.wsgi:application', '--log-level', 'warning',
+                 '--bind', '127.0.0.1:{port}', '--workers', '{workers}', '--worker-class', 'gthread', '--threads', '8'],
+}
+
+
+class Command(BenchCommand):
+    help = '对比uvicorn（ASGI）和gunicorn（WSGI）在大量并发连接下收货地址列表接口的吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1000)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--path', default='/user/address')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='bench_servers')
+        if not Addr.objects.filter(user=user).exists():
+            Addr.objects.bulk_create([
+                Addr(user=user, phone='13800000000', name='测试', province='广东省', city='深圳市',
+                     county='南山区', address='测试地址%d' % i, is_default=i == 0)
+                for i in range(10)
+            ])
+        headers = {'Authorization': 'Bearer %s' % RefreshToken.for_user(user).access_token}
+
+        result = {}
+        for name, argv in SERVERS.items():
+            if importlib.util.find_spec(name) is None:
+                result[name] = '未安装%s，已跳过' % name
+                continue
+            argv = [arg.format(port=options['port'], workers=options['workers']) for arg in argv]
+            env = dict(os.environ)
+            env.pop('HYY_ASYNC_VIEWS', None)
+            server = subprocess.Popen([sys.executable] + argv, env=env)
+            try:
+                self.wait_for_port(options['port'])
+                start = time.perf_counter()
+                samples, errors = asyncio.run(http_load(
+                    '127.0.0.1', options['port'], options['path'], headers,
+                    options['concurrency'], options['duration']))
+                elapsed = time.perf_counter() - start
+                result[name] = dict(summarize(samples), errors=errors,
+                                    throughput_rps=round(len(samples) / elapsed, 2))
+            finally:
+                server.terminate()
+                server.wait()
+        self.stdout.write(json.dumps(result, indent=2, ensure_ascii=False))
+
+    def wait_for_port(self, port, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), 0.5).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError('服务启动超时')
@@ -0,0 +1,56 @@
+import json
+import time
+
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from common.bench import BenchCommand, bench_client
+from users.models import User
+
+
+class Command(BenchCommand):
+    help = '模拟撞库攻击，统计登录限流拦截的请求数以及被拦截请求的耗时和查询次数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        User.objects.get_or_create(username='bench_throttle')
+        attempts = options['attempts']
+        result = {
+            # 单个IP尝试大量不同的账号
+            'one_ip_many_accounts': self.attack(attempts, lambda i: ('10.0.0.1', 'victim%d' % i)),
+            # 大量IP尝试同一个账号
+            'many_ips_one_account': self.attack(attempts, lambda i: ('10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255), 'bench_throttle')),
+        }
+        self.stdout.write(json.dumps(result, indent=2))
+
+    def attack(self, attempts, make_attempt):
+        cache.clear()
+        client = bench_client()
+        allowed = rejected = rejected_queries = 0
+        rejected_time = 0.0
+        for i in range(attempts):
+            ip, username = make_attempt(i)
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = client.post('/user/login', {'username': username, 'password': 'wrong-password'},
+                                       content_type='application/json', REMOTE_ADDR=ip)
+                elapsed = time.perf_counter() - start
+            if response.status_code == 429:
+                rejected += 1
+                rejected_time += elapsed
+                rejected_queries += len(ctx)
+            elif response.status_code in (400, 401):
+                allowed += 1
+            else:
+                raise CommandError('意外的响应%d：%s' % (response.status_code, response.content.decode()[:200]))
+        return {
+            'attempts': attempts,
+            'allowed': allowed,
+            'rejected': rejected,
+            'rejected_mean_ms': round(rejected_time / max(1, rejected) * 1000, 3),
+            'rejected_queries': rejected_queries,
+        }
@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.models import VerifCode
+from users.verifcode import VERIFCODE_SETTINGS
+
+
+class Command(BaseCommand):
+    help = '分批删除过期的验证码发送记录，可以通过定时任务周期执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=VERIFCODE_SETTINGS['KEEP_DAYS'], help='保留最近多少天的记录')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每批删除的记录数')
+        parser.add_argument('--sleep', type=float, default=0.1, help='每批之间暂停的秒数，减少对数据库的压力')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        total = 0
+        while True:
+            # 每次按主键删除一小批，避免长时间锁表
+            ids = list(VerifCode.objects.filter(created_time__lt=cutoff)
+                       .order_by('id').values_list('id', flat=True)[:options['chunk_size']])
+            if not ids:
+                break
+            VerifCode.objects.filter(id__in=ids).delete()
+            total += len(ids)
+            time.sleep(options['sleep'])
+        self.stdout.write('共删除 %d 条过期的验证码记录' % total)
@@ -0,0 +1,124 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from common.bench import BenchCommand
+from users.models import User, Addr
+
+# 在新的解释器中加载wsgi.py，直接调用WSGI应用，记录启动耗时和每个接口第一次、第二次请求的耗时
+CHILD = r'''
+import json, os, sys, time
+from wsgiref.util import setup_testing_defaults
+
+start = time.perf_counter()
+from hyy_python.wsgi import application
+from common.warmup import post_fork, timings
+startup = time.perf_counter() - start
+paths = json.loads(os.environ['HYY_STARTUP_PATHS'])
+token = os.environ['HYY_STARTUP_TOKEN']
+
+
+def request(path):
+    environ = {'PATH_INFO': path, 'HTTP_HOST': 'localhost', 'HTTP_AUTHORIZATION': 'Bearer %s' % token}
+    setup_testing_defaults(environ)
+    status = []
+    begin = time.perf_counter()
+    body = application(environ, lambda code, headers, exc_info=None: status.append(code))
+    b''.join(body)
+    body.close()
+    return round((time.perf_counter() - begin) * 1000, 3), int(status[0].split()[0])
+
+
+def run():
+    result = {'startup_ms': round(startup * 1000, 3), 'warmup_ms': dict(timings), 'first': {}, 'second': {}}
+    for path in paths:
+        result['first'][path], status = request(path)
+        if status >= 400:
+            result.setdefault('errors', {})[path] = status
+    for path in paths:
+        result['second'][path] = request(path)[0]
+    return result
+
+
+if os.environ.get('HYY_STARTUP_FORK') == '1':
+    # 模拟gunicorn --preload：主进程加载并预热后fork出worker，由worker处理请求
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        begin = time.perf_counter()
+        post_fork()
+        elapsed = time.perf_counter() - begin
+        result = run()
+        result['post_fork_ms'] = round(elapsed * 1000, 3)
+        os.write(write, json.dumps(result).encode())
+        os._exit(0)
+    os.close(write)
+    chunks = []
+    while True:
+        chunk = os.read(read, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.waitpid(pid, 0)
+    sys.stdout.write(b''.join(chunks).decode())
+else:
+    sys.stdout.write(json.dumps(run()))
+'''
+
+MODES = {
+    # 不预热：第一个请求时才加载路由、序列化器等
+    'cold': {'HYY_WARMUP': '0'},
+    # 在worker进程中预热
+    'warmup': {'HYY_WARMUP': '1'},
+    # 主进程预热后fork出worker（gunicorn --preload）
+    'preload_fork': {'HYY_WARMUP': '1', 'HYY_STARTUP_FORK': '1'},
+}
+
+
+class Command(BenchCommand):
+    help = '启动新的Python进程加载WSGI应用，对比不预热、预热和预热后fork时的启动耗时，以及每个接口第一次请求的延迟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='每种方式启动的进程数，结果取中位数')
+        parser.add_argument('--paths', nargs='*', help='请求的路径，默认为地区、收货地址、用户信息和商品列表')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='bench_startup')
+        if not Addr.objects.filter(user=user).exists():
+            Addr.objects.create(user=user, phone='13800000000', name='测试', province='广东省', city='深圳市',
+                                county='南山区', address='测试地址', is_default=True)
+        paths = options['paths'] or ['/user/area', '/user/address', '/user/user/%d' % user.pk, '/goods/']
+        env = dict(os.environ, HYY_STARTUP_PATHS=json.dumps(paths),
+                   HYY_STARTUP_TOKEN=str(RefreshToken.for_user(user).access_token))
+        env.pop('HYY_ASYNC_VIEWS', None)
+
+        report = {}
+        for mode, extra in MODES.items():
+            runs = [self.spawn(dict(env, **extra)) for _ in range(options['runs'])]
+            report[mode] = {
+                'startup_ms': statistics.median(run['startup_ms'] for run in runs),
+                'warmup_ms': runs[-1]['warmup_ms'],
+                'first_request_ms': {path: statistics.median(run['first'][path] for run in runs) for path in paths},
+                'second_request_ms': {path: statistics.median(run['second'][path] for run in runs) for path in paths},
+            }
+            report[mode]['first_requests_total_ms'] = round(sum(report[mode]['first_request_ms'].values()), 3)
+            if 'post_fork_ms' in runs[-1]:
+                report[mode]['post_fork_ms'] = statistics.median(run['post_fork_ms'] for run in runs)
+            errors = [run['errors'] for run in runs if run.get('errors')]
+            if errors:
+                report[mode]['errors'] = errors[0]
+        self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+
+    def spawn(self, env):
+        process = subprocess.run([sys.executable, '-c', CHILD], env=env, cwd=settings.BASE_DIR,
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            raise CommandError('进程启动失败：\n%s' % process.stderr)
+        return json.loads(process.stdout)
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_addr_address'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='addr',
+            name='address',
+            field=models.CharField(max_length=200, verbose_name='详细地址'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=models.EmailField(blank=True, db_index=True, max_length=254, verbose_name='email address'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='mobile',
+            field=models.CharField(db_index=True, default='', max_length=11, verbose_name='手机号'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:57
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def dedupe_default_addr(apps, schema_editor):
+    """添加约束前，每个用户只保留最新的一个默认地址"""
+    Addr = apps.get_model('users', 'Addr')
+    duplicated = (Addr.objects.filter(is_default=True).values('user_id')
+                  .annotate(total=Count('id'), keep=Max('id')).filter(total__gt=1))
+    for row in duplicated:
+        Addr.objects.filter(user_id=row['user_id'], is_default=True).exclude(pk=row['keep']).update(is_default=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_login_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_default_addr, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='addr',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_default', True)), fields=('user',), name='uniq_addr_user_default'),
+        ),
+    ]
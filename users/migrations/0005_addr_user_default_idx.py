@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_addr_single_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='addr',
+            index=models.Index(fields=['user', 'is_default'], name='addr_user_default_idx'),
+        ),
+    ]
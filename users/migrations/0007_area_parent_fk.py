@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:07
+
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_parent_ids(apps, schema_editor):
+    """将原来字符串类型的pid转换为外键，pid为空、0或指向不存在的地区时作为顶级地区"""
+    Area = apps.get_model('users', 'Area')
+    ids = set(Area.objects.values_list('id', flat=True))
+    children = defaultdict(list)
+    for area_id, pid in Area.objects.values_list('id', 'pid').iterator():
+        try:
+            pid = int(str(pid).strip())
+        except ValueError:
+            continue
+        if pid in ids:
+            children[pid].append(area_id)
+    for pid, area_ids in children.items():
+        Area.objects.filter(id__in=area_ids).update(parent_id=pid)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_users_unique_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='area',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.area'),
+        ),
+        migrations.RunPython(copy_parent_ids, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='area',
+            name='pid',
+        ),
+        migrations.RenameField(
+            model_name='area',
+            old_name='parent',
+            new_name='pid',
+        ),
+        migrations.AlterField(
+            model_name='area',
+            name='pid',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='users.area', verbose_name='上级id'),
+        ),
+    ]
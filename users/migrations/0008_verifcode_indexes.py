@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_area_parent_fk'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='verifcode',
+            index=models.Index(fields=['mobile', 'created_time'], name='verifcode_mobile_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verifcode',
+            index=models.Index(fields=['created_time'], name='verifcode_time_idx'),
+        ),
+    ]
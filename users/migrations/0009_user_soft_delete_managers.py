@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:24
+
+from django.db import migrations
+import users.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_verifcode_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', users.models.SoftDeleteUserManager()),
+                ('all_objects', users.models.AllUsersManager()),
+            ],
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:40
+
+import common.db
+from django.db import IntegrityError, migrations, models
+from django.db.models import Count, F, Min
+from django.db.models.functions import Lower
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """
+    MySQL忽略了原来的部分唯一索引，已有数据中可能存在重复的邮箱（MySQL的默认排序规则不区分大小写）。
+    存在重复时在修改表结构之前终止迁移并列出冲突的用户，由运维人员处理后重新执行，迁移不会修改这些用户的邮箱
+    """
+    User = apps.get_model('users', 'User')
+    mysql = schema_editor.connection.vendor == 'mysql'
+    email = Lower('email') if mysql else F('email')
+    duplicated = (User._base_manager.exclude(email='').exclude(email__isnull=True)
+                  .values(key=email).annotate(total=Count('id'), first=Min('id')).filter(total__gt=1).order_by('first'))
+    conflicts = []
+    for row in duplicated:
+        users = User._base_manager.filter(**{'email__iexact' if mysql else 'email': row['key']})
+        ids = list(users.order_by('id').values_list('id', flat=True))
+        conflicts.append('%s: %s' % (row['key'], ', '.join(map(str, ids))))
+    if conflicts:
+        raise IntegrityError('以下邮箱被多个用户使用（邮箱: 用户id），请先修改或合并这些用户再执行迁移：\n%s'
+                             % '\n'.join(conflicts))
+
+
+def blank_email_to_null(apps, schema_editor):
+    """空邮箱改为NULL，唯一索引允许多个NULL"""
+    User = apps.get_model('users', 'User')
+    User._base_manager.filter(email='').update(email=None)
+
+
+def null_email_to_blank(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    User._base_manager.filter(email__isnull=True).update(email='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_user_soft_delete_managers'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='user',
+            name='uniq_users_email',
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=models.EmailField(blank=True, db_index=True, max_length=254, null=True, verbose_name='email address'),
+        ),
+        migrations.RunPython(blank_email_to_null, null_email_to_blank),
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=common.db.BlankAsNullEmailField(blank=True, max_length=254, null=True, unique=True, verbose_name='email address'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:45
+
+from django.db import IntegrityError, migrations
+from django.db.models import Count, F, Min
+import users.models
+
+
+def check_duplicate_defaults(apps, schema_editor):
+    """
+    MySQL忽略了原来的部分唯一索引，已有数据中一个用户可能有多个默认地址。
+    存在时在修改表结构之前终止迁移并列出冲突的地址，由运维人员确认保留哪一个后重新执行，迁移不会修改这些地址
+    """
+    Addr = apps.get_model('users', 'Addr')
+    duplicated = (Addr.objects.filter(is_default=True).values('user_id')
+                  .annotate(total=Count('id'), first=Min('id')).filter(total__gt=1).order_by('first'))
+    conflicts = []
+    for row in duplicated:
+        ids = Addr.objects.filter(user_id=row['user_id'], is_default=True).order_by('id').values_list('id', flat=True)
+        conflicts.append('%s: %s' % (row['user_id'], ', '.join(map(str, ids))))
+    if conflicts:
+        raise IntegrityError('以下用户有多个默认地址（用户id: 地址id），请先只保留一个默认地址再执行迁移：\n%s'
+                             % '\n'.join(conflicts))
+
+
+def fill_default_user(apps, schema_editor):
+    Addr = apps.get_model('users', 'Addr')
+    Addr.objects.filter(is_default=True).update(default_user=F('user_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_users_email_unique_null'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_defaults, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='addr',
+            name='uniq_addr_user_default',
+        ),
+        migrations.AddField(
+            model_name='addr',
+            name='default_user',
+            field=users.models.DefaultUserField(editable=False, null=True, unique=True, verbose_name='默认地址所属用户'),
+        ),
+        migrations.RunPython(fill_default_user, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,44 @@
-from django.db import models
-from common.db import BaseModel
+from django.db import models, transaction
+from common.db import BaseModel, BlankAsNullEmailField, SoftDeleteQuerySet
 # django中自带的用户认证模型
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
+
+
+class UserQuerySet(SoftDeleteQuerySet):
+    """
+    update()和bulk_update()不会触发post_save信号，批量修改用户（禁用、重置密码、软删除）后
+    在事务提交时清除这些用户的认证缓存，否则已禁用的用户在缓存过期之前仍能通过认证
+    """
+
+    def update(self, **kwargs):
+        # 和update()一样在主库中查询要修改的用户
+        self._for_write = True
+        user_ids = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        self._invalidate(user_ids)
+        return rows
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        rows = super().bulk_update(objs, fields, batch_size=batch_size)
+        self._invalidate([obj.pk for obj in objs])
+        return rows
+
+    def _invalidate(self, user_ids):
+        from common.token_auth import invalidate_users
+        if user_ids:
+            transaction.on_commit(lambda: invalidate_users(user_ids), using=self.db)
+
+
+class SoftDeleteUserManager(UserManager.from_queryset(UserQuerySet)):
+    """用户的默认管理器：保留create_user等方法，并过滤掉已软删除的用户（已删除的用户无法登录）"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_delete=False)
+
+
+class AllUsersManager(UserManager.from_queryset(UserQuerySet)):
+    """包含已软删除用户的管理器"""
 
 
 # Create your models here.
@@ -9,14 +46,51 @@ class User(AbstractUser, BaseModel):
     """"用户模型"""
     # id,username,password,email,is_active 继承于AbstractUser，所以不用写
     # created_time,updated_time 继承于BaseModel，所以不用写
-    mobile = models.CharField(verbose_name='手机号', default='', max_length=11)
+    mobile = models.CharField(verbose_name='手机号', default='', max_length=11, db_index=True)
+    # 覆盖AbstractUser中的email字段：非空邮箱唯一（唯一索引同时用于登录查询），
+    # 注册时并发使用同一邮箱会触发IntegrityError；没有邮箱时数据库中为NULL，不占用唯一索引
+    email = BlankAsNullEmailField(verbose_name='email address', blank=True, null=True, unique=True)
     avatar = models.ImageField(verbose_name='用户头像', blank=True, null=True)
 
+    objects = SoftDeleteUserManager()
+    all_objects = AllUsersManager()
+
     class Meta:
         db_table = 'users'
         verbose_name = '用户表'
 
 
+class DefaultUserField(models.BigIntegerField):
+    """
+    默认地址所属的用户id，非默认地址为NULL，保存时（包括bulk_create）根据is_default自动计算。
+    唯一索引允许多个NULL，普通的unique=True即可保证每个用户最多只有一个默认地址，
+    不依赖部分唯一索引（MySQL不支持，会被忽略）
+    """
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.user_id if model_instance.is_default else None
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class AddrQuerySet(models.QuerySet):
+    """update()和bulk_update()不会调用pre_save()，修改is_default时同时修改default_user"""
+
+    def update(self, **kwargs):
+        if 'is_default' in kwargs and 'default_user' not in kwargs:
+            kwargs['default_user'] = models.F('user_id') if kwargs['is_default'] else None
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        if {'is_default', 'user'} & set(fields):
+            field = self.model._meta.get_field('default_user')
+            for obj in objs:
+                field.pre_save(obj, False)
+            fields = list(fields) + ['default_user']
+        return super().bulk_update(objs, fields, batch_size=batch_size)
+
+
 class Addr(models.Model):
     """收货地址模型"""
     user = models.ForeignKey('User', verbose_name='所属用户', on_delete=models.CASCADE)  # 用户删除之后做一个级联删除
@@ -27,15 +101,39 @@ class Addr(models.Model):
     county = models.CharField(verbose_name='区县', max_length=20)
     address = models.CharField(verbose_name='详细地址', max_length=200)
     is_default = models.BooleanField(verbose_name='是否为默认地址', default=False)
+    default_user = DefaultUserField(verbose_name='默认地址所属用户', null=True, unique=True, editable=False)
+
+    objects = AddrQuerySet.as_manager()
 
     class Meta:
         db_table = 'addr'
         verbose_name = '收货地址表'
+        indexes = [
+            # 地址列表按用户过滤，默认地址排在最前面
+            models.Index(fields=['user', 'is_default'], name='addr_user_default_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'is_default', 'user', 'user_id'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'default_user'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def switch_default(cls, user_id, addr_id):
+        """将用户的默认地址切换为addr_id，需要在事务中调用"""
+        # 锁定用户行，同一用户的并发切换操作串行执行
+        list(User.objects.select_for_update().filter(pk=user_id).values_list('pk', flat=True))
+        # 先取消原默认地址，再设置新的默认地址，避免违反default_user的唯一约束
+        cls.objects.filter(user_id=user_id, is_default=True).exclude(pk=addr_id).update(is_default=False)
+        if addr_id is not None:
+            cls.objects.filter(pk=addr_id, user_id=user_id).update(is_default=True)
 
 
 class Area(models.Model):
     """省市区县地址模型"""
-    pid = models.ImageField(verbose_name='上级id')
+    pid = models.ForeignKey('self', verbose_name='上级id', null=True, blank=True, on_delete=models.CASCADE,
+                            related_name='children')
     name = models.CharField(verbose_name='地区名', max_length=20)
     level = models.CharField(verbose_name='区域等级', max_length=20)
 
@@ -53,4 +151,10 @@ class VerifCode(models.Model):
     class Meta:
         db_table = 'verifcode'
         verbose_name = '手机验证码表'
+        indexes = [
+            # 按手机号查询发送记录
+            models.Index(fields=['mobile', 'created_time'], name='verifcode_mobile_time_idx'),
+            # 按时间批量清理过期记录
+            models.Index(fields=['created_time'], name='verifcode_time_idx'),
+        ]
 
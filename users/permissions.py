@@ -7,7 +7,8 @@ class UserPermissions(permissions.BasePermission):
         if request.user.is_superuser:
             return True
         # 如果不是管理员，则判断操作的用户对象和登录的用户对象是否为同一个用户
-        return obj == request.user
+        # 只比较id，登录用户可以是token构建的轻量用户对象，不需要查询数据库
+        return obj.id == request.user.id
 
 
 class AddrPermissions(permissions.BasePermission):
@@ -15,5 +16,5 @@ class AddrPermissions(permissions.BasePermission):
         # 判断登录的账号是否是管理员
         if request.user.is_superuser:
             return True
-        # 如果不是管理员，则判断操作的用户对象和登录的用户对象是否为同一个用户
-        return obj == request.user
+        # 如果不是管理员，则判断地址所属的用户和登录的用户是否为同一个用户
+        return obj.user_id == request.user.id
@@ -0,0 +1,99 @@
+"""
+省市区县地区树：整张地区表一次性加载到内存中，查询下级地区、完整路径和校验地址都不再访问数据库
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from users.models import Area
+
+REGION_SETTINGS = {
+    # 每隔多少秒检查一次地区数据是否被修改
+    'CHECK_INTERVAL': 10,
+    **getattr(settings, 'REGIONS', {}),
+}
+
+VERSION_KEY = 'regions:version'
+
+Region = namedtuple('Region', ['id', 'pid', 'name', 'level'])
+
+
+class RegionTree:
+    """不可变的地区树：id -> 地区、上级id -> 下级地区元组，顶级地区的上级id为None"""
+    __slots__ = ('nodes', 'children', 'names', 'etag', 'version')
+
+    def __init__(self, rows, version=None):
+        self.nodes = {}
+        children = defaultdict(list)
+        for row in rows:
+            region = Region(*row)
+            self.nodes[region.id] = region
+            children[region.pid].append(region)
+        self.children = {pid: tuple(sorted(items)) for pid, items in children.items()}
+        # (上级id, 地区名) -> 地区，用于按名称校验地址
+        self.names = {(region.pid, region.name): region for region in self.nodes.values()}
+        digest = hashlib.sha1(repr(sorted(self.nodes.values())).encode()).hexdigest()
+        self.etag = '"%s"' % digest[:16]
+        self.version = version
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get_children(self, pid=None):
+        return self.children.get(pid, ())
+
+    def get_path(self, region_id):
+        """获取从顶级地区到该地区的完整路径，地区不存在时返回空列表"""
+        path = []
+        region = self.nodes.get(region_id)
+        while region is not None:
+            path.append(region)
+            region = self.nodes.get(region.pid)
+        return path[::-1]
+
+    def match_path(self, names):
+        """按名称逐级匹配地区，例如('广东省', '深圳市', '南山区')，匹配失败时返回None"""
+        pid = None
+        for name in names:
+            region = self.names.get((pid, name))
+            if region is None:
+                return None
+            pid = region.id
+        return pid
+
+
+_tree = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def load_tree(version=None):
+    rows = Area.objects.values_list('id', 'pid_id', 'name', 'level').iterator(chunk_size=5000)
+    return RegionTree(rows, version)
+
+
+def get_tree():
+    """获取当前进程中的地区树，其他进程修改地区数据后，最多CHECK_INTERVAL秒内重新加载"""
+    global _tree, _checked_at
+    now = time.monotonic()
+    if _tree is not None and now - _checked_at < REGION_SETTINGS['CHECK_INTERVAL']:
+        return _tree
+    with _lock:
+        if _tree is None or now - _checked_at >= REGION_SETTINGS['CHECK_INTERVAL']:
+            version = cache.get(VERSION_KEY)
+            if _tree is None or version != _tree.version:
+                _tree = load_tree(version)
+            _checked_at = now
+    return _tree
+
+
+def regions_changed(sender, **kwargs):
+    """地区数据修改后更新版本号，当前进程立即重新加载，其他进程在下次检查时重新加载"""
+    global _tree
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+    _tree = None
@@ -1,5 +1,9 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+from common.readplan import ReadPlan
 from users.models import User, Addr
+from users.regions import get_tree
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -14,4 +18,37 @@ class AddrSerializer(serializers.ModelSerializer):
     """收货地址模型的序列号器"""
     class Meta:
         model = Addr
-        fields = '__all__'
+        # default_user由is_default计算，只用于数据库的唯一约束
+        exclude = ['default_user']
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 只返回fields中指定的字段
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def validate(self, attrs):
+        """校验省份、城市、区县是否为地区表中的上下级关系，地区表为空时不校验"""
+        tree = self.context.get('regions')
+        if tree is None:
+            tree = get_tree()
+        if len(tree) and {'province', 'city', 'county'} & set(attrs):
+            names = [attrs.get(name, getattr(self.instance, name, None)) for name in ('province', 'city', 'county')]
+            if tree.match_path(names) is None:
+                raise serializers.ValidationError({'error': '省市区信息有误'})
+        return attrs
+
+
+# 查询接口使用的读取计划，输出和对应的序列化器相同
+user_plan = ReadPlan(UserSerializer)
+addr_plan = ReadPlan(AddrSerializer)
+
+
+class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """登录获取token的序列化器，在token中加入权限校验需要的声明"""
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['is_superuser'] = user.is_superuser
+        return token
@@ -1,3 +1,1255 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import json
+import os
+import runpy
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.handlers.asgi import ASGIHandler
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import (AsyncClient, AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings, skipUnlessDBFeature)
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from common import bench, hashers, idempotency, router, warmup
+from common.files import FILE_SERVE_SETTINGS, serve_file, stat_cache
+from common.metrics import METRICS_SETTINGS, MetricsMiddleware, metrics_view
+from common.renderers import ORJSONParser, ORJSONRenderer
+from common.sms import ConsoleSmsSender
+from common.throttling import LoginIdentifierThrottle, LoginIPThrottle, SlidingWindowThrottle
+from common.token_auth import AUTH_USER_FIELDS, USER_CACHE_SETTINGS, local_users, user_cache_key
+from hyy_python import settings as project_settings
+from users import async_views, verifcode
+from users.avatar import AVATAR_SETTINGS, generate_variants
+from users.management.commands.bench_api import compare
+from users.models import Addr, Area, User
+from users.regions import RegionTree, get_tree, regions_changed
+from users.serializers import AddrSerializer, UserSerializer, addr_plan, user_plan
+from users.views import AddrPagination
+
+
+def auth_header(user):
+    return {'HTTP_AUTHORIZATION': 'Bearer %s' % RefreshToken.for_user(user).access_token}
+
+
+class CacheMixin:
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        local_users.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(local_users.clear)
+
+
+class AuthCacheTests(CacheMixin, TestCase):
+    """认证时缓存的用户在批量修改后失效"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth_cache', password='secret123')
+
+    def test_bulk_update_invalidates_cached_user(self):
+        headers = auth_header(self.user)
+        self.assertEqual(self.client.get('/user/address', **headers).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/user/address', **headers).status_code, 401)
+
+    def test_bulk_update_of_objects_invalidates_cached_user(self):
+        headers = auth_header(self.user)
+        self.assertEqual(self.client.get('/user/address', **headers).status_code, 200)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.bulk_update([self.user], ['is_active'])
+        self.assertEqual(self.client.get('/user/address', **headers).status_code, 401)
+
+    def test_soft_delete_invalidates_cached_user(self):
+        headers = auth_header(self.user)
+        self.assertEqual(self.client.get('/user/address', **headers).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).soft_delete()
+        self.assertEqual(self.client.get('/user/address', **headers).status_code, 401)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.all_objects.filter(pk=self.user.pk).restore()
+        self.assertEqual(self.client.get('/user/address', **headers).status_code, 200)
+
+
+    def test_shared_cache_holds_only_auth_fields(self):
+        headers = auth_header(self.user)
+        self.assertEqual(self.client.get('/user/address', **headers).status_code, 200)
+        data = cache.get(user_cache_key(self.user.pk))
+        self.assertEqual(set(data), set(AUTH_USER_FIELDS))
+        self.assertNotIn(self.user.password, map(str, data.values()))
+        # 缓存命中时构建的用户同样能通过权限判断：普通用户不能查看其他用户
+        other = User.objects.create_user(username='auth_cache_other', password='secret123')
+        self.assertEqual(self.client.get('/user/user/%s' % self.user.pk, **headers).status_code, 200)
+        self.assertEqual(self.client.get('/user/user/%s' % other.pk, **headers).status_code, 403)
+
+    def disable_in_other_process(self):
+        # 其他进程禁用用户：清除了共享缓存，当前进程的进程内缓存不受影响
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        cache.delete(user_cache_key(self.user.pk))
+
+    def test_local_cache_keeps_disabled_user_until_timeout(self):
+        headers = auth_header(self.user)
+        self.assertEqual(self.client.get('/user/address', **headers).status_code, 200)
+        self.disable_in_other_process()
+        self.assertEqual(self.client.get('/user/address', **headers).status_code, 200)
+        local_users.clear()
+        self.assertEqual(self.client.get('/user/address', **headers).status_code, 401)
+
+    def test_without_local_cache(self):
+        headers = auth_header(self.user)
+        with mock.patch.dict(USER_CACHE_SETTINGS, LOCAL_TIMEOUT=0):
+            self.assertEqual(self.client.get('/user/address', **headers).status_code, 200)
+            self.disable_in_other_process()
+            self.assertEqual(self.client.get('/user/address', **headers).status_code, 401)
+        self.assertEqual(len(local_users), 0)
+
+
+class LoginThrottleTests(CacheMixin, TestCase):
+    """模拟撞库：大量登录请求被限流拦截，伪造X-Forwarded-For不能绕过按IP的限流"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='throttle', password='secret123')
+
+    def setUp(self):
+        super().setUp()
+        # 固定当前时间，所有请求都落在同一个窗口内，不会因为跨过窗口边界而改变计数
+        patcher = mock.patch.object(SlidingWindowThrottle, 'timer', return_value=1000.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def attack(self, count, make_attempt):
+        statuses = []
+        for i in range(count):
+            ip, username, extra = make_attempt(i)
+            response = self.client.post('/user/login', {'username': username, 'password': 'wrong-password'},
+                                        content_type='application/json', REMOTE_ADDR=ip, **extra)
+            statuses.append(response.status_code)
+        return statuses
+
+    def test_one_ip_many_accounts(self):
+        statuses = self.attack(40, lambda i: ('10.0.0.1', 'victim%d' % i, {}))
+        self.assertEqual(statuses.count(429), 10)
+        self.assertEqual(statuses[-1], 429)
+
+    def test_spoofed_forwarded_for(self):
+        statuses = self.attack(40, lambda i: ('10.0.0.1', 'victim%d' % i, {'HTTP_X_FORWARDED_FOR': '192.0.2.%d' % i}))
+        self.assertEqual(statuses.count(429), 10)
+
+    def test_forwarded_for_behind_proxy(self):
+        rest_framework = {**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            # 代理之后REMOTE_ADDR相同，按代理添加的客户端IP分别计数
+            statuses = self.attack(40, lambda i: ('10.0.0.1', 'victim%d' % i,
+                                                  {'HTTP_X_FORWARDED_FOR': '1.1.1.1, 192.0.2.%d' % (i % 2)}))
+        self.assertEqual(statuses.count(429), 0)
+
+    def test_many_ips_one_account(self):
+        statuses = self.attack(40, lambda i: ('10.0.%d.%d' % (i // 256, i % 256), 'throttle', {}))
+        self.assertEqual(statuses.count(429), 30)
+        # 被限流的请求不会校验密码
+        self.assertEqual(statuses[:10], [400] * 10)
+
+    def test_ten_thousand_concurrent_attempts(self):
+        # 20个线程从不同IP同时对同一账号尝试一万次登录，通过的次数恰好等于限额；
+        # 直接调用限流类，不经过视图，完整请求的规模测试见bench_throttle命令
+        threads, attempts = 20, 10000
+        allowed = []
+        barrier = threading.Barrier(threads, timeout=30)
+        local = threading.local()
+
+        class SameMoment:
+            """每个线程第一次读取计数后等待其他线程也读取完，先读取再计数的实现会让这些请求全部通过"""
+            def __getattr__(self, name):
+                attr = getattr(cache, name)
+                if name not in ('get', 'get_many') or hasattr(local, 'waited'):
+                    return attr
+
+                def read(*args, **kwargs):
+                    local.waited = True
+                    result = attr(*args, **kwargs)
+                    barrier.wait()
+                    return result
+                return read
+
+        def worker(n):
+            count = 0
+            for i in range(n, attempts, threads):
+                request = SimpleNamespace(data={'username': 'throttle'},
+                                          META={'REMOTE_ADDR': '10.%d.%d.%d' % (i >> 16, i >> 8 & 255, i & 255)})
+                count += LoginIdentifierThrottle().allow_request(request, None)
+            allowed.append(count)
+
+        with mock.patch.object(SlidingWindowThrottle, 'cache', SameMoment()):
+            workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+        self.assertEqual(sum(allowed), 10)
+
+
+class VerifCodeTests(CacheMixin, TestCase):
+    mobile = '13900000000'
+
+    def setUp(self):
+        super().setUp()
+        self.code = verifcode.send_code(self.mobile)
+        self.wrong = '%06d' % ((int(self.code) + 1) % 1000000)
+
+    def test_attempts_are_limited(self):
+        for _ in range(verifcode.VERIFCODE_SETTINGS['MAX_ATTEMPTS'] - 1):
+            self.assertFalse(verifcode.check_code(self.mobile, self.wrong))
+        self.assertTrue(verifcode.check_code(self.mobile, self.code))
+        self.assertFalse(verifcode.check_code(self.mobile, self.code))
+
+    def test_concurrent_wrong_attempts(self):
+        barrier = threading.Barrier(20)
+
+        def worker():
+            barrier.wait()
+            verifcode.check_code(self.mobile, self.wrong)
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # 并发的错误校验不会互相覆盖计数，验证码已经作废
+        self.assertGreaterEqual(cache.get(verifcode.attempts_key(self.mobile)),
+                                verifcode.VERIFCODE_SETTINGS['MAX_ATTEMPTS'])
+        self.assertFalse(verifcode.check_code(self.mobile, self.code))
+
+    def test_concurrent_correct_attempts(self):
+        barrier = threading.Barrier(4)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(verifcode.check_code(self.mobile, self.code))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(results), [False, False, False, True])
+
+    def test_new_code_resets_attempts(self):
+        for _ in range(verifcode.VERIFCODE_SETTINGS['MAX_ATTEMPTS']):
+            self.assertFalse(verifcode.check_code(self.mobile, self.wrong))
+        cache.delete('verifcode:sent:%s' % self.mobile)
+        code = verifcode.send_code(self.mobile)
+        self.assertTrue(verifcode.check_code(self.mobile, code))
+
+    def test_console_sender_logs_at_debug(self):
+        with self.assertLogs('common.sms', 'DEBUG') as logs:
+            ConsoleSmsSender().send(self.mobile, '您的验证码为123456')
+        self.assertEqual([record.levelname for record in logs.records], ['DEBUG'])
+
+
+class EmailUniqueTests(TestCase):
+    """非空邮箱唯一，空邮箱在数据库中为NULL，多个没有邮箱的用户不冲突"""
+
+    def test_blank_emails_are_stored_as_null(self):
+        first = User.objects.create_user(username='no_email_1')
+        User.objects.create_user(username='no_email_2', email='')
+        self.assertEqual(User.objects.filter(email__isnull=True).count(), 2)
+        first.refresh_from_db()
+        self.assertEqual(first.email, '')
+        self.assertEqual(self.client.get('/user/user/%d' % first.pk, **auth_header(first)).json()['email'], '')
+
+    def test_duplicate_email(self):
+        User.objects.create_user(username='email_1', email='same@example.com')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(username='email_2', email='same@example.com')
+        data = {'username': 'email_3', 'email': 'same@example.com', 'password': 'secret123',
+                'password_confirmation': 'secret123'}
+        response = self.client.post('/user/register', data, content_type='application/json')
+        self.assertEqual(response.status_code, 422)
+
+
+class MigrationConflictTests(TransactionTestCase):
+    """MySQL忽略部分唯一索引时遗留的重复数据：迁移终止并列出冲突，不修改这些数据"""
+
+    def migrate_to(self, name):
+        call_command('migrate', 'users', name, verbosity=0)
+        return MigrationExecutor(connection).loader.project_state(('users', name)).apps
+
+    def without_constraint(self, apps, model_name, name):
+        """删除部分唯一索引，模拟MySQL中没有创建该索引的数据库；返回恢复索引的函数"""
+        model = apps.get_model('users', model_name)
+        constraint = next(c for c in model._meta.constraints if c.name == name)
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(model, constraint)
+
+        def restore():
+            with connection.schema_editor() as editor:
+                editor.add_constraint(model, constraint)
+        return model, restore
+
+    def setUp(self):
+        self.addCleanup(call_command, 'migrate', 'users', verbosity=0)
+
+    def test_duplicate_emails(self):
+        apps = self.migrate_to('0009_user_soft_delete_managers')
+        HistoricalUser, restore = self.without_constraint(apps, 'User', 'uniq_users_email')
+        users = HistoricalUser._base_manager
+        first, second = [users.create(username='dup_%d' % i, email='dup@example.com', password='') for i in range(2)]
+        users.create(username='single', email='single@example.com', password='')
+        users.create(username='blank', email='', password='')
+        with self.assertRaisesMessage(IntegrityError, 'dup@example.com: %d, %d' % (first.pk, second.pk)):
+            call_command('migrate', 'users', '0010_users_email_unique_null', verbosity=0)
+        self.assertEqual(users.filter(email='dup@example.com').count(), 2)
+        # 运维人员处理冲突后迁移成功
+        second.delete()
+        restore()
+        self.migrate_to('0010_users_email_unique_null')
+        self.assertEqual(User.objects.get(username='dup_0').email, 'dup@example.com')
+        self.assertTrue(User.objects.filter(username='blank', email__isnull=True).exists())
+
+    def test_duplicate_default_addrs(self):
+        apps = self.migrate_to('0010_users_email_unique_null')
+        HistoricalAddr, restore = self.without_constraint(apps, 'Addr', 'uniq_addr_user_default')
+        HistoricalUser = apps.get_model('users', 'User')
+        first_user, second_user = [HistoricalUser._base_manager.create(username='addr_%d' % i, password='')
+                                   for i in range(2)]
+        fields = {'phone': '13800000000', 'name': '张三', 'province': '广东省', 'city': '深圳市', 'county': '南山区',
+                  'address': '地址'}
+        first, second, third = [HistoricalAddr.objects.create(user=first_user, is_default=True, **fields)
+                                for _ in range(3)]
+        other = HistoricalAddr.objects.create(user=second_user, is_default=True, **fields)
+        with self.assertRaisesMessage(IntegrityError, '%d: %d, %d, %d' % (first_user.pk, first.pk, second.pk,
+                                                                           third.pk)):
+            call_command('migrate', 'users', '0011_addr_default_user', verbosity=0)
+        self.assertEqual(HistoricalAddr.objects.filter(is_default=True).count(), 4)
+        # 运维人员处理冲突后迁移成功
+        HistoricalAddr.objects.filter(pk__in=[first.pk, second.pk]).update(is_default=False)
+        restore()
+        self.migrate_to('0011_addr_default_user')
+        self.assertEqual(dict(Addr.objects.exclude(default_user=None).values_list('id', 'default_user')),
+                         {third.pk: first_user.pk, other.pk: second_user.pk})
+
+
+def create_addrs(user, count, default=None):
+    return Addr.objects.bulk_create([
+        Addr(user=user, phone='13800000000', name='张三', province='广东省', city='深圳市', county='南山区',
+             address='地址%d' % i, is_default=i == default)
+        for i in range(count)
+    ])
+
+
+class DefaultAddrTests(TestCase):
+    """每个用户最多只有一个默认地址，由default_user的唯一索引保证"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='default_addr', password='secret123')
+
+    def assertDefault(self, addr_id):
+        rows = list(Addr.objects.filter(user=self.user).exclude(default_user=None).values_list('id', 'is_default'))
+        self.assertEqual(rows, [] if addr_id is None else [(addr_id, True)])
+        self.assertEqual(Addr.objects.filter(user=self.user, is_default=True).count(), 0 if addr_id is None else 1)
+
+    def test_second_default_is_rejected(self):
+        create_addrs(self.user, 2, default=0)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            create_addrs(self.user, 1, default=0)
+
+    def test_switch_default(self):
+        first, second = Addr.objects.filter(pk__in=[addr.pk for addr in create_addrs(self.user, 2, default=0)])
+        self.assertDefault(first.pk)
+        response = self.client.put('/user/address/%d/default' % second.pk, **auth_header(self.user))
+        self.assertEqual(response.status_code, 200)
+        self.assertDefault(second.pk)
+        second.is_default = False
+        Addr.objects.bulk_update([second], ['is_default'])
+        self.assertDefault(None)
+        first.is_default = True
+        first.save(update_fields=['is_default'])
+        self.assertDefault(first.pk)
+
+    def test_api_create_and_update(self):
+        data = {'user': self.user.pk, 'phone': '13800000000', 'name': '张三', 'province': '广东省', 'city': '深圳市',
+                'county': '南山区', 'address': '地址', 'is_default': True}
+        headers = auth_header(self.user)
+        first = self.client.post('/user/address', data, content_type='application/json', **headers).json()
+        response = self.client.post('/user/address', data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, 201, response.content)
+        second = response.json()
+        self.assertNotIn('default_user', second)
+        self.assertDefault(second['id'])
+        response = self.client.put('/user/address/%d' % first['id'], data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertDefault(first['id'])
+
+    def test_switch_default_locks_user_before_updating(self):
+        first, second = create_addrs(self.user, 2, default=0)
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            Addr.switch_default(self.user.pk, second.pk)
+        self.assertDefault(second.pk)
+        # 先锁定用户行，再取消原默认地址，最后设置新的默认地址；任何时刻都不会有两个默认地址
+        sql = [query['sql'] for query in queries.captured_queries if not query['sql'].startswith('SAVEPOINT')
+               and not query['sql'].startswith('RELEASE')]
+        self.assertEqual(len(sql), 3, sql)
+        self.assertTrue(sql[0].startswith('SELECT') and '"users"' in sql[0], sql[0])
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', sql[0])
+        self.assertTrue(sql[1].startswith('UPDATE "addr"') and '"default_user" = NULL' in sql[1], sql[1])
+        self.assertTrue(sql[2].startswith('UPDATE "addr"') and '"default_user" = "addr"."user_id"' in sql[2], sql[2])
+        # 绕过switch_default直接设置第二个默认地址时违反唯一约束
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Addr.objects.filter(pk=first.pk).update(is_default=True)
+
+
+class AddrPaginationTests(CacheMixin, TestCase):
+    """收货地址列表的键集分页和只查询部分字段、只查询默认地址的快速路径"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='addr_page', password='secret123')
+        # 除默认地址外，其余地址的is_default都相同，按id区分先后
+        cls.addrs = create_addrs(cls.user, 7, default=3)
+        create_addrs(User.objects.create_user(username='addr_page_other'), 2, default=0)
+
+    def get(self, params):
+        return self.client.get('/user/address', params, **auth_header(self.user))
+
+    def cursor(self, position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def test_cursor_round_trip(self):
+        paginator = AddrPagination()
+        paginator.current_ordering = AddrPagination.ordering
+        request = Request(RequestFactory().get('/user/address', {'cursor': paginator.encode_cursor([True, 12])}))
+        self.assertEqual(paginator.decode_cursor(request), [True, 12])
+        self.assertIsNone(paginator.decode_cursor(Request(RequestFactory().get('/user/address'))))
+
+    def test_pages_follow_ordering_without_gaps(self):
+        ids = [addr.pk for addr in self.addrs]
+        expected = [ids[3]] + sorted(set(ids) - {ids[3]}, reverse=True)
+        seen, params = [], {'page_size': 3}
+        while True:
+            response = self.get(params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data['results']), 3)
+            seen += [row['id'] for row in data['results']]
+            if data['next'] is None:
+                break
+            params = {'page_size': 3, 'cursor': parse_qs(urlsplit(data['next']).query)['cursor'][0]}
+        self.assertEqual(seen, expected)
+
+    def test_without_pagination_params(self):
+        data = self.get({}).json()
+        self.assertEqual(len(data), 7)
+        self.assertTrue(data[0]['is_default'])
+
+    def test_invalid_cursor(self):
+        for cursor in ['不是游标', 'bm90IGpzb24', self.cursor({'id': 1}), self.cursor([1]), self.cursor([True, 'abc'])]:
+            response = self.get({'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+            self.assertEqual(response.json(), {'detail': AddrPagination.invalid_cursor_message})
+
+    def test_default_fast_path(self):
+        # 第一次请求缓存认证的用户
+        self.get({'default': '1'})
+        with self.assertNumQueries(1):
+            response = self.get({'default': '1', 'fields': 'id,name'})
+        self.assertEqual(response.json(), {'id': self.addrs[3].pk, 'name': '张三'})
+        self.assertEqual(self.get({'default': '1'}).json()['id'], self.addrs[3].pk)
+        Addr.objects.filter(user=self.user).update(is_default=False)
+        response = self.get({'default': '1'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': "没有设置默认收货地址"})
+
+    def test_fields_fast_path(self):
+        response = self.get({'fields': 'id,address', 'page_size': 2})
+        self.assertEqual(response.json()['results'], [{'id': self.addrs[3].pk, 'address': '地址3'},
+                                                      {'id': self.addrs[6].pk, 'address': '地址6'}])
+        self.assertEqual(set(self.get({'fields': 'city'}).json()[0]), {'city'})
+        response = self.get({'fields': 'id,password'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json(), {'error': 'fields参数有误'})
+
+
+class RegionTests(CacheMixin, TestCase):
+    """内存中的地区树、地区查询接口的ETag和收货地址的省市区校验"""
+
+    def setUp(self):
+        super().setUp()
+        guangdong = Area.objects.create(name='广东省', level='province')
+        shenzhen = Area.objects.create(pid=guangdong, name='深圳市', level='city')
+        self.nanshan = Area.objects.create(pid=shenzhen, name='南山区', level='county')
+        beijing = Area.objects.create(name='北京市', level='province')
+        Area.objects.create(pid=Area.objects.create(pid=beijing, name='北京市', level='city'), name='东城区',
+                            level='county')
+        self.path = [guangdong.id, shenzhen.id, self.nanshan.id]
+        # 测试数据在回滚后不存在，清除进程内的地区树
+        self.addCleanup(regions_changed, sender=Area)
+
+    def test_tree(self):
+        tree = get_tree()
+        self.assertEqual(len(tree), 6)
+        self.assertEqual([region.name for region in tree.get_children()], ['广东省', '北京市'])
+        self.assertEqual([region.name for region in tree.get_path(self.nanshan.id)], ['广东省', '深圳市', '南山区'])
+        self.assertEqual(tree.get_path(0), [])
+        self.assertEqual(tree.match_path(['广东省', '深圳市', '南山区']), self.nanshan.id)
+        # 同名的地区按上级区分
+        self.assertIsNotNone(tree.match_path(['北京市', '北京市', '东城区']))
+        self.assertIsNone(tree.match_path(['广东省', '北京市', '东城区']))
+        self.assertIsNone(tree.match_path(['深圳市']))
+        # ETag只取决于地区数据
+        self.assertEqual(RegionTree(reversed([tuple(region) for region in tree.nodes.values()])).etag, tree.etag)
+        Area.objects.filter(pk=self.nanshan.pk).update(name='福田区')
+        self.assertEqual(get_tree().etag, tree.etag)
+        regions_changed(sender=Area)
+        self.assertNotEqual(get_tree().etag, tree.etag)
+
+    def test_area_view(self):
+        response = self.client.get('/user/area')
+        self.assertEqual([row['name'] for row in response.json()], ['广东省', '北京市'])
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/user/area', {'pid': '0'}).json(), response.json())
+        response = self.client.get('/user/area', {'pid': self.path[0]})
+        self.assertEqual([row['name'] for row in response.json()], ['深圳市'])
+        response = self.client.get('/user/area', {'id': self.nanshan.id})
+        self.assertEqual([row['id'] for row in response.json()], self.path)
+        self.assertEqual(self.client.get('/user/area', {'id': 10 ** 6}).status_code, 404)
+        for params in ({'pid': 'abc'}, {'id': '1.5'}):
+            response = self.client.get('/user/area', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertEqual(response.json(), {'error': '%s参数有误' % next(iter(params))})
+
+        response = self.client.get('/user/area', {'pid': 'abc'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        # 修改地区后ETag改变，客户端的缓存失效
+        Area.objects.create(name='上海市', level='province')
+        response = self.client.get('/user/area', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_addr_serializer(self):
+        user = User.objects.create_user(username='region_addr')
+        data = {'user': user.pk, 'phone': '13800000000', 'name': '张三', 'province': '广东省', 'city': '深圳市',
+                'county': '南山区', 'address': '地址'}
+        self.assertTrue(AddrSerializer(data=data).is_valid())
+        serializer = AddrSerializer(data={**data, 'city': '北京市'})
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors, {'error': ['省市区信息有误']})
+        # 部分修改时和原地址中的其他字段一起校验
+        serializer = AddrSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        addr = serializer.save()
+        self.assertFalse(AddrSerializer(addr, data={'county': '东城区'}, partial=True).is_valid())
+        self.assertTrue(AddrSerializer(addr, data={'address': '新地址'}, partial=True).is_valid())
+        # 使用传入的地区树，地区表为空时不校验
+        serializer = AddrSerializer(data={**data, 'city': '北京市'}, context={'regions': RegionTree([])})
+        self.assertTrue(serializer.is_valid())
+
+
+class ReadPlanTests(TestCase):
+    """读取计划的输出和对应的序列化器完全相同（包括字段顺序）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username='plan_avatar', email='plan@example.com', avatar='avatars/a.png',
+                                              last_name='张'),
+                     User.objects.create_user(username='plan_plain')]
+        cls.addrs = create_addrs(cls.users[0], 2, default=1)
+
+    def assertSameOutput(self, represented, serialized):
+        self.assertEqual([list(item.items()) for item in represented],
+                         [list(item.items()) for item in serialized])
+
+    def test_user_plan(self):
+        queryset = User.objects.filter(pk__in=[user.pk for user in self.users]).order_by('id')
+        for request in (RequestFactory().get('/user/user/1'), None):
+            serialized = UserSerializer(queryset, many=True, context={'request': request}).data
+            self.assertSameOutput(user_plan.represent(user_plan.values(queryset), request), serialized)
+            self.assertSameOutput([user_plan.represent_instance(user, request) for user in queryset], serialized)
+        avatars = [row['avatar'] for row in user_plan.represent(user_plan.values(queryset), RequestFactory().get('/'))]
+        # 有请求时输出完整的url，没有头像时为None
+        self.assertEqual(avatars, ['http://testserver/file/image/avatars/a.png', None])
+
+    def test_addr_plan_and_select(self):
+        queryset = Addr.objects.filter(user=self.users[0]).order_by('-is_default', '-id')
+        self.assertSameOutput(addr_plan.represent(addr_plan.values(queryset)), AddrSerializer(queryset, many=True).data)
+        fields = ['user', 'is_default', 'id']
+        plan = addr_plan.select(fields)
+        self.assertIs(addr_plan.select(list(reversed(fields))), plan)
+        self.assertIs(addr_plan.select(None), addr_plan)
+        # 字段顺序和序列化器相同，分页需要的额外列不输出
+        rows = plan.values(queryset, 'is_default', 'id', 'user_id', named=True)
+        self.assertSameOutput(plan.represent(rows), AddrSerializer(queryset, many=True, fields=fields).data)
+        self.assertEqual(list(plan.represent_instance(self.addrs[0])), ['id', 'is_default', 'user'])
+
+
+class RendererTests(SimpleTestCase):
+    """orjson的渲染器和解析器与DRF自带的实现输出相同"""
+    data = {
+        'text': '中文\u2028换行\u2029段落"\\',
+        'price': Decimal('12.30'),
+        'time': datetime.datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+        'naive': datetime.datetime(2024, 1, 2, 3, 4, 5),
+        'date': datetime.date(2024, 1, 2),
+        'uuid': uuid.UUID(int=1),
+        'big': 2 ** 70,
+        'lazy': gettext_lazy('中文'),
+        'nested': [None, True, 1.5, {1: 'a'}],
+    }
+
+    def test_same_as_json_renderer(self):
+        for data in (self.data, {key: value for key, value in self.data.items() if key != 'big'}, [], None):
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        rendered = ORJSONRenderer().render(self.data)
+        self.assertIn(b'\\u2028', rendered)
+        self.assertNotIn('\u2028'.encode(), rendered)
+        # 需要缩进时使用DRF的实现
+        self.assertEqual(ORJSONRenderer().render(self.data, 'application/json; indent=2'),
+                         JSONRenderer().render(self.data, 'application/json; indent=2'))
+
+    def test_parser(self):
+        body = ORJSONRenderer().render({'name': '张三', 'ids': [1, 2]})
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"name":'))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentDefaultAddrTests(TransactionTestCase):
+    """并发切换默认地址时按用户行加锁串行执行（SQLite不支持行锁，只在MySQL/PostgreSQL中测试）"""
+
+    def test_concurrent_switch_keeps_one_default(self):
+        user = User.objects.create_user(username='concurrent_default')
+        addr_ids = [addr.pk for addr in Addr.objects.filter(pk__in=[a.pk for a in create_addrs(user, 10)])]
+        errors = []
+
+        def worker(offset):
+            try:
+                for i in range(20):
+                    with transaction.atomic():
+                        Addr.switch_default(user.pk, addr_ids[(offset + i) % len(addr_ids)])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        defaults = list(Addr.objects.filter(user=user, is_default=True).values_list('id', 'default_user'))
+        self.assertEqual(len(defaults), 1)
+        self.assertEqual(defaults[0][1], user.pk)
+        self.assertEqual(Addr.objects.filter(user=user).exclude(default_user=None).count(), 1)
+
+
+class MetricsAccessTests(SimpleTestCase):
+    """/metrics默认拒绝访问，只允许携带token或来自配置的内网地址的请求"""
+
+    def get(self, ip='203.0.113.5', **headers):
+        return metrics_view(RequestFactory().get('/metrics', REMOTE_ADDR=ip, **headers)).status_code
+
+    def test_denied_by_default(self):
+        with mock.patch.dict(METRICS_SETTINGS, TOKEN=None, ALLOWED_IPS=()):
+            self.assertEqual(self.get(), 403)
+            self.assertEqual(self.get('127.0.0.1'), 403)
+            self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer None'), 403)
+
+    def test_token(self):
+        with mock.patch.dict(METRICS_SETTINGS, TOKEN='secret', ALLOWED_IPS=()):
+            self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer secret'), 200)
+            self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer wrong'), 403)
+            self.assertEqual(self.get(), 403)
+
+    def test_allowed_ips(self):
+        with mock.patch.dict(METRICS_SETTINGS, TOKEN=None, ALLOWED_IPS=['10.0.0.0/8', '::1']):
+            self.assertEqual(self.get('10.1.2.3'), 200)
+            self.assertEqual(self.get('::1'), 200)
+            self.assertEqual(self.get('11.0.0.1'), 403)
+            # 伪造X-Forwarded-For不能绕过
+            self.assertEqual(self.get(HTTP_X_FORWARDED_FOR='10.1.2.3'), 403)
+
+
+class AsyncMiddlewareTests(CacheMixin, TestCase):
+    """ASGI下中间件以异步方式执行，不把异步视图退化为线程中的同步调用"""
+
+    async def test_metrics_middleware_is_async(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = MetricsMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get('/'))
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    def test_asgi_middleware_chain_is_not_adapted(self):
+        # 有同步中间件时Django会输出DEBUG日志：Asynchronous handler adapted for middleware ...
+        with override_settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_metrics_count_queries_of_async_requests(self):
+        user = await User.objects.acreate(username='async_metrics')
+        token = RefreshToken.for_user(user).access_token
+        response = await AsyncClient().get('/user/address', headers={'Authorization': 'Bearer %s' % token})
+        self.assertEqual(response.status_code, 200)
+        # 查询用户和收货地址
+        self.assertIn('db;desc="2 queries"', response['Server-Timing'])
+
+
+class Weak(PBKDF2PasswordHasher):
+    iterations = 1
+
+
+class AsyncViewTests(CacheMixin, TestCase):
+    """异步视图和同步视图的状态码、响应头和限流一致"""
+
+    def setUp(self):
+        super().setUp()
+        # 密码哈希在当前进程的线程池中计算，测试中不启动进程池
+        patcher = mock.patch.dict(hashers.HASHING_SETTINGS, OFFLOAD_WORKERS=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='async_view', password='secret123')
+        cls.other = User.objects.create_user(username='async_view_other', password='secret123')
+
+    def request(self, method, path, user=None, **extra):
+        if user is not None:
+            extra['headers'] = {'Authorization': auth_header(user)['HTTP_AUTHORIZATION']}
+        return getattr(AsyncRequestFactory(), method)(path, **extra)
+
+    def test_user_detail_status(self):
+        addr = create_addrs(self.other, 1)[0]
+        cases = [
+            (async_views.user_detail, '/user/user/%d', 'get', ((self.user.pk, 200), (self.other.pk, 403),
+                                                            (self.other.pk + 100, 404))),
+            (async_views.address_detail, '/user/address/%d', 'delete', ((addr.pk + 100, 404), (addr.pk, 403))),
+        ]
+        for view, path, method, expected in cases:
+            for pk, code in expected:
+                response = async_to_sync(view)(self.request(method, path % pk, self.user), pk)
+                self.assertEqual(response.status_code, code, path % pk)
+                sync_response = getattr(self.client, method)(path % pk, **auth_header(self.user))
+                self.assertEqual(sync_response.status_code, code, path % pk)
+                self.assertEqual(response.content, sync_response.content)
+
+    async def test_file_view_runs_in_thread(self):
+        loop_thread = threading.get_ident()
+        threads = []
+
+        def serve(request, name):
+            threads.append(threading.get_ident())
+            return None
+
+        with mock.patch('users.async_views.serve_media', serve):
+            response = await async_views.file_view(self.request('get', '/file/image/missing.png/'), 'missing.png')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], loop_thread)
+
+    async def test_not_authenticated(self):
+        response = await async_views.user_detail(self.request('get', '/user/user/1'), 1)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+    def test_idempotent_create(self):
+        data = {'phone': '13800000000', 'name': '张三', 'province': '广东省', 'city': '深圳市', 'county': '南山区',
+                'address': '地址'}
+        responses = []
+        for _ in range(2):
+            request = self.request('post', '/user/address', self.user, data=data, content_type='application/json')
+            request.META['HTTP_IDEMPOTENCY_KEY'] = 'async-create'
+            responses.append(async_to_sync(async_views.address)(request))
+        self.assertEqual([response.status_code for response in responses], [201, 201])
+        self.assertEqual(responses[0].content, responses[1].content)
+        self.assertEqual(responses[1]['Idempotent-Replayed'], 'true')
+        self.assertEqual(Addr.objects.filter(user=self.user).count(), 1)
+        # 同一个key用于其他参数时拒绝执行
+        request = self.request('post', '/user/address', self.user, data=dict(data, name='李四'),
+                               content_type='application/json')
+        request.META['HTTP_IDEMPOTENCY_KEY'] = 'async-create'
+        self.assertEqual(async_to_sync(async_views.address)(request).status_code, 422)
+
+    def post(self, view, path, data):
+        request = self.request('post', path, data=data, content_type='application/json')
+        return async_to_sync(view)(request)
+
+    def test_login(self):
+        for data in ({'username': 'async_view', 'password': 'secret123'},
+                     {'username': 'async_view', 'password': 'wrong-password'},
+                     {'username': 'missing', 'password': 'secret123'},
+                     {'username': 'async_view'}):
+            response = self.post(async_views.login, '/user/login', data)
+            sync_response = self.client.post('/user/login', data, content_type='application/json')
+            self.assertEqual(response.status_code, sync_response.status_code, data)
+            if response.status_code == 200:
+                self.assertEqual(list(response.data), list(sync_response.json()))
+                self.assertEqual(response.data['id'], self.user.pk)
+            else:
+                self.assertEqual(response.content, sync_response.content)
+
+    def test_login_rehashes_outdated_password(self):
+        self.user.password = make_password('secret123', hasher=Weak())
+        self.user.save(update_fields=['password'])
+        response = self.post(async_views.login, '/user/login', {'username': 'async_view', 'password': 'secret123'})
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.password.startswith('pbkdf2_sha256$1$'))
+        self.assertTrue(self.user.check_password('secret123'))
+
+    def test_register(self):
+        data = {'username': 'async_register', 'email': 'async_register@example.com', 'password': 'secret123',
+                'password_confirmation': 'secret123'}
+        response = self.post(async_views.register, '/user/register', data)
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(username='async_register')
+        self.assertEqual(response.data, {'username': 'async_register', 'id': user.pk, 'email': user.email})
+        self.assertTrue(user.check_password('secret123'))
+        for data in (data, dict(data, password_confirmation='other123')):
+            response = self.post(async_views.register, '/user/register', data)
+            sync_response = self.client.post('/user/register', data, content_type='application/json')
+            self.assertEqual(response.status_code, 422)
+            self.assertEqual(response.content, sync_response.content)
+
+    async def test_throttles(self):
+        @async_views.async_api(['POST'], authenticated=False, throttle_classes=[LoginIPThrottle])
+        async def view(request):
+            return async_views.json_response({})
+
+        rates = {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'login_ip': '2/min'}
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}):
+            statuses = []
+            for _ in range(3):
+                response = await view(self.request('post', '/user/login', data={}, content_type='application/json'))
+                statuses.append(response.status_code)
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertIn('Retry-After', response)
+
+
+class FileServeTests(SimpleTestCase):
+    """上传文件的下载：路径检查、条件请求、Range和转发给web服务器"""
+    content = b'0123456789'
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(self.root, 'sub dir'))
+        for name in ('a.txt', os.path.join('sub dir', 'b c.txt')):
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(self.content)
+        with open(os.path.join(os.path.dirname(self.root), 'outside.txt'), 'wb'):
+            pass
+        self.addCleanup(os.remove, os.path.join(os.path.dirname(self.root), 'outside.txt'))
+        stat_cache.clear()
+        self.addCleanup(stat_cache.clear)
+        self.factory = RequestFactory()
+
+    def get(self, name='a.txt', **headers):
+        return serve_file(self.factory.get('/', **headers), self.root, name)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_rejects_paths_outside_root(self):
+        for name in ('../outside.txt', '/etc/passwd', 'sub dir/../../outside.txt', 'sub dir', 'missing.txt'):
+            self.assertIsNone(self.get(name), name)
+
+    def test_full_file_and_validators(self):
+        response = self.get()
+        self.assertEqual((response.status_code, self.body(response)), (200, self.content))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['Cache-Control'].startswith('public, max-age='))
+        self.assertEqual(response['Last-Modified'],
+                         http_date(int(os.stat(os.path.join(self.root, 'a.txt')).st_mtime)))
+
+    def test_if_none_match(self):
+        etag = self.get()['ETag']
+        for value in (etag, 'W/' + etag, '"other", ' + etag, '*'):
+            response = self.get(HTTP_IF_NONE_MATCH=value)
+            self.assertEqual(response.status_code, 304, value)
+            self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        # 同时携带两个请求头时只使用If-None-Match
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"', HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+                         .status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.get()['Last-Modified']
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=http_date(time.time() - 3600)).status_code, 200)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE='invalid date').status_code, 200)
+
+    def test_ranges(self):
+        for header, start, end in (('bytes=2-5', 2, 5), ('bytes=7-', 7, 9), ('bytes=-3', 7, 9), ('bytes=8-100', 8, 9)):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(self.body(response), self.content[start:end + 1])
+            self.assertEqual(response['Content-Range'], 'bytes %d-%d/10' % (start, end))
+            self.assertEqual(response['Content-Length'], str(end - start + 1))
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=10-', 'bytes=5-2'):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_full_file_for_unsupported_ranges(self):
+        etag = self.get()['ETag']
+        # 多个范围、无法解析的范围、If-Range与当前文件不一致时返回完整文件
+        for headers in ({'HTTP_RANGE': 'bytes=0-1,3-4'}, {'HTTP_RANGE': 'bytes=a-b'}, {'HTTP_RANGE': 'items=0-1'},
+                        {'HTTP_RANGE': 'bytes=0-1', 'HTTP_IF_RANGE': '"old"'}):
+            response = self.get(**headers)
+            self.assertEqual((response.status_code, self.body(response)), (200, self.content), headers)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=etag).status_code, 206)
+
+    def test_offload_headers(self):
+        with mock.patch.dict(FILE_SERVE_SETTINGS, OFFLOAD='x-accel', ACCEL_PREFIX='/protected/image/'):
+            response = self.get(os.path.join('sub dir', 'b c.txt'))
+            self.assertEqual(response['X-Accel-Redirect'], '/protected/image/sub%20dir/b%20c.txt')
+            self.assertNotIn('Content-Type', response)
+            self.assertEqual(response.content, b'')
+            self.assertIn('ETag', response)
+            # 条件请求仍由Django返回304
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=self.get()['ETag']).status_code, 304)
+        with mock.patch.dict(FILE_SERVE_SETTINGS, OFFLOAD='x-sendfile'):
+            response = self.get()
+            self.assertEqual(response['X-Sendfile'], os.path.join(self.root, 'a.txt'))
+            self.assertNotIn('X-Accel-Redirect', response)
+
+
+def image_bytes(fmt, size=(300, 200)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 80, 40)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class AvatarTests(CacheMixin, TestCase):
+    """头像上传后按内容保存，按尺寸和Accept返回缩略图，缩略图未生成时返回原图"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='avatar', password='secret123')
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.schedule = mock.patch('users.views.schedule_variants', return_value=True).start()
+        for patcher in (mock.patch('users.avatar.MEDIA_ROOT', self.directory),
+                        mock.patch('users.views.MEDIA_ROOT', self.directory)):
+            patcher.start()
+        self.addCleanup(mock.patch.stopall)
+        stat_cache.clear()
+        self.addCleanup(stat_cache.clear)
+
+    def upload(self, filename, content):
+        return self.client.post('/user/%d/avatar/upload' % self.user.pk,
+                                {'avatar': SimpleUploadedFile(filename, content)}, **auth_header(self.user))
+
+    def test_extension_from_decoded_format(self):
+        content = image_bytes('PNG')
+        response = self.upload('avatar.jpg', content)
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        name = self.user.avatar.name
+        self.assertRegex(name, r'^avatar_[0-9a-f]{64}\.png$')
+        self.assertIn(name, response.json()['url'])
+        self.schedule.assert_called_once_with(name)
+        # 相同内容的头像只保存一份
+        self.assertEqual(self.upload('other.gif', content).status_code, 200)
+        self.assertEqual(os.listdir(self.directory), [name])
+        self.assertEqual(self.upload('bad.png', b'not an image').status_code, 400)
+
+    def test_variants_and_fallback(self):
+        self.upload('avatar.png', image_bytes('PNG'))
+        self.user.refresh_from_db()
+        name = self.user.avatar.name
+        url = '/file/image/%s/' % name
+        # 缩略图还未生成：返回原图，不能被长时间缓存，并重新安排生成
+        self.schedule.reset_mock()
+        response = self.client.get(url, {'size': 64}, HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content)[:8], b'\x89PNG\r\n\x1a\n')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertIn('Accept', response['Vary'].split(', '))
+        self.schedule.assert_called_once_with(name)
+
+        generate_variants(name)
+        self.assertEqual(len(os.listdir(self.directory)), 1 + 2 * len(AVATAR_SETTINGS['SIZES']))
+        response = self.client.get(url, {'size': 100}, HTTP_ACCEPT='image/webp,*/*')
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as img:
+            self.assertEqual((img.format, max(img.size)), ('WEBP', 128))
+        self.assertTrue(response['Cache-Control'].startswith('public, max-age='))
+        self.assertIn('Accept', response['Vary'].split(', '))
+        response = self.client.get(url, {'size': 64})
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as img:
+            self.assertEqual((img.format, max(img.size)), ('JPEG', 64))
+        # 没有size参数时返回原图
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content)[:4], b'\x89PNG')
+        self.assertTrue(response['Cache-Control'].startswith('public, max-age='))
+
+
+class IdempotencyTests(CacheMixin, TestCase):
+    """Idempotency-Key：未登录的请求按客户端区分，上传文件按内容比较，处理中的请求直接返回409"""
+
+    def register(self, username, ip, key='register-key'):
+        data = {'username': username, 'email': '%s@example.com' % username, 'password': 'secret123',
+                'password_confirmation': 'secret123'}
+        return self.client.post('/user/register', data, content_type='application/json', REMOTE_ADDR=ip,
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_anonymous_requests_are_scoped_by_client(self):
+        first = self.register('idem_1', '10.0.0.1')
+        self.assertEqual(first.status_code, 201)
+        replayed = self.register('idem_1', '10.0.0.1')
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed.json(), first.json())
+        # 其他客户端使用相同的key不会得到或阻塞这个客户端的响应
+        other = self.register('idem_2', '10.0.0.2')
+        self.assertEqual(other.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', other)
+        self.assertEqual(User.objects.filter(username__startswith='idem_').count(), 2)
+
+    def test_uploaded_files_are_compared_by_content(self):
+        user = User.objects.create_user(username='idem_avatar', password='secret123')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for patcher in (mock.patch('users.avatar.MEDIA_ROOT', directory), mock.patch('users.views.MEDIA_ROOT', directory),
+                        mock.patch('users.views.schedule_variants', return_value=False)):
+            patcher.start()
+        self.addCleanup(mock.patch.stopall)
+        red, blue = (Image.new('RGB', (8, 8), color) for color in ('red', 'blue'))
+        uploads = []
+        for img in (red, red, blue):
+            buffer = io.BytesIO()
+            img.save(buffer, 'BMP')
+            uploads.append(buffer.getvalue())
+        self.assertEqual(len(uploads[0]), len(uploads[2]))
+
+        def upload(content):
+            return self.client.post('/user/%d/avatar/upload' % user.pk,
+                                    {'avatar': SimpleUploadedFile('avatar.bmp', content)},
+                                    HTTP_IDEMPOTENCY_KEY='avatar-key', **auth_header(user))
+        self.assertEqual(upload(uploads[0]).status_code, 200)
+        self.assertEqual(upload(uploads[1])['Idempotent-Replayed'], 'true')
+        # 文件名和大小相同、内容不同的文件不会重放之前的响应
+        self.assertEqual(upload(uploads[2]).status_code, 422)
+
+    def test_in_progress_request_returns_conflict_immediately(self):
+        request = RequestFactory().post('/user/register', REMOTE_ADDR='10.0.0.1')
+        request.user = AnonymousUser()
+        cache.add(idempotency.cache_keys(request, 'register-key')[1], 1, 30)
+        start = time.monotonic()
+        with mock.patch.dict(idempotency.IDEMPOTENCY_SETTINGS, WAIT=5):
+            response = self.register('idem_3', '10.0.0.1')
+        self.assertEqual(response.status_code, 409)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(User.objects.filter(username='idem_3').exists())
+        # 其他客户端不受影响
+        self.assertEqual(self.register('idem_3', '10.0.0.2').status_code, 201)
+
+
+class ReplicaRouterTests(CacheMixin, TransactionTestCase):
+    """
+    使用多个本地SQLite数据库测试读写分离：从库是单独的文件，只有用户数据、没有收货地址，
+    相当于复制延迟中的从库，从响应中能看出读操作使用的是哪个库
+    """
+    replicas = ('replica1', 'replica2')
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        databases = {'default': connections.settings['default']}
+        for alias in self.replicas + ('broken',):
+            databases[alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(directory, alias)}
+        databases['broken']['NAME'] = os.path.join(directory, 'missing', 'broken')
+        for alias in self.replicas + ('broken',):
+            connections.settings[alias] = connections.configure_settings(databases)[alias]
+            self.addCleanup(self.remove_alias, alias)
+
+        self.user = User.objects.create_user(username='router', password='secret123')
+        self.other = User.objects.create_user(username='router_other', password='secret123')
+        for alias in self.replicas:
+            with connections[alias].schema_editor() as editor:
+                editor.create_model(User)
+                editor.create_model(Addr)
+            User.objects.using(alias).bulk_create(User.objects.order_by('pk'))
+        self.addr = Addr.objects.create(user=self.user, phone='13800000000', name='张三', province='广东省',
+                                        city='深圳市', county='南山区', address='地址')
+
+        for patcher in (mock.patch.dict(router.ROUTER_SETTINGS, REPLICAS=list(self.replicas) + ['broken']),
+                        mock.patch.object(router, 'is_process_local', return_value=False),
+                        mock.patch.object(router, '_health', {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def remove_alias(alias):
+        connections[alias].close()
+        delattr(connections._connections, alias)
+        del connections.settings[alias]
+
+    def addr_count(self, client, user):
+        response = client.get('/user/address', **auth_header(user))
+        self.assertEqual(response.status_code, 200)
+        return len(response.json())
+
+    def test_reads_use_healthy_replicas(self):
+        # 从库中没有收货地址，不可用的从库不会被使用
+        for _ in range(10):
+            self.assertEqual(self.addr_count(self.client_class(), self.user), 0)
+        self.assertEqual(router._health['broken'][0], False)
+
+    def test_reads_are_pinned_after_write(self):
+        response = self.client.put('/user/address/%d/default' % self.addr.pk, **auth_header(self.user))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db_pin', response.cookies)
+        # 同一个客户端带有cookie，同一个用户在其他客户端中按缓存中的标记，都从主库读到刚写入的数据
+        self.assertEqual(self.addr_count(self.client, self.user), 1)
+        self.assertEqual(self.addr_count(self.client_class(), self.user), 1)
+        # 其他用户不受影响，仍然使用从库
+        self.assertEqual(self.addr_count(self.client_class(), self.other), 0)
+
+    def test_requires_shared_cache(self):
+        with mock.patch.object(router, 'is_process_local', return_value=True):
+            with self.assertRaises(ImproperlyConfigured):
+                router.PrimaryPinMiddleware(lambda request: None)
+
+
+class WarmupTests(CacheMixin, TestCase):
+    """启动预热：某一步失败时记录日志并继续启动，fork之前关闭数据库连接，可以通过HYY_WARMUP关闭"""
+
+    def setUp(self):
+        super().setUp()
+        # 测试进程中不冻结GC，也不关闭测试使用的数据库连接
+        self.calls = mock.Mock()
+        for name in ('connections.close_all', 'gc.collect', 'gc.freeze'):
+            patcher = mock.patch('common.warmup.%s' % name, getattr(self.calls, name.split('.')[-1]))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(regions_changed, sender=Area)
+        self.addCleanup(warmup.timings.clear)
+
+    def test_failing_step_is_logged(self):
+        with mock.patch('common.warmup.warm_jwt', side_effect=RuntimeError('jwt')), \
+                self.assertLogs('common.warmup') as logs:
+            timings = warmup.warm_up()
+        self.assertEqual(list(timings), ['urls', 'serializers', 'jwt', 'caches', 'requests', 'total'])
+        self.assertEqual(logs.records[0].getMessage(), '预热失败：jwt')
+        self.assertIsNotNone(logs.records[0].exc_info)
+        # 失败之后的步骤照常执行
+        self.assertTrue(user_plan.built and addr_plan.built)
+        self.assertIn('预热完成', logs.records[-1].getMessage())
+
+    def test_connections_closed_before_fork(self):
+        with mock.patch('common.warmup.warm_requests', self.calls.warm_requests), self.assertLogs('common.warmup'):
+            warmup.warm_up()
+        # 所有步骤完成后关闭连接，最后冻结GC
+        self.assertEqual([call[0] for call in self.calls.mock_calls],
+                         ['warm_requests', 'close_all', 'collect', 'freeze'])
+        self.calls.reset_mock()
+        with mock.patch.dict(warmup.WARMUP_SETTINGS, FREEZE_GC=False), self.assertLogs('common.warmup'):
+            warmup.warm_up()
+        self.assertEqual([call[0] for call in self.calls.mock_calls], ['close_all'])
+
+    def test_switch(self):
+        for value, enabled in (('0', False), ('1', True)):
+            with mock.patch.dict(os.environ, HYY_WARMUP=value):
+                self.assertIs(runpy.run_path(project_settings.__file__)['WARMUP']['ENABLED'], enabled)
+        with mock.patch.dict(warmup.WARMUP_SETTINGS, ENABLED=False), \
+                mock.patch('common.warmup.warm_urls') as warm_urls, \
+                mock.patch('django.db.backends.base.base.BaseDatabaseWrapper.ensure_connection') as connect:
+            self.assertEqual(warmup.warm_up(), {})
+            warmup.post_fork()
+        warm_urls.assert_not_called()
+        connect.assert_not_called()
+        self.assertEqual(self.calls.mock_calls, [])
+
+
+class BenchApiTests(CacheMixin, TestCase):
+    """性能测试命令可以在测试数据库上运行，其他数据库需要显式确认"""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # 上传的头像保存到临时目录，不在后台线程中生成缩略图
+        for patcher in (mock.patch('users.avatar.MEDIA_ROOT', self.directory),
+                        mock.patch('users.views.MEDIA_ROOT', self.directory),
+                        mock.patch('users.views.schedule_variants', return_value=False)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # 测试生成的地区在回滚后不存在，清除进程内的地区树
+        self.addCleanup(regions_changed, sender=Area)
+
+    def test_smoke(self):
+        output = os.path.join(self.directory, 'report.json')
+        call_command('bench_api', users=3, addrs=1, provinces=2, cities=2, counties=2, requests=3, threads=0,
+                     output=output, stdout=io.StringIO())
+        with open(output, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual(len(report['scenarios']), 17)
+        for name, phases in report['scenarios'].items():
+            self.assertEqual(phases['serial']['errors'], 0, name)
+
+    def test_refuses_non_test_database(self):
+        with mock.patch.object(bench, 'is_test_database', return_value=False):
+            with self.assertRaisesMessage(CommandError, '--allow-any-database'):
+                call_command('bench_api', users=1, requests=1, threads=0, stdout=io.StringIO())
+        self.assertFalse(User.objects.exists())
+
+    def test_compare(self):
+        def report(p95, rps, queries, errors=0):
+            return {'scenarios': {'login': {'serial': {'p95_ms': p95, 'throughput_rps': rps,
+                                                       'queries_per_request': queries, 'errors': errors}}}}
+
+        baseline = report(10.0, 100.0, 2.0)
+        self.assertEqual(compare(report(11.0, 95.0, 2.0), baseline, 0.2, 1.0), [])
+        # 亚毫秒的波动不算回退
+        self.assertEqual(compare(report(0.9, 1500.0, 2.0), report(0.3, 3000.0, 2.0), 0.2, 1.0), [])
+        regressions = compare(report(20.0, 40.0, 3.0, errors=1), baseline, 0.2, 1.0)
+        self.assertEqual(len(regressions), 4)
+        # 基准结果中没有的接口不比较
+        self.assertEqual(compare(report(20.0, 40.0, 3.0), {'scenarios': {}}, 0.2, 1.0), [])
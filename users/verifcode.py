@@ -0,0 +1,80 @@
+"""
+手机验证码：验证码保存在Django缓存中并自动过期，verifcode表只作为发送记录
+"""
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+
+from common.sms import get_sms_sender
+from users.models import VerifCode
+
+VERIFCODE_SETTINGS = {
+    # 验证码的有效时间（秒）
+    'TIMEOUT': 300,
+    # 同一手机号两次发送的最小间隔（秒）
+    'SEND_INTERVAL': 60,
+    # 每个验证码最多可以校验的次数，超过后作废
+    'MAX_ATTEMPTS': 5,
+    # verifcode表中的记录保留的天数
+    'KEEP_DAYS': 7,
+    **getattr(settings, 'VERIFCODE', {}),
+}
+
+
+class VerifCodeError(Exception):
+    pass
+
+
+def code_key(mobile):
+    return 'verifcode:code:%s' % mobile
+
+
+def attempts_key(mobile):
+    return 'verifcode:attempts:%s' % mobile
+
+
+def send_code(mobile):
+    """生成并发送验证码，距离上次发送不足SEND_INTERVAL秒时抛出VerifCodeError"""
+    # cache.add只在key不存在时成功，可以作为跨进程的发送频率限制
+    if not cache.add('verifcode:sent:%s' % mobile, 1, VERIFCODE_SETTINGS['SEND_INTERVAL']):
+        raise VerifCodeError('验证码发送过于频繁，请稍后再试')
+    code = '%06d' % secrets.randbelow(1000000)
+    item = {'code': code, 'expires': time.time() + VERIFCODE_SETTINGS['TIMEOUT']}
+    # 新的验证码重新计算校验次数
+    cache.set(attempts_key(mobile), 0, VERIFCODE_SETTINGS['TIMEOUT'])
+    cache.set(code_key(mobile), item, VERIFCODE_SETTINGS['TIMEOUT'])
+    VerifCode.objects.create(mobile=mobile, code=code)
+    get_sms_sender().send(mobile, '您的验证码为%s，%d分钟内有效。' % (code, VERIFCODE_SETTINGS['TIMEOUT'] // 60))
+    return code
+
+
+def check_code(mobile, code):
+    """
+    校验验证码，校验成功后验证码立即失效。
+    校验次数使用单独的计数器，在比较之前原子加一，并发的校验各自得到不同的次数，总次数不会超过MAX_ATTEMPTS
+    """
+    key = code_key(mobile)
+    item = cache.get(key)
+    if item is None or not code:
+        return False
+    counter = attempts_key(mobile)
+    # 计数器和验证码同时过期
+    cache.add(counter, 0, max(1, int(item['expires'] - time.time())))
+    try:
+        attempts = cache.incr(counter)
+    except ValueError:
+        # 计数器刚好过期
+        return False
+    if attempts > VERIFCODE_SETTINGS['MAX_ATTEMPTS']:
+        cache.delete(key)
+        return False
+    if constant_time_compare(item['code'], code):
+        # 只有删除成功的请求校验通过，并发使用同一个验证码时只有一个请求成功
+        return cache.delete(key)
+    # 校验次数用完后作废验证码，防止暴力猜测
+    if attempts >= VERIFCODE_SETTINGS['MAX_ATTEMPTS']:
+        cache.delete(key)
+    return False
@@ -1,7 +1,8 @@
-import os
 import re
 
-from django.http import FileResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.cache import patch_vary_headers
 from django.shortcuts import render
 from rest_framework import status, mixins
 from rest_framework.request import Request
@@ -11,14 +12,29 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 
+from common.authenticate import MOBILE_RE
+from common.files import serve_file
+from common.idempotency import idempotent
+from common.throttling import LoginIdentifierThrottle, LoginIPThrottle, RegisterIPThrottle, VerifCodeIPThrottle
+from common.pagination import KeysetPagination
 from hyy_python.settings import MEDIA_ROOT
+from users.avatar import pick_variant, schedule_variants, store_avatar
 from users.models import User, Addr
+from users.regions import get_tree
+from users.verifcode import VerifCodeError, check_code, send_code
 from .permissions import UserPermissions, AddrPermissions
-from .serializers import UserSerializer, AddrSerializer
+from .serializers import UserSerializer, AddrSerializer, MyTokenObtainPairSerializer, user_plan, addr_plan
 from rest_framework.permissions import IsAuthenticated
 
 
+# 邮箱格式的正则，模块加载时编译一次
+EMAIL_RE = re.compile(r'^[a-z0-9][\w.\-]*@[a-z0-9\-]+(\.[a-z]{2,5}){1,2}$')
+
+
 class RegisterView(APIView):
+    throttle_classes = [RegisterIPThrottle]
+
+    @idempotent
     def post(self, request):
         """用户注册"""
         # 1. 接收用户参数
@@ -27,28 +43,21 @@ class RegisterView(APIView):
         password = request.data.get('password')
         password_confirmation = request.data.get('password_confirmation')
 
-        # 2. 参数校验
-        # 2.1 校验参数是否为空
-        if not all([username, email, password, password_confirmation]):
-            return Response({'error': "所有参数不能为空"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
-        # 2.2 校验用户名是否为空
-        if User.objects.filter(username=username).exists():
-            return Response({'error': "用户名已存在"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
-        # 2.3 校验两次密码是否一致
-        if password != password_confirmation:
-            return Response({'error': "两次密码不一致"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
-        # 2.4 校验密码长度
-        if not (6 <= len(password) <= 18):
-            return Response({'error': "密码长度需要在6到18位之间"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
-        # 2.5 校验邮箱是否存在
-        if User.objects.filter(email=email).exists():
-            return Response({'error': "该邮箱已被其他用户使用"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
-        # 2.6 校验邮箱格式是否正确
-        if not re.match(r'^[a-z0-9][\w.\-]*@[a-z0-9\-]+(\.[a-z]{2,5}){1,2}$', email):
-            return Response({'error': "邮箱格式有误！"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
-
-        # 3. 创建用户
-        obj = User.objects.create_user(username=username, email=email, password=password)
+        # 2. 参数校验：先执行不需要查询数据库的校验
+        error = self.check_params(username, email, password, password_confirmation)
+        if error:
+            return Response({'error': error}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        # 3. 一次查询同时校验用户名和邮箱是否已被使用
+        error = self.check_unique(username, email)
+        if error:
+            return Response({'error': error}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        # 4. 创建用户，并发注册相同的用户名或邮箱时由数据库的唯一约束拦截
+        try:
+            with transaction.atomic():
+                obj = User.objects.create_user(username=username, email=email, password=password)
+        except IntegrityError:
+            return Response({'error': "用户名或邮箱已存在"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         res = {
             'username': username,
             'id': obj.id,
@@ -56,24 +65,62 @@ class RegisterView(APIView):
         }
         return Response(res, status=status.HTTP_201_CREATED)
 
+    @staticmethod
+    def check_params(username, email, password, password_confirmation):
+        """校验参数是否为空、两次密码是否一致、密码长度和邮箱格式"""
+        if not all([username, email, password, password_confirmation]):
+            return "所有参数不能为空"
+        if password != password_confirmation:
+            return "两次密码不一致"
+        if not (6 <= len(password) <= 18):
+            return "密码长度需要在6到18位之间"
+        if not EMAIL_RE.match(email):
+            return "邮箱格式有误！"
+        return None
+
+    @staticmethod
+    def used_accounts(username, email):
+        """使用了该用户名或邮箱的用户，异步视图中使用async for查询"""
+        return User.objects.filter(Q(username=username) | Q(email=email)).values_list('username', 'email')[:2]
+
+    @classmethod
+    def check_unique(cls, username, email, used=None):
+        """校验用户名和邮箱是否已被其他用户使用，used为已查询的used_accounts()"""
+        if used is None:
+            used = cls.used_accounts(username, email)
+        for used_username, used_email in used:
+            if used_username == username:
+                return "用户名已存在"
+            if used_email == email:
+                return "该邮箱已被其他用户使用"
+        return None
+
 
 # Create your views here.
 class LoginView(TokenObtainPairView):
     """"用户登录"""
+    serializer_class = MyTokenObtainPairSerializer
+    # 在校验账号密码之前限流
+    throttle_classes = [LoginIPThrottle, LoginIdentifierThrottle]
+
     def post(self, request: Request, *args, **kwargs) -> Response:
         serializer = self.get_serializer(data=request.data)
         try:
             serializer.is_valid(raise_exception=True)
         except TokenError as e:
             raise InvalidToken(e.args[0])
-        # 自定义登录成功之后返回的结果
-        result = serializer.validated_data
-        result['id'] = serializer.user.id
-        result['mobile'] = serializer.user.mobile
-        result['email'] = serializer.user.email
-        result['username'] = serializer.user.username
-        result['token'] = result.pop('access')
-        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+        return Response(login_result(serializer.user, serializer.validated_data), status=status.HTTP_200_OK)
+
+
+def login_result(user, tokens):
+    """自定义登录成功之后返回的结果，tokens中为refresh和access"""
+    result = dict(tokens)
+    result['id'] = user.id
+    result['mobile'] = user.mobile
+    result['email'] = user.email
+    result['username'] = user.username
+    result['token'] = result.pop('access')
+    return result
 
 
 class UserView(GenericViewSet, mixins.RetrieveModelMixin):
@@ -83,6 +130,11 @@ class UserView(GenericViewSet, mixins.RetrieveModelMixin):
     # 设置认证用户才能有权限访问
     permission_classes = [IsAuthenticated, UserPermissions]
 
+    def retrieve(self, request, *args, **kwargs):
+        # 权限校验需要模型对象，输出使用读取计划，不创建序列化器
+        return Response(user_plan.represent_instance(self.get_object(), request))
+
+    @idempotent
     def upload_avatar(self, request, *arg, **kwargs):
         """"上传用户头像"""
         avatar = request.data.get('avatar')
@@ -98,19 +150,48 @@ class UserView(GenericViewSet, mixins.RetrieveModelMixin):
         ser = self.get_serializer(user, data={"avatar": avatar}, partial=True)
         # 校验
         ser.is_valid(raise_exception=True)
-        ser.save()
-        return Response({'url': ser.data['avatar']})
+        # 按内容哈希保存原图，缩略图在后台生成，不阻塞当前请求
+        user.avatar = store_avatar(avatar)
+        user.save(update_fields=['avatar', 'updated_time'])
+        schedule_variants(user.avatar.name)
+        return Response({'url': self.get_serializer(user).data['avatar']})
+
+
+def serve_media(request, name):
+    """返回上传文件的响应，文件不存在时返回None"""
+    # 通过size参数获取头像的缩略图，缩略图还未生成时返回原图
+    variant = name
+    if request.GET.get('size'):
+        variant = pick_variant(name, request.GET['size'], request.META.get('HTTP_ACCEPT', ''))
+        response = serve_file(request, MEDIA_ROOT, variant)
+        if response is not None:
+            patch_vary_headers(response, ['Accept'])
+            return response
+    response = serve_file(request, MEDIA_ROOT, name)
+    if response is not None and variant != name:
+        # 缩略图缺失（如生成队列已满），重新安排生成；
+        # 返回的原图不能按缩略图的url被浏览器和CDN长时间缓存，每次使用前都要重新校验
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ['Accept'])
+        schedule_variants(name)
+    return response
 
 
 class FileView(APIView):
     """获取文件的视图"""
     def get(self, request, name):
-        path = MEDIA_ROOT / name
-        if os.path.isfile(path):
-            return FileResponse(open(path, 'rb'))
+        response = serve_media(request, name)
+        if response is not None:
+            return response
         return Response({'error': "没有找到该文件！"}, status=status.HTTP_404_NOT_FOUND)
 
 
+class AddrPagination(KeysetPagination):
+    """收货地址的分页，默认地址排在第一位，请求中带有cursor或page_size参数时才分页"""
+    ordering = ('-is_default', '-id')
+    always_paginate = False
+
+
 class AddrView(GenericViewSet, mixins.ListModelMixin, mixins.CreateModelMixin, mixins.DestroyModelMixin, mixins.UpdateModelMixin):
     """地址管理视图"""
     queryset = Addr.objects.all()
@@ -118,27 +199,126 @@ class AddrView(GenericViewSet, mixins.ListModelMixin, mixins.CreateModelMixin, m
     # 设置认证用户才能有权限访问
     permission_classes = [IsAuthenticated, AddrPermissions]
 
+    pagination_class = AddrPagination
+    # fields参数允许返回的字段
+    projection_fields = ('id', 'user', 'phone', 'name', 'province', 'city', 'county', 'address', 'is_default')
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        # 客户端重试时不会重复添加地址
+        return super().create(request, *args, **kwargs)
+
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
         # 通过请求过来的认证用户进行过滤
-        queryset = queryset.filter(user=request.user)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = queryset.filter(user_id=request.user.id)
+        # 通过fields参数只查询和返回需要的字段
+        fields = request.query_params.get('fields')
+        if fields:
+            fields = fields.split(',')
+            if not set(fields) <= set(self.projection_fields):
+                return Response({'error': 'fields参数有误'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        # 只读接口使用values_list()查询，不创建模型对象和序列化器
+        plan = addr_plan.select(fields)
+
+        # 只获取默认地址，走(user_id, is_default)索引查询一条数据
+        if request.query_params.get('default') == '1':
+            row = plan.values(queryset.filter(is_default=True)).first()
+            if row is None:
+                return Response({'error': "没有设置默认收货地址"}, status=status.HTTP_404_NOT_FOUND)
+            return Response(plan.represent_one(row))
+
+        queryset = queryset.order_by(*AddrPagination.ordering)
+        # 分页类通过属性获取排序字段的值
+        page = self.paginate_queryset(plan.values(queryset, 'is_default', 'id', named=True))
+        if page is not None:
+            return self.get_paginated_response(plan.represent(page))
+        return Response(plan.represent(plan.values(queryset)))
+
+    def perform_create(self, serializer):
+        if not serializer.validated_data.get('is_default'):
+            return serializer.save()
+        # 新增默认地址时，在同一个事务中取消原来的默认地址
+        with transaction.atomic():
+            Addr.switch_default(serializer.validated_data['user'].id, None)
+            serializer.save()
+
+    def perform_update(self, serializer):
+        if not serializer.validated_data.get('is_default'):
+            return serializer.save()
+        with transaction.atomic():
+            Addr.switch_default(serializer.instance.user_id, serializer.instance.id)
+            serializer.save()
 
     def set_default_addr(self, request, *args, **kwargs):
         """设置默认收货地址"""
         # 1.获取到要设置的地址对象
         obj = self.get_object()
-        # 2.将该地址设置默认收货地址，将用户的其他收货地址设置为非默认
-        obj.is_default = True
-        obj.save()
-        # 获取用户收货地址
-        queryset = self.get_queryset().filter(user=request.user)
-        for item in queryset:
-            if item != obj:
-                item.is_default = False
-                item.save()
+        # 2.在事务中将该地址设置默认收货地址，将用户的其他收货地址设置为非默认
+        with transaction.atomic():
+            Addr.switch_default(obj.user_id, obj.id)
         return Response({"message": "设置成功"}, status=status.HTTP_200_OK)
 
 
+class AreaView(APIView):
+    """省市区县地区查询，数据来自内存中的地区树"""
+    def get(self, request):
+        tree = get_tree()
+        # 地区数据未修改时返回304
+        if request.META.get('HTTP_IF_NONE_MATCH') == tree.etag:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        elif request.query_params.get('id'):
+            # 通过id获取地区的完整路径
+            region_id = self.parse_id(request.query_params['id'])
+            if region_id is False:
+                return Response({'error': "id参数有误"}, status=status.HTTP_400_BAD_REQUEST)
+            path = tree.get_path(region_id)
+            if not path:
+                return Response({'error': "没有找到该地区！"}, status=status.HTTP_404_NOT_FOUND)
+            response = Response([region._asdict() for region in path])
+        else:
+            # 通过pid获取下级地区，不传pid（或pid为0）时获取所有省份
+            pid = self.parse_id(request.query_params.get('pid'))
+            if pid is False:
+                return Response({'error': "pid参数有误"}, status=status.HTTP_400_BAD_REQUEST)
+            response = Response([region._asdict() for region in tree.get_children(pid)])
+        response['ETag'] = tree.etag
+        # 每次使用前都需要向服务器确认缓存是否有效
+        response['Cache-Control'] = 'no-cache'
+        return response
 
+    @staticmethod
+    def parse_id(value):
+        """解析地区id：为空或为0时返回None（顶级），不是整数时返回False"""
+        if not value:
+            return None
+        try:
+            return int(value) or None
+        except ValueError:
+            return False
+
+
+class VerifCodeView(APIView):
+    """手机验证码"""
+    throttle_classes = [VerifCodeIPThrottle]
+
+    def post(self, request):
+        """发送验证码"""
+        mobile = request.data.get('mobile')
+        if not mobile or not MOBILE_RE.match(mobile):
+            return Response({'error': "手机号格式有误！"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        try:
+            send_code(mobile)
+        except VerifCodeError as e:
+            return Response({'error': str(e)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        return Response({"message": "验证码已发送"}, status=status.HTTP_200_OK)
+
+
+class VerifCodeCheckView(APIView):
+    """校验手机验证码"""
+    throttle_classes = [VerifCodeIPThrottle]
+
+    def post(self, request):
+        if not check_code(request.data.get('mobile'), request.data.get('code')):
+            return Response({'error': "验证码错误或已过期"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response({"message": "验证成功"}, status=status.HTTP_200_OK)